@@ -1,21 +1,61 @@
 import logging
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 # Importar funções de carregamento dos modelos
-from script_shared.models.model_logged import load_model_logged
+from script_shared.models.model_logged import load_model_logged, consistencia_logged, fatores_item
 from script_shared.models.model_semianon import load_model_semianon
 from script_shared.models.model_anon import load_model_anon_heuristico
+from script_shared.models.model_similar import load_model_similar
+from script_shared.models.model_session import load_model_session
+from script_shared.models.trending import criar_motor_tendencias
+from script_shared.models.feature_store import criar_feature_store
 from script_shared import config
+from script_shared.artifacts import verificar_consistencia, hash_arquivo
 
 MODEL_DIR_LOGGED = config.MODEL_DIR_LOGGED
 USERS_LOGGED = config.USERS_LOGGED
 MODEL_DIR_SEMIANON = config.MODEL_DIR_SEMIANON
 MODEL_DIR_ANON_HEURISTICO = config.MODEL_DIR_ANON_HEURISTICO
+MODEL_DIR_SIMILAR = config.MODEL_DIR_SIMILAR
+MODEL_DIR_SESSION = config.MODEL_DIR_SESSION
+TRENDING_ENABLED = config.TRENDING_ENABLED
+TRENDING_PARAMS = config.TRENDING_PARAMS
+FEATURE_STORE_ENABLED = config.FEATURE_STORE_ENABLED
+FEATURE_STORE_PARAMS = config.FEATURE_STORE_PARAMS
 
 logger = logging.getLogger(__name__)
 
 
+def verificar_modelo_logged(model_logged: Dict[str, Any]) -> None:
+    """
+    Verifica, pelo manifesto do treino, se os mapeamentos (user_to_idx/item_to_idx), os
+    fatores do ALS e a matriz TF-IDF carregados correspondem entre si e se o histórico de
+    interações é o mesmo usado no treino.
+
+    Raises:
+        ValueError: Se mapeamentos e fatores estiverem inconsistentes.
+    """
+    model_als = model_logged["model_als"]
+    observado = consistencia_logged(
+        model_logged["aux_dict"],
+        model_als.user_factors,
+        fatores_item(model_logged),
+        model_logged["tfidf_matrix"],
+    )
+    divergencias = verificar_consistencia(MODEL_DIR_LOGGED, "logged", observado)
+    if divergencias:
+        raise ValueError(f"Artefatos do modelo logged inconsistentes: {divergencias}")
+
+    # Histórico diferente do usado no treino não impede a inferência (os vetores de usuário
+    # são recalculados a partir dele), mas indica que o modelo está defasado.
+    divergencias = verificar_consistencia(
+        MODEL_DIR_LOGGED, "logged", {"history_sha256": hash_arquivo(USERS_LOGGED)}
+    )
+    if divergencias:
+        logger.warning("Histórico de interações difere do usado no treino do modelo logged.")
+
+
 def load_all_models() -> Dict[str, Any]:
     """
     Carrega todos os modelos e artefatos (logged, semianon, anônimo) e retorna um dicionário com eles.
@@ -25,6 +65,9 @@ def load_all_models() -> Dict[str, Any]:
          - "logged": modelo e artefatos do usuário logado.
          - "semianon": modelo e artefatos do usuário semi-logado.
          - "anon": modelo e artefatos do usuário anônimo (heurístico).
+         - "session": tabela de co-visitação para anônimos com sessão (opcional).
+         - "trending": motor de tendências alimentado pelos eventos (None se desabilitado).
+         - "feature_store": features online dos semi-logados (None se desabilitada ou sem modelo semianon).
          - "df_users_logged": DataFrame com as interações dos usuários logados (necessário para a inferência do modelo logged).
     """
     models = {}
@@ -33,6 +76,7 @@ def load_all_models() -> Dict[str, Any]:
     try:
         df_users_logged = pd.read_parquet(USERS_LOGGED)
         models["logged"] = load_model_logged(MODEL_DIR_LOGGED)
+        verificar_modelo_logged(models["logged"])
         models["df_users_logged"] = df_users_logged
         logger.info("Modelo logged carregado com sucesso.")
     except Exception as e:
@@ -43,6 +87,16 @@ def load_all_models() -> Dict[str, Any]:
     # Carregar modelo semianon
     try:
         models["semianon"] = load_model_semianon(MODEL_DIR_SEMIANON)
+        divergencias = verificar_consistencia(
+            MODEL_DIR_SEMIANON,
+            "semianon",
+            {
+                "n_clusters": int(models["semianon"]["kmeans_model"].n_clusters),
+                "n_users": len(models["semianon"]["df_features"]),
+            },
+        )
+        if divergencias:
+            raise ValueError(f"Artefatos do modelo semianon inconsistentes: {divergencias}")
         logger.info("Modelo semianon carregado com sucesso.")
     except Exception as e:
         logger.error("Erro ao carregar modelo semianon.", exc_info=e)
@@ -56,4 +110,37 @@ def load_all_models() -> Dict[str, Any]:
         logger.error("Erro ao carregar modelo anônimo.", exc_info=e)
         models["anon"] = None
 
+    # Carregar modelo de sessão (opcional: sem ele, anônimos recebem o ranking heurístico)
+    try:
+        models["session"] = load_model_session(MODEL_DIR_SESSION)
+    except Exception as e:
+        logger.warning("Modelo de sessão não carregado; usando apenas o ranking heurístico.", exc_info=e)
+        models["session"] = None
+
+    # Motor de tendências (em memória, começa vazio e é alimentado por POST /events)
+    # Apenas páginas do catálogo do modelo anônimo são contadas
+    models["trending"] = None
+    if TRENDING_ENABLED:
+        catalogo = models["anon"]["catalogo"] if models["anon"] is not None else None
+        models["trending"] = criar_motor_tendencias(TRENDING_PARAMS, catalogo)
+
+    # Feature store online dos semi-logados (parte dos agregados e do modelo do treino)
+    models["feature_store"] = None
+    if FEATURE_STORE_ENABLED and models["semianon"] is not None:
+        try:
+            models["feature_store"] = criar_feature_store(models["semianon"], FEATURE_STORE_PARAMS)
+        except Exception as e:
+            logger.warning("Feature store dos semi-logados não criada.", exc_info=e)
+
     return models
+
+
+def load_similar_model() -> Optional[Dict[str, Any]]:
+    """
+    Carrega a tabela de itens similares (None se indisponível).
+    """
+    try:
+        return load_model_similar(MODEL_DIR_SIMILAR)
+    except Exception as e:
+        logger.error("Erro ao carregar a tabela de itens similares.", exc_info=e)
+        return None
@@ -1,16 +1,33 @@
 import uvicorn
 import logging
 import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from routes.recommendations import router as recommendations_router
+from routes.recommendations import router as recommendations_router, models
 from routes.metrics import router as metrics_router
 from routes.evaluation import router as evaluation_router
+from routes.items import router as items_router
+from routes.events import router as events_router
+from services.event_service import iniciar_flusher, parar_flusher
+from services.admission_service import limitador_recomendacoes
+from services.recommendation_service import iniciar_executores, parar_executores
 from prometheus_client import Counter, Histogram
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pools das recomendações primeiro: o de processos (modo "process") é criado por fork,
+    # antes das demais threads. Depois, a thread de gravação dos eventos recebidos; ao
+    # encerrar, grava o que restou no buffer.
+    iniciar_executores(models.get("logged"), models.get("df_users_logged"))
+    iniciar_flusher()
+    yield
+    parar_flusher()
+    parar_executores()
+
 app = FastAPI(
     title="Sistema de Recomendação",
     description=(
@@ -18,12 +35,25 @@ app = FastAPI(
         "A pipeline de inferência determina se o usuário é logado, semianônimo ou anônimo, retornando o modelo adequado."
     ),
     version="1.0",
+    lifespan=lifespan,
 )
 
 # Definição de Métricas Prometheus
 REQUEST_COUNT = Counter("api_request_count", "Contagem de requisições por endpoint e status", ["endpoint", "http_status"])
 REQUEST_LATENCY = Histogram("api_request_latency_seconds", "Tempo de resposta por endpoint", ["endpoint"])
 
+@app.middleware("http")
+async def controle_admissao(request: Request, call_next):
+    # Registrado antes do middleware de métricas, que o envolve: recusas também são medidas
+    if request.url.path != limitador_recomendacoes.endpoint:
+        return await call_next(request)
+    if not await limitador_recomendacoes.entrar():
+        return limitador_recomendacoes.recusar(request)
+    try:
+        return await call_next(request)
+    finally:
+        limitador_recomendacoes.sair()
+
 @app.middleware("http")
 async def add_metrics(request: Request, call_next):
     start_time = time.time()
@@ -38,6 +68,8 @@ async def add_metrics(request: Request, call_next):
 app.include_router(recommendations_router)
 app.include_router(metrics_router)
 app.include_router(evaluation_router)
+app.include_router(items_router)
+app.include_router(events_router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
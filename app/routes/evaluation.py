@@ -1,16 +1,47 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import List, Optional
 from services.evaluation_service import get_evaluation_metrics
 from schemas.evaluation_model import EvaluationMetric
 
 router = APIRouter()
 
+
+def _iso_local(momento: Optional[datetime]) -> Optional[str]:
+    """
+    Converte o filtro para o formato dos timestamps gravados (ISO 8601 no horário local, sem
+    fuso). Datas com fuso são convertidas para o horário local antes de descartá-lo.
+    """
+    if momento is None:
+        return None
+    if momento.tzinfo is not None:
+        momento = momento.astimezone().replace(tzinfo=None)
+    return momento.isoformat()
+
+
 @router.get("/evaluation/metrics", response_model=List[EvaluationMetric])
-def evaluation_metrics():
+def evaluation_metrics(
+    response: Response,
+    type_model: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, gt=0, le=1000),
+    offset: int = Query(0, ge=0),
+):
     """
-    Endpoint que lê o CSV gerado pelo Airflow e retorna as métricas de avaliação.
+    Endpoint que retorna as métricas de avaliação gravadas pelo Airflow, filtradas por
+    modelo e intervalo de tempo e paginadas. Sem limit, retorna todas as métricas. O total
+    de métricas que atendem aos filtros é informado no cabeçalho X-Total-Count.
     """
     try:
-        return get_evaluation_metrics()
+        metricas, total = get_evaluation_metrics(
+            type_model=type_model,
+            start=_iso_local(start),
+            end=_iso_local(end),
+            limit=limit,
+            offset=offset,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    return metricas
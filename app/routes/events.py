@@ -0,0 +1,21 @@
+import math
+from fastapi import APIRouter, HTTPException, status
+from services.event_service import receber_eventos, EVENTS_FLUSH_INTERVAL_S
+from schemas.event_model import EventBatch
+
+router = APIRouter()
+
+@router.post("/events", status_code=status.HTTP_202_ACCEPTED)
+def post_events(batch: EventBatch) -> dict:
+    """
+    Recebe eventos de leitura/clique em lote. Os eventos são acumulados em memória e
+    gravados em micro-lotes Parquet particionados por data, consumidos pelo processamento
+    incremental. Com o buffer cheio o lote é recusado com 429 e deve ser reenviado.
+    """
+    if not receber_eventos(batch.events):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Buffer de eventos cheio; reenvie o lote mais tarde.",
+            headers={"Retry-After": str(math.ceil(EVENTS_FLUSH_INTERVAL_S))},
+        )
+    return {"accepted": len(batch.events)}
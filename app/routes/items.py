@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List
+from script_shared.models.model_similar import itens_similares
+from core.models_loader import load_similar_model
+
+
+router = APIRouter()
+
+# Carrega a tabela de itens similares na inicialização
+similar_model = load_similar_model()
+
+@router.get("/items/{page}/similar", response_model=List[str])
+def get_similar_items(page: str, num_recs: int = Query(5, gt=0)) -> List[str]:
+    """
+    Retorna os itens mais similares ao item informado, a partir da tabela de vizinhos
+    pré-calculada no treino.
+    """
+    if similar_model is None:
+        raise HTTPException(status_code=500, detail="Tabela de itens similares não carregada.")
+
+    similares = itens_similares(similar_model, page, top_k=num_recs)
+    if similares is None:
+        raise HTTPException(status_code=404, detail="Item não encontrado.")
+    return similares
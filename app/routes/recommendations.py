@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from typing import List, Optional
 from services.recommendation_service import get_recommendations_for_user
+from services.event_service import registrar_consumidor
+from services.admission_service import limitador_recomendacoes
 from core.models_loader import load_all_models
+from script_shared.models.model_anon import recomendar_anon_heuristico
 
 
 router = APIRouter()
@@ -9,10 +13,42 @@ router = APIRouter()
 # Carrega os modelos na inicialização
 models = load_all_models()
 
+# O motor de tendências e a feature store são alimentados pelos eventos de POST /events
+for nome in ("trending", "feature_store"):
+    if models.get(nome) is not None:
+        registrar_consumidor(models[nome].registrar_eventos)
+
+
+def resposta_sobrecarga(request: Request) -> Optional[Response]:
+    """
+    Ranking anônimo pré-calculado para requisições recusadas pelo controle de admissão,
+    sinalizado pelo cabeçalho X-Degraded. None (503) se o modelo anônimo não estiver
+    carregado ou num_recs for inválido.
+    """
+    try:
+        num_recs = int(request.query_params.get("num_recs", 5))
+    except ValueError:
+        return None
+    if models.get("anon") is None or num_recs <= 0:
+        return None
+    return JSONResponse(
+        recomendar_anon_heuristico(models["anon"], top_k=num_recs),
+        headers={"X-Degraded": "admission"},
+    )
+
+limitador_recomendacoes.fallback = resposta_sobrecarga
+
 @router.get("/recommendations", response_model=List[str])
-def get_recommendations(user_id: str, num_recs: int = Query(5, gt=0)) -> List[str]:
+async def get_recommendations(
+    user_id: str,
+    num_recs: int = Query(5, gt=0),
+    session_pages: Optional[List[str]] = Query(None),
+) -> List[str]:
     """
     Retorna uma lista de recomendações para o usuário informado.
+
+    Para usuários anônimos, as páginas vistas na sessão atual (parâmetro session_pages
+    repetido, da mais antiga para a mais recente) geram recomendações por co-visitação.
     """
     if not all(
         models.get(k) is not None for k in ["logged", "semianon", "anon"]
@@ -20,11 +56,15 @@ def get_recommendations(user_id: str, num_recs: int = Query(5, gt=0)) -> List[st
         raise HTTPException(status_code=500, detail="Modelos não carregados corretamente ou DataFrame vazio.")
 
 
-    return get_recommendations_for_user(
+    return await get_recommendations_for_user(
         user_id=user_id,
         num_recs=num_recs,
         logged_model=models["logged"],
         semianon_model=models["semianon"],
         anon_model=models["anon"],
         df_users_logged=models["df_users_logged"],
+        session_model=models.get("session"),
+        session_pages=session_pages,
+        trending=models.get("trending"),
+        feature_store=models.get("feature_store"),
     )
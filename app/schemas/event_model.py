@@ -0,0 +1,18 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+from script_shared import config
+
+class Event(BaseModel):
+    userId: str = Field(..., min_length=1)
+    userType: Literal["Logged", "Non-Logged"] = "Non-Logged"
+    page: str = Field(..., min_length=1)
+    timestamp: Optional[int] = Field(
+        None, ge=0, le=config.EVENTS_MAX_TIMESTAMP_MS, description="Instante da leitura em ms (default: recebimento)"
+    )
+    clicks: float = Field(0, ge=0, le=config.EVENTS_MAX_CLICKS)
+    time_on_page: float = Field(0, ge=0, le=1_800_000, description="Tempo na página em ms")
+    scroll_percentage: float = Field(0, ge=0, le=100)
+    page_visits: float = Field(1, ge=0, le=config.EVENTS_MAX_PAGE_VISITS)
+
+class EventBatch(BaseModel):
+    events: List[Event] = Field(..., min_length=1)
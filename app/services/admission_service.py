@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Optional
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter, Gauge
+from script_shared import config
+
+ADMISSION_MAX_CONCURRENCY = config.ADMISSION_MAX_CONCURRENCY
+ADMISSION_MAX_QUEUE = config.ADMISSION_MAX_QUEUE
+ADMISSION_QUEUE_TIMEOUT_MS = config.ADMISSION_QUEUE_TIMEOUT_MS
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_IN_FLIGHT = Gauge("api_admission_in_flight", "Requisições em atendimento", ["endpoint"])
+ADMISSION_QUEUED = Gauge("api_admission_queued", "Requisições aguardando vaga", ["endpoint"])
+ADMISSION_REJECTED = Counter(
+    "api_admission_rejected", "Requisições recusadas pelo controle de admissão", ["endpoint", "reason"]
+)
+
+
+class LimitadorConcorrencia:
+    """
+    Limita as requisições atendidas simultaneamente em uma rota, com uma fila de espera
+    limitada (FIFO). Sem vaga e com a fila cheia, ou esgotado o tempo de espera, a
+    requisição é recusada na hora, antes de ocupar uma thread do servidor.
+
+    Usado no loop de eventos (middleware assíncrono), sem locks: a vaga liberada por uma
+    requisição é transferida diretamente para a primeira da fila.
+
+    Args:
+        endpoint: Rota controlada (rótulo das métricas).
+        max_concorrencia: Requisições em atendimento simultâneo.
+        max_fila: Requisições aguardando vaga.
+        espera_max_s: Tempo máximo de espera na fila, em segundos.
+    """
+
+    def __init__(self, endpoint: str, max_concorrencia: int, max_fila: int, espera_max_s: float):
+        self.endpoint = endpoint
+        self.max_concorrencia, self.max_fila, self.espera_max_s = max_concorrencia, max_fila, espera_max_s
+        # Resposta alternativa para requisições recusadas (None: 503)
+        self.fallback: Optional[Callable[[Request], Optional[Response]]] = None
+        self._em_uso = 0
+        self._fila: Deque[asyncio.Future] = deque()
+
+    def _atualizar_metricas(self) -> None:
+        ADMISSION_IN_FLIGHT.labels(endpoint=self.endpoint).set(self._em_uso)
+        ADMISSION_QUEUED.labels(endpoint=self.endpoint).set(len(self._fila))
+
+    async def entrar(self) -> bool:
+        """
+        Obtém uma vaga, aguardando na fila se necessário.
+
+        Returns:
+            True se a vaga foi obtida (liberar com sair); False se a requisição foi recusada.
+        """
+        if self._em_uso < self.max_concorrencia and not self._fila:
+            self._em_uso += 1
+            self._atualizar_metricas()
+            return True
+        if len(self._fila) >= self.max_fila:
+            ADMISSION_REJECTED.labels(endpoint=self.endpoint, reason="queue_full").inc()
+            return False
+
+        vaga = asyncio.get_running_loop().create_future()
+        self._fila.append(vaga)
+        self._atualizar_metricas()
+        try:
+            await asyncio.wait_for(vaga, timeout=self.espera_max_s)
+            return True
+        except asyncio.TimeoutError:
+            # A vaga pode ter sido transferida no mesmo instante em que o prazo esgotou
+            if vaga.done() and not vaga.cancelled():
+                return True
+            ADMISSION_REJECTED.labels(endpoint=self.endpoint, reason="queue_timeout").inc()
+            return False
+        except asyncio.CancelledError:
+            # Requisição cancelada (ex.: cliente desconectado) depois de receber a vaga:
+            # a vaga é repassada, senão ficaria ocupada para sempre
+            if vaga.done() and not vaga.cancelled():
+                self.sair()
+            raise
+        finally:
+            if vaga in self._fila:
+                self._fila.remove(vaga)
+            self._atualizar_metricas()
+
+    def sair(self) -> None:
+        """Libera a vaga, transferindo-a para a primeira requisição da fila, se houver."""
+        while self._fila:
+            vaga = self._fila.popleft()
+            if not vaga.done():
+                vaga.set_result(True)
+                self._atualizar_metricas()
+                return
+        self._em_uso -= 1
+        self._atualizar_metricas()
+
+    def recusar(self, request: Request) -> Response:
+        """Resposta para uma requisição recusada: o fallback da rota ou 503."""
+        if self.fallback is not None:
+            try:
+                resposta = self.fallback(request)
+                if resposta is not None:
+                    return resposta
+            except Exception as e:
+                logger.error("Erro na resposta alternativa do controle de admissão.", exc_info=e)
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Serviço sobrecarregado; tente novamente."},
+            headers={"Retry-After": "1"},
+        )
+
+
+limitador_recomendacoes = LimitadorConcorrencia(
+    "/recommendations", ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_MS / 1000.0
+)
@@ -1,24 +1,52 @@
-import csv
+import threading
+from typing import Dict, List, Optional, Tuple
 from schemas.evaluation_model import EvaluationMetric
+from script_shared import config
+from script_shared.metrics_store import assinatura, consultar_metricas, contar_metricas
 
-CSV_PATH = "/app/script_shared/evaluation/evaluation_metrics.csv"
+DB_PATH = config.EVALUATION_DB_PATH
 
-def get_evaluation_metrics():
+# Número máximo de consultas distintas mantidas em cache
+MAX_CONSULTAS_CACHE = 256
+
+# Cache em memória das consultas, invalidado quando o banco (ou seu WAL) é modificado
+_cache: Dict = {"assinatura": None, "consultas": {}}
+_cache_lock = threading.Lock()
+
+
+def get_evaluation_metrics(
+    type_model: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Tuple[List[EvaluationMetric], int]:
     """
-    Lê o arquivo CSV e retorna os dados como uma lista de EvaluationMetric.
+    Retorna as métricas de avaliação filtradas por modelo e intervalo de tempo (ISO 8601,
+    inclusivo), paginadas, junto com o total de métricas que atendem aos filtros.
+
+    Os filtros e a paginação são aplicados no SQLite (com os índices da tabela). O
+    resultado de cada consulta fica em cache até a assinatura (tamanho/mtime) do banco mudar.
     """
-    results = []
+    chave = (type_model, start, end, limit, offset)
+    atual = assinatura(DB_PATH)
+    with _cache_lock:
+        if atual is None or atual != _cache["assinatura"]:
+            _cache["consultas"] = {}
+            _cache["assinatura"] = atual
+        elif chave in _cache["consultas"]:
+            return _cache["consultas"][chave]
+
     try:
-        with open(CSV_PATH, mode="r", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                results.append(EvaluationMetric(
-                    type_model=row["type_model"],
-                    mean_recall=float(row["mean_recall"]),
-                    mean_ndcg=float(row["mean_ndcg"]),
-                    timestamp=row["timestamp"]
-                ))
+        linhas = consultar_metricas(DB_PATH, type_model, start, end, limit, offset)
+        total = contar_metricas(DB_PATH, type_model, start, end)
     except Exception as e:
-        raise RuntimeError(f"Erro ao ler o CSV: {str(e)}")
-    
-    return results
+        raise RuntimeError(f"Erro ao ler as métricas: {str(e)}")
+    resultado = ([EvaluationMetric(**row) for row in linhas], total)
+
+    with _cache_lock:
+        if _cache["assinatura"] == atual:
+            if len(_cache["consultas"]) >= MAX_CONSULTAS_CACHE:
+                _cache["consultas"].clear()
+            _cache["consultas"][chave] = resultado
+    return resultado
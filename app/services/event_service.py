@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from prometheus_client import Counter, Gauge, Histogram
+from schemas.event_model import Event
+from script_shared import config
+from script_shared.events import LIMITES_EVENTO, escrever_lote, separar_invalidos
+
+EVENTS_DIR = config.EVENTS_DIR
+EVENTS_BUFFER_CAPACITY = config.EVENTS_BUFFER_CAPACITY
+EVENTS_FLUSH_BATCH = config.EVENTS_FLUSH_BATCH
+EVENTS_FLUSH_INTERVAL_S = config.EVENTS_FLUSH_INTERVAL_S
+
+logger = logging.getLogger(__name__)
+
+# Métricas Prometheus da ingestão
+EVENTS_RECEIVED = Counter("api_events_received", "Eventos aceitos no buffer")
+EVENTS_REJECTED = Counter("api_events_rejected", "Eventos rejeitados por buffer cheio")
+EVENTS_BUFFERED = Gauge("api_events_buffer_size", "Eventos aguardando gravação")
+EVENTS_FLUSHED = Counter("api_events_flushed", "Eventos gravados em Parquet")
+EVENTS_FLUSH_ERRORS = Counter("api_events_flush_errors", "Falhas na gravação de micro-lotes")
+EVENTS_QUARANTINED = Counter("api_events_quarantined", "Eventos que não podem ser gravados, postos em quarentena")
+EVENTS_FLUSH_LATENCY = Histogram(
+    "api_events_flush_latency_seconds", "Tempo de gravação de um micro-lote",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+class BufferEventos:
+    """
+    Buffer circular de capacidade fixa (pré-alocado) compartilhado entre as requisições,
+    que inserem, e a thread de gravação, que consome. Um lote só é aceito se couber
+    inteiro: com o buffer cheio o chamador recebe a recusa (backpressure) em vez de o
+    consumo de memória crescer ou eventos antigos serem sobrescritos.
+    """
+
+    def __init__(self, capacidade: int):
+        self.capacidade = capacidade
+        self._slots: List[Optional[Tuple[Any, ...]]] = [None] * capacidade
+        self._inicio = 0
+        self._tamanho = 0
+        self.cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return self._tamanho
+
+    def oferecer(self, eventos: Sequence[Tuple[Any, ...]]) -> bool:
+        with self.cond:
+            if self._tamanho + len(eventos) > self.capacidade:
+                return False
+            fim = (self._inicio + self._tamanho) % self.capacidade
+            for evento in eventos:
+                self._slots[fim] = evento
+                fim = (fim + 1) % self.capacidade
+            self._tamanho += len(eventos)
+            self.cond.notify()
+            return True
+
+    def espiar(self, n: int) -> List[Tuple[Any, ...]]:
+        """Os n eventos mais antigos, sem removê-los."""
+        with self.cond:
+            n = min(n, self._tamanho)
+            fim = self._inicio + n
+            if fim <= self.capacidade:
+                return self._slots[self._inicio:fim]
+            return self._slots[self._inicio:] + self._slots[: fim - self.capacidade]
+
+    def descartar(self, n: int) -> None:
+        """Remove os n eventos mais antigos (já gravados)."""
+        with self.cond:
+            n = min(n, self._tamanho)
+            for i in range(self._inicio, self._inicio + n):
+                self._slots[i % self.capacidade] = None
+            self._inicio = (self._inicio + n) % self.capacidade
+            self._tamanho -= n
+
+
+_buffer = BufferEventos(EVENTS_BUFFER_CAPACITY)
+_estado = {"thread": None, "parar": False, "lote": 0}
+
+# Consumidores em memória dos eventos aceitos (ex.: motor de tendências)
+_consumidores: List[Callable[[List[Tuple[Any, ...]]], None]] = []
+
+
+def registrar_consumidor(consumidor: Callable[[List[Tuple[Any, ...]]], None]) -> None:
+    """
+    Registra uma função chamada com as linhas de cada lote aceito, na própria requisição.
+    Falhas do consumidor são registradas no log e não afetam a ingestão.
+    """
+    _consumidores.append(consumidor)
+
+
+def _como_linha(evento: Event, agora_ms: int) -> Tuple[Any, ...]:
+    """
+    Converte um evento para uma linha de interação (ordem de COLUNAS_INTERACAO), com os
+    campos numéricos limitados a LIMITES_EVENTO.
+    """
+    return (
+        evento.userId,
+        evento.userType,
+        evento.page,
+        str(evento.timestamp if evento.timestamp is not None else agora_ms),
+        min(float(evento.clicks), LIMITES_EVENTO["numberOfClicksHistory"]),
+        min(float(evento.time_on_page), LIMITES_EVENTO["timeOnPageHistory"]),
+        min(float(evento.scroll_percentage), LIMITES_EVENTO["scrollPercentageHistory"]),
+        min(float(evento.page_visits), LIMITES_EVENTO["pageVisitsCountHistory"]),
+    )
+
+
+def receber_eventos(eventos: List[Event]) -> bool:
+    """
+    Insere um lote de eventos no buffer.
+
+    Returns:
+        True se o lote foi aceito; False se não há espaço no buffer (nenhum evento do
+        lote é aceito).
+    """
+    agora_ms = int(time.time() * 1000)
+    linhas = [_como_linha(e, agora_ms) for e in eventos]
+    aceito = _buffer.oferecer(linhas)
+    EVENTS_BUFFERED.set(len(_buffer))
+    if not aceito:
+        EVENTS_REJECTED.inc(len(eventos))
+        return False
+
+    EVENTS_RECEIVED.inc(len(eventos))
+    for consumidor in _consumidores:
+        try:
+            consumidor(linhas)
+        except Exception as e:
+            logger.error("Erro em consumidor de eventos.", exc_info=e)
+    return True
+
+
+def _quarentena(eventos: List[Tuple[Any, ...]]) -> None:
+    """
+    Acrescenta eventos que não podem ser gravados em Parquet a EVENTS_DIR/quarantine
+    (JSON Lines), para inspeção; se nem isso for possível, eles são apenas descartados.
+    """
+    EVENTS_QUARANTINED.inc(len(eventos))
+    logger.warning(f"{len(eventos)} eventos inválidos postos em quarentena.")
+    try:
+        os.makedirs(os.path.join(EVENTS_DIR, "quarantine"), exist_ok=True)
+        with open(os.path.join(EVENTS_DIR, "quarantine", "events.jsonl"), "a", encoding="utf-8") as f:
+            for evento in eventos:
+                f.write(json.dumps(list(evento), default=str) + "\n")
+    except Exception as e:
+        logger.error("Erro ao gravar eventos em quarentena; eventos descartados.", exc_info=e)
+
+
+def descarregar(max_eventos: int = EVENTS_FLUSH_BATCH) -> int:
+    """
+    Grava em Parquet até max_eventos eventos do buffer. Os eventos só saem do buffer
+    depois da gravação; em caso de falha permanecem para a próxima tentativa. Eventos
+    que nunca poderiam ser gravados (ver separar_invalidos) vão para a quarentena em vez
+    de bloquear o buffer.
+
+    Returns:
+        Número de eventos retirados do buffer (gravados ou em quarentena).
+    """
+    lote = _buffer.espiar(max_eventos)
+    if not lote:
+        return 0
+    validos, invalidos = separar_invalidos(lote)
+    _estado["lote"] += 1
+    inicio = time.perf_counter()
+    try:
+        if validos:
+            escrever_lote(validos, EVENTS_DIR, sufixo=f"-{_estado['lote']:06d}")
+    except Exception as e:
+        EVENTS_FLUSH_ERRORS.inc()
+        logger.error("Erro ao gravar micro-lote de eventos.", exc_info=e)
+        return 0
+    EVENTS_FLUSH_LATENCY.observe(time.perf_counter() - inicio)
+    if invalidos:
+        _quarentena(invalidos)
+    _buffer.descartar(len(lote))
+    EVENTS_FLUSHED.inc(len(validos))
+    EVENTS_BUFFERED.set(len(_buffer))
+    return len(lote)
+
+
+def _executar_flusher() -> None:
+    """
+    Grava um micro-lote sempre que há EVENTS_FLUSH_BATCH eventos acumulados ou a cada
+    EVENTS_FLUSH_INTERVAL_S segundos; ao parar, esvazia o buffer. Após uma falha de
+    gravação a próxima tentativa aguarda o intervalo completo.
+    """
+    falhou = False
+    while True:
+        with _buffer.cond:
+            _buffer.cond.wait_for(
+                lambda: _estado["parar"] or (not falhou and len(_buffer) >= EVENTS_FLUSH_BATCH),
+                timeout=EVENTS_FLUSH_INTERVAL_S,
+            )
+            parar = _estado["parar"]
+        gravados = descarregar()
+        while gravados == EVENTS_FLUSH_BATCH and (parar or len(_buffer) >= EVENTS_FLUSH_BATCH):
+            gravados = descarregar()
+        falhou = gravados == 0 and len(_buffer) > 0
+        if parar and (falhou or not len(_buffer)):
+            return
+
+
+def iniciar_flusher() -> None:
+    if _estado["thread"] is not None:
+        return
+    _estado["parar"] = False
+    _estado["thread"] = threading.Thread(target=_executar_flusher, name="events-flusher", daemon=True)
+    _estado["thread"].start()
+    logger.info(f"Ingestão de eventos iniciada (buffer de {EVENTS_BUFFER_CAPACITY} eventos).")
+
+
+def parar_flusher() -> None:
+    thread = _estado["thread"]
+    if thread is None:
+        return
+    with _buffer.cond:
+        _estado["parar"] = True
+        _buffer.cond.notify()
+    thread.join()
+    _estado["thread"] = None
+    if len(_buffer):
+        logger.warning(f"{len(_buffer)} eventos não gravados ao encerrar a ingestão.")
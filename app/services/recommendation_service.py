@@ -1,24 +1,116 @@
+import time
+import asyncio
 import logging
-from typing import List, Dict, Any
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
 import pandas as pd
+from prometheus_client import Counter
+from threadpoolctl import threadpool_limits
+from script_shared import config
+from script_shared.models.model_logged import recomendar_logged
+from script_shared.models.model_semianon import lista_cluster_treino
+from script_shared.models.model_anon import recomendar_anon_heuristico
+from script_shared.models.routing import rotear_usuario, recomendar_segmento
+from script_shared.models.trending import MotorTendencias
+from script_shared.models.feature_store import FeatureStoreSemianon
+
+RECOMMENDATION_BUDGET_MS = config.RECOMMENDATION_BUDGET_MS
+RECOMMENDATION_WORKERS = config.RECOMMENDATION_WORKERS
+RECOMMENDATION_EXECUTOR = config.RECOMMENDATION_EXECUTOR
+RECOMMENDATION_PROCESS_WORKERS = config.RECOMMENDATION_PROCESS_WORKERS
+RECOMMENDATION_BLAS_THREADS = config.RECOMMENDATION_BLAS_THREADS
 
 logger = logging.getLogger(__name__)
 
+DEADLINE_MISSES = Counter(
+    "api_recommendation_deadline_misses",
+    "Recomendações substituídas pela lista do cluster ou anônima por estourar o orçamento de latência",
+    ["segment"],
+)
+
+# Pools em que as recomendações são calculadas, fora do loop de eventos e do pool de
+# threads padrão do servidor (o de processos só existe com RECOMMENDATION_EXECUTOR="process")
+_executores: Dict[str, Any] = {
+    "threads": ThreadPoolExecutor(max_workers=RECOMMENDATION_WORKERS, thread_name_prefix="recommendations"),
+    "processos": None,
+}
+
+# Modelo logged dos processos do pool (herdado do processo da API no fork)
+_MODELO_PROCESSO: Dict[str, Any] = {}
+
+
+def _init_processo(logged_model: Dict[str, Any], df_users_logged: pd.DataFrame, blas_threads: int) -> None:
+    threadpool_limits(blas_threads)
+    _MODELO_PROCESSO.update(logged=logged_model, df_users_logged=df_users_logged)
 
-def get_recommendations_for_user(
+
+def _recomendar_logged_processo(user_id: str, num_recs: int) -> List[str]:
+    return recomendar_logged(
+        user_id, _MODELO_PROCESSO["logged"], _MODELO_PROCESSO["df_users_logged"], top_k=num_recs
+    )
+
+
+def iniciar_executores(
+    logged_model: Optional[Dict[str, Any]] = None, df_users_logged: Optional[pd.DataFrame] = None
+) -> None:
+    """
+    Limita as threads BLAS/OpenMP do processo da API a RECOMMENDATION_BLAS_THREADS por
+    chamada (o limite vale para todas as threads do pool) e, no modo "process", cria o
+    pool de processos do caminho logged. Os processos são criados por fork, herdando os
+    modelos já carregados sem serializá-los, e iniciados de imediato, antes que a API
+    crie outras threads.
+    """
+    threadpool_limits(RECOMMENDATION_BLAS_THREADS)
+    if RECOMMENDATION_EXECUTOR != "process" or logged_model is None or _executores["processos"] is not None:
+        return
+    pool = ProcessPoolExecutor(
+        max_workers=RECOMMENDATION_PROCESS_WORKERS,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_processo,
+        initargs=(logged_model, df_users_logged, RECOMMENDATION_BLAS_THREADS),
+    )
+    pool.submit(int).result()
+    _executores["processos"] = pool
+    logger.info(f"Pool de {RECOMMENDATION_PROCESS_WORKERS} processos iniciado para o modelo logged.")
+
+
+def parar_executores() -> None:
+    for nome in ("processos", "threads"):
+        if _executores[nome] is not None:
+            _executores[nome].shutdown(wait=False, cancel_futures=True)
+    _executores["processos"] = None
+
+
+async def get_recommendations_for_user(
     user_id: str,
     num_recs: int,
     logged_model: Dict[str, Any],
     semianon_model: Dict[str, Any],
     anon_model: Dict[str, Any],
     df_users_logged: pd.DataFrame,
+    session_model: Optional[Dict[str, Any]] = None,
+    session_pages: Optional[List[str]] = None,
+    trending: Optional[MotorTendencias] = None,
+    feature_store: Optional[FeatureStoreSemianon] = None,
 ) -> List[str]:
     """
     Verifica qual modelo utilizar para o usuário informado e retorna a lista de recomendações.
 
     Se o usuário estiver presente no modelo logged, utiliza o modelo logged.
-    Se estiver presente no modelo semianon, utiliza o modelo semianon.
-    Caso contrário, utiliza o modelo anônimo (heurístico).
+    Se estiver presente no modelo semianon (ou na feature store online), utiliza o modelo semianon.
+    Caso contrário, utiliza o modelo anônimo: recomendações por co-visitação a partir das
+    páginas da sessão, se informadas, ou o ranking heurístico combinado às tendências.
+
+    O cálculo roda em um pool dedicado (threads, ou processos para o caminho logged no
+    modo "process"), sem bloquear o loop de eventos; nos dois modos, usuários logged sem
+    recomendações seguem para o segmento seguinte (ver recomendar_segmento). As
+    recomendações logged e semianon têm prazo de RECOMMENDATION_BUDGET_MS desde o início
+    da requisição; estourado o prazo, retorna a lista pré-calculada do cluster do usuário no treino (semianon) ou o ranking
+    anônimo pré-calculado e contabiliza a perda de prazo do segmento. O cálculo
+    interrompido não é cancelado, apenas descartado (ou não chega a começar, se ainda
+    estava na fila do pool).
 
     Args:
         user_id: ID do usuário.
@@ -27,30 +119,54 @@ def get_recommendations_for_user(
         semianon_model: Artefatos do modelo semianon.
         anon_model: Artefatos do modelo anônimo.
         df_users_logged: DataFrame de usuários logados (necessário para a inferência do modelo logged).
+        session_model: Tabela de co-visitação do modelo de sessão (opcional).
+        session_pages: Páginas vistas na sessão atual, da mais antiga para a mais recente.
+        trending: Motor de tendências alimentado pelos eventos (opcional).
+        feature_store: Feature store online dos semi-logados (opcional).
 
     Returns:
         Uma lista de recomendações (IDs dos itens).
     """
-    # Se o usuário estiver no modelo logged
-    if user_id in logged_model["aux_dict"].get("user_to_idx", {}):
-        from script_shared.models.model_logged import recomendar_logged
+    inicio = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    segmento = rotear_usuario(user_id, logged_model, semianon_model, feature_store)
 
-        recs = recomendar_logged(user_id, logged_model, df_users_logged, top_k=num_recs)
-        logger.info(f"Recomendações geradas para usuário logged: {user_id}")
-        return recs
+    async def calcular() -> List[str]:
+        seguinte = segmento
+        if segmento == "logged" and _executores["processos"] is not None:
+            recs = await loop.run_in_executor(
+                _executores["processos"], _recomendar_logged_processo, user_id, num_recs
+            )
+            if recs:
+                return recs
+            # Mesmo encadeamento de recomendar_segmento no modo "thread"
+            seguinte = "semianon"
+        return await loop.run_in_executor(_executores["threads"], partial(
+            recomendar_segmento, seguinte, user_id, num_recs, logged_model, semianon_model,
+            anon_model, df_users_logged, session_model, session_pages, trending, feature_store,
+        ))
 
-    # Se o usuário estiver no modelo semianon
-    elif user_id in semianon_model["df_features"]["userId"].unique():
-        from script_shared.models.model_semianon import recomendar_semianon
+    future = calcular()
 
-        recs = recomendar_semianon(user_id, semianon_model, top_k=num_recs)
-        logger.info(f"Recomendações geradas para usuário semianon: {user_id}")
-        return recs
-
-    # Caso contrário, assume usuário anônimo completo
+    if segmento == "anon" or RECOMMENDATION_BUDGET_MS <= 0:
+        recs = await future
     else:
-        from script_shared.models.model_anon import recomendar_anon_heuristico
+        restante = RECOMMENDATION_BUDGET_MS / 1000.0 - (time.perf_counter() - inicio)
+        try:
+            recs = await asyncio.wait_for(future, timeout=max(restante, 0.0))
+        except asyncio.TimeoutError:
+            DEADLINE_MISSES.labels(segment=segmento).inc()
+            recs = lista_cluster_treino(user_id, semianon_model, num_recs) if segmento == "semianon" else []
+            logger.warning(
+                f"Orçamento de {RECOMMENDATION_BUDGET_MS:.0f} ms estourado ({segmento}); usando a "
+                f"lista {'do cluster' if recs else 'anônima'} para o usuário: {user_id}"
+            )
+            return recs or recomendar_anon_heuristico(anon_model, top_k=num_recs)
 
-        recs = recomendar_anon_heuristico(anon_model, top_k=num_recs)
+    if segmento == "anon" and session_model is not None and session_pages:
+        logger.info(f"Recomendações geradas para usuário anônimo a partir da sessão: {user_id}")
+    elif segmento == "anon":
         logger.info(f"Recomendações geradas para usuário anônimo (fallback): {user_id}")
-        return recs
+    else:
+        logger.info(f"Recomendações geradas para usuário {segmento}: {user_id}")
+    return recs
@@ -9,7 +9,7 @@ REQUIRED_FILES="script_shared/data/refined/users_logged.parquet \
                 script_shared/models/logged/model_logged_als.npz \
                 script_shared/models/logged/objetos_logged_auxiliares.pkl \
                 script_shared/models/logged/tfidf_logged_matrix.npz \
-                script_shared/models/semianon/cluster_top_items.pkl \
+                script_shared/models/semianon/cluster_top_items.npz \
                 script_shared/models/semianon/df_features_semianon.csv \
                 script_shared/models/semianon/modelo_semianon_kmeans.pkl \
                 script_shared/models/semianon/pca_semianon.pkl \
@@ -29,4 +29,9 @@ with DAG(
         bash_command="python -m pipelines.evaluate.evaluate_semianon",
     )
 
-    evaluate_logged >> evaluate_semianon
+    evaluate_routing = BashOperator(
+        task_id="avaliar_roteamento",
+        bash_command="python -m pipelines.evaluate.evaluate_routing",
+    )
+
+    evaluate_logged >> evaluate_semianon >> evaluate_routing
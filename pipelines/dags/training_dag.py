@@ -1,5 +1,6 @@
 from airflow import DAG
 from airflow.operators.bash import BashOperator
+from airflow.operators.trigger_dagrun import TriggerDagRunOperator
 from datetime import datetime, timedelta
 
 # Defina os argumentos padrão para o DAG
@@ -20,6 +21,11 @@ with DAG(
     schedule_interval=None, 
     catchup=False,
 ) as dag:
+    preparar_entradas = BashOperator(
+        task_id="preparar_entradas_treino",
+        bash_command="python -m pipelines.train.shared_inputs",
+    )
+
     train_logged = BashOperator(
         task_id="treinar_modelo_logged",
         bash_command="python -m pipelines.train.train_logged",
@@ -35,4 +41,22 @@ with DAG(
         bash_command="python -m pipelines.train.train_anon",
     )
 
-    train_logged >> train_semianon >> train_anon
+    train_session = BashOperator(
+        task_id="treinar_modelo_sessao",
+        bash_command="python -m pipelines.train.train_session",
+    )
+
+    train_similar = BashOperator(
+        task_id="treinar_itens_similares",
+        bash_command="python -m pipelines.train.train_similar",
+    )
+
+    disparar_avaliacao = TriggerDagRunOperator(
+        task_id="disparar_avaliacao",
+        trigger_dag_id="avaliacao_modelos",
+    )
+
+    # Os treinamentos (logged, semianon, anônimo e sessão) são independentes entre si e rodam em paralelo
+    preparar_entradas >> [train_logged, train_semianon, train_anon, train_session] >> disparar_avaliacao
+    # A tabela de similares usa os fatores e o TF-IDF do modelo logado
+    train_logged >> train_similar >> disparar_avaliacao
@@ -1,15 +1,43 @@
+import hashlib
+import json
 import logging
 import os
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Union
+from typing import Dict, List, Optional, Union
 
 import gdown
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 
 # Configuração do logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Colunas textuais (listas serializadas, ids e datas) mantidas como string na conversão,
+# evitando inferências diferentes entre blocos do mesmo CSV
+STAGE_STRING_COLUMNS = [
+    "userId",
+    "userType",
+    "history",
+    "timestampHistory",
+    "numberOfClicksHistory",
+    "timeOnPageHistory",
+    "scrollPercentageHistory",
+    "pageVisitsCountHistory",
+    "timestampHistory_new",
+    "page",
+    "url",
+    "issued",
+    "modified",
+    "title",
+    "body",
+    "caption",
+]
+CHECKSUM_FILE = "_checksum.json"
+
 def download_and_extract_zip(file_id: str, extract_to: Union[str, Path] = '.') -> None:
     """
     Baixa um arquivo ZIP do Google Drive usando o file_id, extrai os arquivos e remove
@@ -75,9 +103,187 @@ def clean_folder(directory: Union[str, Path]) -> None:
             except Exception as e:
                 logger.error(f"Erro ao remover a pasta {dir_path}: {e}")
 
+def file_checksum(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """
+    Calcula o SHA-256 de um arquivo lendo-o em blocos.
+
+    Args:
+        path: Caminho do arquivo.
+        chunk_size: Tamanho dos blocos de leitura, em bytes.
+
+    Returns:
+        O hash hexadecimal do arquivo.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def convert_zip_member_to_parquet(
+    zip_path: Union[str, Path], member: str, stage_dir: Union[str, Path]
+) -> str:
+    """
+    Lê um CSV diretamente de dentro do arquivo ZIP e o grava como Parquet tipado,
+    bloco a bloco, sem extraí-lo para o disco.
+
+    Args:
+        zip_path: Caminho do arquivo ZIP.
+        member: Nome do CSV dentro do ZIP.
+        stage_dir: Diretório de saída; a estrutura de pastas do ZIP é preservada.
+
+    Returns:
+        Caminho do arquivo Parquet gerado.
+    """
+    output_path = (Path(stage_dir) / member).with_suffix(".parquet")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(".parquet.tmp")
+
+    # Nomes das colunas lidos pelo próprio leitor CSV (trata BOM e nomes entre aspas)
+    with zipfile.ZipFile(zip_path, "r") as zip_ref, zip_ref.open(member) as csv_file:
+        header = pv.open_csv(csv_file).schema.names
+        column_types = {c: pa.string() for c in header if c in STAGE_STRING_COLUMNS}
+
+    with zipfile.ZipFile(zip_path, "r") as zip_ref, zip_ref.open(member) as csv_file:
+        reader = pv.open_csv(
+            csv_file,
+            convert_options=pv.ConvertOptions(
+                column_types=column_types, strings_can_be_null=True
+            ),
+        )
+        with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+
+    os.replace(tmp_path, output_path)
+    return str(output_path)
+
+
+def convert_zip_to_parquet(
+    zip_path: Union[str, Path],
+    stage_dir: Union[str, Path],
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Converte todos os CSVs do arquivo ZIP em arquivos Parquet no diretório stage,
+    processando os membros em paralelo.
+
+    Args:
+        zip_path: Caminho do arquivo ZIP.
+        stage_dir: Diretório onde os arquivos Parquet serão gravados.
+        max_workers: Número de processos. Se None, usa o número de CPUs.
+
+    Returns:
+        Lista com os caminhos dos arquivos Parquet gerados.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        members = [
+            m.filename
+            for m in zip_ref.infolist()
+            if not m.is_dir()
+            and m.filename.lower().endswith(".csv")
+            and not Path(m.filename).name.startswith("._")
+        ]
+
+    logger.info(f"Convertendo {len(members)} CSVs do ZIP para Parquet...")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(convert_zip_member_to_parquet, zip_path, m, stage_dir)
+            for m in members
+        ]
+        outputs = [f.result() for f in futures]
+
+    logger.info(f"Conversão concluída: {len(outputs)} arquivos Parquet em {stage_dir}")
+    return outputs
+
+
+def _load_checksum(stage_dir: Path) -> Dict[str, str]:
+    """
+    Lê o checksum do ZIP convertido na execução anterior (vazio se inexistente).
+    """
+    checksum_path = stage_dir / CHECKSUM_FILE
+    if not checksum_path.exists():
+        return {}
+    with open(checksum_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def download_and_convert_zip(
+    file_id: Optional[str],
+    stage_dir: Union[str, Path],
+    zip_path: Optional[Union[str, Path]] = None,
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Modo streaming: baixa o arquivo ZIP (ou usa um ZIP local) e converte os CSVs diretamente
+    para Parquet no diretório stage, sem extraí-los. Se o checksum do ZIP for igual ao da
+    execução anterior, a conversão é ignorada.
+
+    Args:
+        file_id: ID do arquivo no Google Drive. Ignorado quando zip_path é informado.
+        stage_dir: Diretório onde os arquivos Parquet serão gravados.
+        zip_path: ZIP local usado no lugar do download (ex.: testes). Se None, o arquivo é
+                  baixado em stage_dir/arquivo.zip e removido ao final.
+        max_workers: Número de processos para a conversão.
+
+    Returns:
+        Lista com os caminhos dos arquivos Parquet gerados (vazia se a conversão foi ignorada).
+    """
+    stage_dir = Path(stage_dir)
+    stage_dir.mkdir(parents=True, exist_ok=True)
+
+    downloaded = zip_path is None
+    if downloaded:
+        zip_path = stage_dir / "arquivo.zip"
+        url = f"https://drive.google.com/uc?export=download&id={file_id}"
+        logger.info(f"Iniciando o download do arquivo {file_id} para {zip_path}")
+        gdown.download(url, str(zip_path), quiet=False)
+    zip_path = Path(zip_path)
+
+    if not zip_path.exists() or not zipfile.is_zipfile(zip_path):
+        logger.error(f"Arquivo ZIP inexistente ou inválido: {zip_path}")
+        return []
+
+    try:
+        return _convert_if_changed(zip_path, stage_dir, max_workers)
+    finally:
+        if downloaded:
+            zip_path.unlink()
+            logger.info("Arquivo ZIP removido após conversão.")
+
+
+def _convert_if_changed(
+    zip_path: Path, stage_dir: Path, max_workers: Optional[int]
+) -> List[str]:
+    """
+    Converte o ZIP para Parquet apenas se o seu checksum mudou desde a última conversão
+    ou se algum dos arquivos gerados por ela não existe mais.
+    """
+    checksum = file_checksum(zip_path)
+    anterior = _load_checksum(stage_dir)
+    if anterior.get("sha256") == checksum:
+        if all(os.path.exists(p) for p in anterior.get("files", [])):
+            logger.info("Checksum do ZIP igual ao da execução anterior; conversão ignorada.")
+            return []
+        logger.warning("Arquivos Parquet da conversão anterior ausentes; convertendo novamente.")
+
+    outputs = convert_zip_to_parquet(zip_path, stage_dir, max_workers=max_workers)
+    with open(stage_dir / CHECKSUM_FILE, "w", encoding="utf-8") as f:
+        json.dump({"sha256": checksum, "zip": zip_path.name, "files": outputs}, f)
+    return outputs
+
+
 def main() -> None:
     # ID do arquivo no Google Drive
     file_id = '10zmuxXi05ayfiREA9hi-xSrcYJy0iW-r&export'
+
+    # Modo streaming: converte os CSVs do ZIP diretamente para Parquet (diretório stage)
+    if os.getenv("DOWNLOAD_MODE", "extract") == "streaming":
+        stage_dir = Path("/opt/airflow/shared/script_shared/data/stage")
+        download_and_convert_zip(file_id, stage_dir)
+        return
+
     # Diretório onde o arquivo será baixado e extraído
     extract_to = Path("/opt/airflow/shared/script_shared/data/raw")
     extract_to.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import logging
+from typing import Dict, Any, Iterable, Optional
+
+import numpy as np
+
+from script_shared import config
+from script_shared.models.ann_index import (
+    ANN_INDEX_FILE,
+    construir_indice_ivf,
+    carregar_indice_ivf,
+    buscar_ivf,
+)
+
+MODEL_DIR_LOGGED = config.MODEL_DIR_LOGGED
+ANN_LOGGED_PARAMS = config.ANN_LOGGED_PARAMS
+BENCHMARK_PATH = os.path.join(config.BASE_PATH, "evaluation", "benchmark_ann_logged.json")
+
+# Formato dos dados em produção (páginas do catálogo x fatores do ALS), usado quando não
+# há modelo treinado disponível
+SHAPE_SINTETICO = {"n_items": 255_000, "n_users": 100_000, "factors": config.ALS_DEFAULT_PARAMS["factors"]}
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def buscar_exato(item_factors: np.ndarray, user_factor: np.ndarray, top_k: int) -> np.ndarray:
+    """Top-K exato por produto interno sobre todos os itens (referência do benchmark)."""
+    scores = item_factors @ user_factor
+    topo = np.argpartition(-scores, top_k - 1)[:top_k]
+    return topo[np.argsort(-scores[topo], kind="stable")]
+
+
+def _percentis(latencias: np.ndarray) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+    return {"mean": float(latencias.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def benchmark_ann(
+    item_factors: np.ndarray,
+    user_factors: np.ndarray,
+    indice: Dict[str, np.ndarray],
+    top_k: int = 10,
+    n_probes: Iterable[int] = (1, 2, 4, 8, 16, 32, 64, 128),
+    n_queries: int = 1000,
+    random_state: int = 42,
+) -> Dict[str, Any]:
+    """
+    Compara a busca no índice IVF com o top-K exato para uma amostra de usuários, para
+    cada valor de n_probe.
+
+    Returns:
+        Dicionário com a latência da busca exata (ms) e, por n_probe, o recall@top_k em
+        relação ao exato, a fração de itens pontuados e a latência (ms).
+    """
+    rng = np.random.default_rng(random_state)
+    item_factors = np.asarray(item_factors, dtype=np.float32)
+    amostra = rng.choice(len(user_factors), min(n_queries, len(user_factors)), replace=False)
+    consultas = np.asarray(user_factors, dtype=np.float32)[amostra]
+
+    exatos, latencias = [], np.empty(len(consultas))
+    for i, q in enumerate(consultas):
+        inicio = time.perf_counter()
+        exatos.append(buscar_exato(item_factors, q, top_k))
+        latencias[i] = (time.perf_counter() - inicio) * 1000.0
+    resultado = {
+        "n_items": int(len(item_factors)),
+        "factors": int(item_factors.shape[1]),
+        "n_lists": int(len(indice["centroids"])),
+        "n_queries": int(len(consultas)),
+        "top_k": top_k,
+        "exact_ms": _percentis(latencias),
+        "ivf": [],
+    }
+    logger.info(f"Busca exata: {resultado['exact_ms']}")
+
+    tamanhos = np.diff(indice["indptr"])
+    for n_probe in n_probes:
+        acertos, pontuados = 0, 0
+        for i, q in enumerate(consultas):
+            inicio = time.perf_counter()
+            ids, _ = buscar_ivf(indice, q, top_k, n_probe)
+            latencias[i] = (time.perf_counter() - inicio) * 1000.0
+            acertos += len(np.intersect1d(ids, exatos[i]))
+        for q in consultas[: min(100, len(consultas))]:
+            dist = np.einsum("ij,ij->i", indice["centroids"], indice["centroids"]) - 2.0 * (
+                indice["centroids"][:, :-1] @ q
+            )
+            pontuados += tamanhos[np.argsort(dist)[:n_probe]].sum()
+        linha = {
+            "n_probe": int(n_probe),
+            "recall_vs_exact": acertos / (top_k * len(consultas)),
+            "scanned_fraction": float(pontuados) / (min(100, len(consultas)) * len(item_factors)),
+            "latency_ms": _percentis(latencias),
+        }
+        linha["speedup_p50"] = resultado["exact_ms"]["p50"] / max(linha["latency_ms"]["p50"], 1e-9)
+        resultado["ivf"].append(linha)
+        logger.info(
+            f"n_probe={n_probe}: recall={linha['recall_vs_exact']:.4f}, "
+            f"p50={linha['latency_ms']['p50']:.3f} ms, speedup={linha['speedup_p50']:.1f}x"
+        )
+    return resultado
+
+
+def fatores_sinteticos(
+    n_items: int, n_users: int, factors: int, n_topicos: int = 500, random_state: int = 42
+) -> Dict[str, np.ndarray]:
+    """
+    Fatores aleatórios com o formato dos dados de produção. Como nos fatores do ALS
+    implícito, itens e usuários se concentram em torno de tópicos e as normas dos itens
+    têm cauda longa (itens populares com normas maiores).
+    """
+    rng = np.random.default_rng(random_state)
+    topicos = rng.standard_normal((n_topicos, factors)).astype(np.float32)
+    item_factors = topicos[rng.integers(n_topicos, size=n_items)]
+    item_factors += 0.5 * rng.standard_normal((n_items, factors)).astype(np.float32)
+    item_factors *= rng.lognormal(0.0, 0.5, n_items).astype(np.float32)[:, None]
+    user_factors = topicos[rng.integers(n_topicos, size=n_users)]
+    user_factors += 0.5 * rng.standard_normal((n_users, factors)).astype(np.float32)
+    return {"item_factors": item_factors, "user_factors": user_factors}
+
+
+def main(model_dir: str = MODEL_DIR_LOGGED, output_path: Optional[str] = BENCHMARK_PATH) -> Dict[str, Any]:
+    model_path = os.path.join(model_dir, "model_logged_als.npz")
+    if os.path.exists(model_path):
+        with np.load(model_path) as data:
+            fatores = {"item_factors": data["item_factors"], "user_factors": data["user_factors"]}
+        indice = carregar_indice_ivf(os.path.join(model_dir, ANN_INDEX_FILE))
+        origem = model_path
+    else:
+        logger.warning(f"Modelo não encontrado em {model_path}; usando fatores sintéticos.")
+        fatores = fatores_sinteticos(**SHAPE_SINTETICO)
+        indice = None
+        origem = "synthetic"
+
+    if indice is None:
+        inicio = time.perf_counter()
+        indice = construir_indice_ivf(fatores["item_factors"], **ANN_LOGGED_PARAMS)
+        logger.info(f"Índice construído em {time.perf_counter() - inicio:.1f} s")
+
+    resultado = benchmark_ann(fatores["item_factors"], fatores["user_factors"], indice)
+    resultado["source"] = origem
+    if output_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+        logger.info(f"Benchmark salvo em: {output_path}")
+    return resultado
+
+
+if __name__ == "__main__":
+    main()
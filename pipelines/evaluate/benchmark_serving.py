@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import multiprocessing
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional, Sequence
+
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+from script_shared import config
+from pipelines.evaluate.benchmark_ann import SHAPE_SINTETICO, buscar_exato, fatores_sinteticos, _percentis
+
+MODEL_DIR_LOGGED = config.MODEL_DIR_LOGGED
+RECOMMENDATION_WORKERS = config.RECOMMENDATION_WORKERS
+RECOMMENDATION_BLAS_THREADS = config.RECOMMENDATION_BLAS_THREADS
+BENCHMARK_PATH = os.path.join(config.BASE_PATH, "evaluation", "benchmark_serving.json")
+
+# Tamanho padrão do pool de threads do Starlette/AnyIO, usado pelas rotas síncronas
+THREADS_PADRAO_SERVIDOR = 40
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Fatores usados pelas tarefas (herdados pelos processos no fork)
+_FATORES: Dict[str, np.ndarray] = {}
+
+
+def _pontuar(indice_usuario: int, top_k: int = 10) -> np.ndarray:
+    """Uma recomendação logged: pontuação de todos os itens e top-K (exato)."""
+    return buscar_exato(_FATORES["item_factors"], _FATORES["user_factors"][indice_usuario], top_k)
+
+
+def _init_processo(blas_threads: Optional[int]) -> None:
+    if blas_threads:
+        threadpool_limits(blas_threads)
+
+
+async def _executar_carga(
+    executor: Executor, usuarios: Sequence[int], concorrencia: int
+) -> Dict[str, Any]:
+    """
+    Simula concorrencia clientes em laço fechado: cada requisição é enviada ao executor
+    assim que outra termina, como o loop de eventos da API faz com as rotas.
+    """
+    loop = asyncio.get_running_loop()
+    limite = asyncio.Semaphore(concorrencia)
+    latencias = np.empty(len(usuarios))
+
+    async def requisicao(i: int, usuario: int) -> None:
+        async with limite:
+            inicio = time.perf_counter()
+            await loop.run_in_executor(executor, _pontuar, usuario)
+            latencias[i] = (time.perf_counter() - inicio) * 1000.0
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(requisicao(i, u) for i, u in enumerate(usuarios)))
+    duracao = time.perf_counter() - inicio
+    return {"throughput_rps": len(usuarios) / duracao, "latency_ms": _percentis(latencias)}
+
+
+def benchmark_executores(
+    item_factors: np.ndarray,
+    user_factors: np.ndarray,
+    concorrencias: Iterable[int] = (1, 8, 32, 64),
+    n_requisicoes: int = 2000,
+    n_workers: int = RECOMMENDATION_WORKERS,
+    blas_threads: int = RECOMMENDATION_BLAS_THREADS,
+    incluir_processos: bool = True,
+    random_state: int = 42,
+) -> List[Dict[str, Any]]:
+    """
+    Compara, para cada nível de concorrência, a pontuação do caminho logged em:
+      - "default": pool de THREADS_PADRAO_SERVIDOR threads sem limite de threads BLAS
+        (rota síncrona no pool padrão do servidor);
+      - "dedicated_threads": pool de n_workers threads com blas_threads threads BLAS;
+      - "dedicated_processes": pool de n_workers processos com blas_threads threads BLAS.
+
+    Returns:
+        Lista com vazão (req/s) e percentis de latência (ms) por executor e concorrência.
+    """
+    rng = np.random.default_rng(random_state)
+    _FATORES.update(
+        item_factors=np.ascontiguousarray(item_factors, dtype=np.float32),
+        user_factors=np.ascontiguousarray(user_factors, dtype=np.float32),
+    )
+    usuarios = rng.integers(len(user_factors), size=n_requisicoes)
+
+    configuracoes = [
+        ("default", lambda: ThreadPoolExecutor(THREADS_PADRAO_SERVIDOR), None),
+        ("dedicated_threads", lambda: ThreadPoolExecutor(n_workers), blas_threads),
+    ]
+    if incluir_processos:
+        configuracoes.append((
+            "dedicated_processes",
+            lambda: ProcessPoolExecutor(
+                n_workers, mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_processo, initargs=(blas_threads,),
+            ),
+            blas_threads,
+        ))
+
+    resultados = []
+    for nome, criar, limite_blas in configuracoes:
+        with threadpool_limits(limite_blas), criar() as executor:
+            # Aquecimento (criação das threads/processos e caches)
+            list(executor.map(_pontuar, usuarios[: 2 * n_workers]))
+            for concorrencia in concorrencias:
+                linha = asyncio.run(_executar_carga(executor, usuarios, concorrencia))
+                linha.update(executor=nome, concurrency=int(concorrencia))
+                resultados.append(linha)
+                logger.info(
+                    f"{nome} (concorrência {concorrencia}): {linha['throughput_rps']:.0f} req/s, "
+                    f"p50={linha['latency_ms']['p50']:.2f} ms, p99={linha['latency_ms']['p99']:.2f} ms"
+                )
+    return resultados
+
+
+def benchmark_http(
+    url: str,
+    user_ids: Sequence[str],
+    concorrencias: Iterable[int] = (1, 8, 32, 64),
+    n_requisicoes: int = 1000,
+    num_recs: int = 10,
+    timeout_s: float = 10.0,
+) -> List[Dict[str, Any]]:
+    """
+    Carga HTTP em laço fechado contra a API em execução (GET {url}/recommendations), para
+    comparar versões da rota. Conta também as respostas degradadas (X-Degraded) e os erros.
+
+    Returns:
+        Lista com vazão, percentis de latência (ms) e contagem de status por concorrência.
+    """
+    def requisitar(user_id: str):
+        query = urllib.parse.urlencode({"user_id": user_id, "num_recs": num_recs})
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"{url}/recommendations?{query}", timeout=timeout_s) as resp:
+                resp.read()
+                status = "degraded" if resp.headers.get("X-Degraded") else str(resp.status)
+        except urllib.error.HTTPError as e:
+            status = str(e.code)
+        except Exception:
+            status = "error"
+        return (time.perf_counter() - inicio) * 1000.0, status
+
+    rng = np.random.default_rng(42)
+    resultados = []
+    for concorrencia in concorrencias:
+        amostra = [user_ids[i] for i in rng.integers(len(user_ids), size=n_requisicoes)]
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(concorrencia) as executor:
+            respostas = list(executor.map(requisitar, amostra))
+        duracao = time.perf_counter() - inicio
+        linha = {
+            "concurrency": int(concorrencia),
+            "throughput_rps": n_requisicoes / duracao,
+            "latency_ms": _percentis(np.array([r[0] for r in respostas])),
+            "status": dict(Counter(r[1] for r in respostas)),
+        }
+        resultados.append(linha)
+        logger.info(
+            f"HTTP (concorrência {concorrencia}): {linha['throughput_rps']:.0f} req/s, "
+            f"p99={linha['latency_ms']['p99']:.1f} ms, status={linha['status']}"
+        )
+    return resultados
+
+
+def main(
+    model_dir: str = MODEL_DIR_LOGGED,
+    output_path: Optional[str] = BENCHMARK_PATH,
+    api_url: Optional[str] = os.getenv("BENCHMARK_API_URL"),
+) -> Dict[str, Any]:
+    model_path = os.path.join(model_dir, "model_logged_als.npz")
+    if os.path.exists(model_path):
+        with np.load(model_path) as data:
+            fatores = {"item_factors": data["item_factors"], "user_factors": data["user_factors"]}
+        origem = model_path
+    else:
+        logger.warning(f"Modelo não encontrado em {model_path}; usando fatores sintéticos.")
+        fatores = fatores_sinteticos(**SHAPE_SINTETICO)
+        origem = "synthetic"
+
+    resultado: Dict[str, Any] = {
+        "source": origem,
+        "cpu_count": os.cpu_count(),
+        "n_workers": RECOMMENDATION_WORKERS,
+        "blas_threads": RECOMMENDATION_BLAS_THREADS,
+        "executors": benchmark_executores(fatores["item_factors"], fatores["user_factors"]),
+    }
+    if api_url:
+        user_ids = [f"u{i}" for i in range(1000)]
+        mappings_path = config.SPARSE_MAPPINGS_PATH
+        if os.path.exists(mappings_path):
+            import pickle
+
+            with open(mappings_path, "rb") as f:
+                user_ids = list(pickle.load(f)["user_to_idx"])[:10_000]
+        resultado["http"] = benchmark_http(api_url.rstrip("/"), user_ids)
+
+    if output_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+        logger.info(f"Benchmark salvo em: {output_path}")
+    return resultado
+
+
+if __name__ == "__main__":
+    main()
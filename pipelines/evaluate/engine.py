@@ -0,0 +1,172 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from threadpoolctl import threadpool_limits
+from pipelines.utils.metrics import acumular_ranking, combinar_ranking
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Arrays memory-mapped do processo (preenchidos pelo inicializador do pool)
+_ARRAYS: Dict[str, np.ndarray] = {}
+
+
+def agrupar_ground_truth(
+    df_validacao: pd.DataFrame, users: np.ndarray, vocab: pd.Index
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Agrupa, uma única vez, os itens de validação de cada usuário em formato CSR.
+
+    Args:
+        df_validacao: DataFrame de validação com as colunas 'userId' e 'page'.
+        users: Usuários avaliados (define a ordem das linhas).
+        vocab: Índice de itens usado para codificar as recomendações. Itens de validação
+               fora do vocabulário recebem código -1 (contam no denominador do recall,
+               mas nunca são acertos).
+
+    Returns:
+        Tupla (codes, indptr): códigos dos itens distintos de cada usuário, concatenados,
+        e os offsets por usuário.
+    """
+    df_gt = df_validacao[["userId", "page"]].dropna()
+    rows = pd.Categorical(df_gt["userId"], categories=users).codes
+    df_gt = pd.DataFrame({"row": rows, "page": df_gt["page"].to_numpy()})
+    df_gt = df_gt[df_gt["row"] >= 0].drop_duplicates().sort_values("row", kind="stable")
+
+    counts = np.bincount(df_gt["row"].to_numpy(), minlength=len(users))
+    indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    codes = vocab.get_indexer(df_gt["page"].to_numpy()).astype(np.int64)
+    return codes, indptr
+
+
+def calcular_hits(
+    recs: np.ndarray, gt_codes: np.ndarray, gt_indptr: np.ndarray
+) -> np.ndarray:
+    """
+    Marca, por usuário, as posições da lista ranqueada que contêm itens do ground truth.
+
+    Args:
+        recs: Matriz (n_usuários x K) com os códigos dos itens recomendados, em ordem,
+              preenchida com -1 quando há menos de K recomendações.
+        gt_codes, gt_indptr: Ground truth em CSR (ver agrupar_ground_truth).
+
+    Returns:
+        Matriz booleana (n_usuários x K).
+    """
+    n_users = recs.shape[0]
+    base = int(max(recs.max(initial=-1), gt_codes.max(initial=-1))) + 1
+
+    # Pertinência vetorizada: chaves (linha, item) das recomendações x do ground truth
+    gt_rows = np.repeat(np.arange(n_users, dtype=np.int64), np.diff(gt_indptr))
+    valido = gt_codes >= 0
+    gt_keys = gt_rows[valido] * base + gt_codes[valido]
+    rec_keys = np.arange(n_users, dtype=np.int64)[:, None] * base + recs
+    return np.isin(rec_keys, gt_keys) & (recs >= 0)
+
+
+def avaliar_shard(
+    recs: np.ndarray,
+    gt_codes: np.ndarray,
+    gt_indptr: np.ndarray,
+    n_itens: int,
+    cutoffs: Iterable[int],
+) -> Dict[str, Any]:
+    """
+    Acumulador de métricas de ranking de um shard. Usuários sem itens de validação são
+    ignorados nas métricas por usuário, mas suas recomendações contam na cobertura.
+    """
+    hits = calcular_hits(recs, gt_codes, gt_indptr)
+    gt_len = np.diff(gt_indptr)
+    com_gt = gt_len > 0
+    return acumular_ranking(hits[com_gt], gt_len[com_gt], recs, n_itens, cutoffs)
+
+
+def salvar_arrays_mmap(diretorio: str, arrays: Dict[str, np.ndarray]) -> Dict[str, str]:
+    """
+    Grava os arrays em .npy para que os processos do pool os abram via memory-map
+    em vez de recebê-los serializados.
+
+    Returns:
+        Dicionário nome -> caminho do .npy.
+    """
+    caminhos = {}
+    for nome, array in arrays.items():
+        caminhos[nome] = os.path.join(diretorio, f"{nome}.npy")
+        np.save(caminhos[nome], np.asarray(array))
+    return caminhos
+
+
+def carregar_arrays_mmap(caminhos: Dict[str, str]) -> Dict[str, np.ndarray]:
+    return {nome: np.load(path, mmap_mode="r") for nome, path in caminhos.items()}
+
+
+def linhas_csr(
+    indptr: np.ndarray, indices: np.ndarray, data: Optional[np.ndarray],
+    start: int, end: int, n_cols: int,
+) -> sp.csr_matrix:
+    """
+    Recorta as linhas [start, end) de uma matriz CSR guardada em arrays (memory-mapped),
+    lendo apenas o trecho correspondente.
+    """
+    p0, p1 = int(indptr[start]), int(indptr[end])
+    ptr = np.asarray(indptr[start : end + 1], dtype=np.int64) - p0
+    idx = np.asarray(indices[p0:p1])
+    valores = np.ones(p1 - p0) if data is None else np.asarray(data[p0:p1])
+    return sp.csr_matrix((valores, idx, ptr), shape=(end - start, n_cols))
+
+
+def _init_worker(caminhos: Dict[str, str]) -> None:
+    """
+    Inicializa um processo do pool: limita o BLAS a uma thread e abre os arrays via memory-map.
+    """
+    threadpool_limits(1)
+    _ARRAYS.clear()
+    _ARRAYS.update(carregar_arrays_mmap(caminhos))
+
+
+def _executar_shard(
+    funcao: Callable[[Dict[str, np.ndarray], int, int], Dict[str, Any]], start: int, end: int
+) -> Dict[str, Any]:
+    return funcao(_ARRAYS, start, end)
+
+
+def executar_shards(
+    funcao: Callable[[Dict[str, np.ndarray], int, int], Dict[str, Any]],
+    n_linhas: int,
+    caminhos: Dict[str, str],
+    n_workers: Optional[int] = None,
+    shard_size: int = 50_000,
+) -> Dict[str, Any]:
+    """
+    Divide as linhas (usuários) em shards contíguos, avalia cada shard em um pool de
+    processos e combina os acumuladores retornados.
+
+    Args:
+        funcao: Função de nível de módulo (arrays, start, end) -> acumulador do shard.
+        n_linhas: Número total de usuários.
+        caminhos: Arrays .npy compartilhados (ver salvar_arrays_mmap).
+        n_workers: Número de processos. Se 1, avalia no próprio processo.
+        shard_size: Número de usuários por shard.
+
+    Returns:
+        Acumulador combinado.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    shards = [(i, min(i + shard_size, n_linhas)) for i in range(0, n_linhas, shard_size)]
+    if n_workers == 1 or len(shards) <= 1:
+        arrays = carregar_arrays_mmap(caminhos)
+        return combinar_ranking([funcao(arrays, s, e) for s, e in shards])
+
+    logger.info(f"Avaliando {len(shards)} shards em {n_workers} processos...")
+    with ProcessPoolExecutor(
+        max_workers=min(n_workers, len(shards)), initializer=_init_worker, initargs=(caminhos,)
+    ) as executor:
+        futures = [executor.submit(_executar_shard, funcao, s, e) for s, e in shards]
+        return combinar_ranking([f.result() for f in futures])
@@ -1,10 +1,26 @@
 import logging
-from typing import Optional, Dict, Any
+import tempfile
+from typing import Optional, Dict, Any, Iterable, Tuple
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 
-from script_shared.models.model_logged import recomendar_logged, load_model_logged
-from pipelines.utils.metrics import salvar_metricas_csv
+from script_shared.models.model_logged import load_model_logged, fatores_item
+from script_shared.models.quantization import QUANTIZACOES, Fatores, n_linhas, pontuar_itens
+from pipelines.train.foldin_logged import solve_user_factors
+from pipelines.evaluate.engine import (
+    agrupar_ground_truth,
+    avaliar_shard,
+    salvar_arrays_mmap,
+    linhas_csr,
+    executar_shards,
+)
+from pipelines.utils.metrics import (
+    CUTOFFS,
+    normalizar_cutoffs,
+    finalizar_ranking,
+    salvar_resultados,
+)
 
 MODEL_DIR_LOGGED = "/opt/airflow/shared/script_shared/models/logged"
 logger = logging.getLogger(__name__)
@@ -13,83 +29,216 @@ logging.basicConfig(
 )
 
 
+def vocab_itens(item_to_idx: Dict[str, int]) -> pd.Index:
+    """
+    Índice de itens na ordem dos índices do modelo (posição i = item de índice i).
+    """
+    idx = np.fromiter(item_to_idx.values(), dtype=np.int64, count=len(item_to_idx))
+    idx_to_item = np.empty(len(item_to_idx), dtype=object)
+    idx_to_item[idx] = list(item_to_idx.keys())
+    return pd.Index(idx_to_item)
+
+
+def montar_historico_lote(
+    df_users_logged: pd.DataFrame, users: np.ndarray, vocab: pd.Index
+) -> Tuple[sp.csr_matrix, np.ndarray]:
+    """
+    Monta, de uma vez, os vetores de interação (soma de final_score por item) de todos os
+    usuários avaliados, equivalente a get_user_vector aplicado a cada usuário.
+
+    Returns:
+        Tupla (matriz CSR usuários x itens do modelo, máscara dos usuários com histórico).
+    """
+    rows = pd.Categorical(df_users_logged["userId"], categories=users).codes
+    cols = vocab.get_indexer(df_users_logged["history"])
+    tem_historico = np.zeros(len(users), dtype=bool)
+    tem_historico[rows[rows >= 0]] = True
+
+    valido = (rows >= 0) & (cols >= 0)
+    user_items = sp.coo_matrix(
+        (
+            df_users_logged["final_score"].to_numpy(dtype=np.float64)[valido],
+            (rows[valido], cols[valido]),
+        ),
+        shape=(len(users), len(vocab)),
+    ).tocsr()
+    user_items.sum_duplicates()
+    return user_items, tem_historico
+
+
+def recomendar_por_fatores(
+    user_items: sp.csr_matrix,
+    item_factors: Fatores,
+    YtY: np.ndarray,
+    regularization: float,
+    top_k: int = 10,
+    max_scores: int = 1 << 25,
+) -> np.ndarray:
+    """
+    Gera recomendações para um lote de usuários com operações matriciais: fatores de
+    usuário recalculados a partir das confianças (mesmo sistema do ALS implícito),
+    pontuação por produto com os fatores de item e remoção dos itens já consumidos.
+
+    Args:
+        user_items: Confianças dos usuários (usuários x itens do modelo).
+        item_factors: Fatores de item do ALS (em ponto flutuante ou quantizados).
+        YtY: Produto item_factors.T @ item_factors.
+        regularization: Regularização do ALS.
+        top_k: Número de recomendações por usuário.
+        max_scores: Número máximo de scores (usuários x itens) materializados por bloco.
+
+    Returns:
+        Matriz (n_usuários x top_k) com os índices dos itens (item_to_idx), preenchida com -1.
+    """
+    user_factors = solve_user_factors(user_items, item_factors, YtY, regularization)
+
+    n_users, n_items = user_items.shape
+    k = min(top_k, n_items)
+    recs = np.full((n_users, top_k), -1, dtype=np.int64)
+    bloco = max(1, max_scores // max(n_items, 1))
+    for start in range(0, n_users, bloco):
+        end = min(start + bloco, n_users)
+        scores = pontuar_itens(item_factors, user_factors[start:end])
+        vistos = user_items[start:end]
+        scores[np.repeat(np.arange(end - start), np.diff(vistos.indptr)), vistos.indices] = -np.inf
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        ordem = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, ordem, axis=1)
+        top[np.take_along_axis(top_scores, ordem, axis=1) == -np.inf] = -1
+        recs[start:end, :k] = top
+    return recs
+
+
+def _avaliar_shard_logged(arrays: Dict[str, np.ndarray], start: int, end: int) -> Dict[str, Any]:
+    """
+    Avalia os usuários [start, end) a partir dos arrays memory-mapped e retorna o
+    acumulador de métricas do shard.
+    """
+    if "item_values" in arrays:
+        item_factors = {
+            "values": np.asarray(arrays["item_values"]),
+            "scales": np.asarray(arrays["item_scales"]) if "item_scales" in arrays else None,
+        }
+    else:
+        item_factors = np.asarray(arrays["item_factors"])
+    n_itens = n_linhas(item_factors)
+    cutoffs = np.asarray(arrays["cutoffs"]).tolist()
+    user_items = linhas_csr(
+        arrays["ui_indptr"], arrays["ui_indices"], arrays["ui_data"],
+        start, end, n_itens,
+    )
+    recs = recomendar_por_fatores(
+        user_items, item_factors, np.asarray(arrays["YtY"]),
+        float(arrays["regularization"]), max(cutoffs),
+    )
+    # Usuários sem histórico recebem o fallback vazio, como em recomendar_logged
+    recs[~np.asarray(arrays["tem_historico"][start:end])] = -1
+
+    gt_indptr = np.asarray(arrays["gt_indptr"][start : end + 1], dtype=np.int64)
+    gt_codes = np.asarray(arrays["gt_codes"][gt_indptr[0] : gt_indptr[-1]])
+    return avaliar_shard(
+        recs, gt_codes, gt_indptr - gt_indptr[0], n_itens, cutoffs
+    )
+
+
 def avaliar_modelo_logged(
     model_objs: Dict[str, Any],
     df_validacao: pd.DataFrame,
     df_users_logged: pd.DataFrame,
     top_k: int = 10,
-    max_users: Optional[int] = 10,
-) -> Dict[str, float]:
+    max_users: Optional[int] = None,
+    n_workers: Optional[int] = None,
+    shard_size: int = 50_000,
+    cutoffs: Iterable[int] = CUTOFFS,
+) -> Dict[str, Any]:
     """
-    Avalia o desempenho do modelo logado usando mean_recall e mean_ndcg.
+    Avalia o desempenho do modelo logado com recall, precision, NDCG, MRR, hit-rate e
+    cobertura do catálogo em vários cortes, a partir de uma lista ranqueada por usuário
+    com o tamanho do maior corte.
 
-    Para cada usuário presente no conjunto de validação (df_validacao) e no modelo,
-    gera recomendações (com base no modelo ALS) e compara com as interações reais (ground truth)
-    contidas em df_validacao. Calcula a média de recall e NDCG.
+    O ground truth e os vetores de histórico são agrupados uma única vez e gravados como
+    arrays .npy; os usuários são divididos em shards avaliados em um pool de processos,
+    que abrem os arrays (incluindo os fatores do modelo) via memory-map. Cada shard
+    retorna um acumulador (somas, contagens e histogramas) e os acumuladores são
+    combinados nas métricas finais.
 
     Args:
         model_objs: Dicionário com os artefatos do modelo logado.
         df_validacao: DataFrame de validação contendo, ao menos, as colunas 'userId' e 'page'.
         df_users_logged: DataFrame com as interações dos usuários logados (para gerar recomendações).
-        top_k: Número de recomendações consideradas (default 10).
+        top_k: Corte das métricas resumidas "mean_recall" e "mean_ndcg" (default 10).
         max_users: Se definido, limita a avaliação aos primeiros N usuários.
+        n_workers: Número de processos (default: número de CPUs; 1 avalia no próprio processo).
+        shard_size: Número de usuários por shard.
+        cutoffs: Cortes das métricas (top_k é sempre incluído).
 
     Returns:
-        Um dicionário com as métricas: "mean_recall" e "mean_ndcg".
+        Registro de resultados (ver finalizar_ranking).
     """
-    recall_scores = []
-    ndcg_scores = []
+    aux_dict = model_objs["aux_dict"]
+    model_als = model_objs["model_als"]
+    cutoffs = normalizar_cutoffs(cutoffs, top_k)
 
     # Usuários presentes tanto no modelo quanto no conjunto de validação
-    users_model = set(model_objs["aux_dict"]["user_to_idx"].keys())
-    users_valid = set(df_validacao["userId"].unique())
-    users_avaliacao = list(users_model.intersection(users_valid))
-
+    users_avaliacao = np.intersect1d(
+        np.array(list(aux_dict["user_to_idx"].keys()), dtype=object),
+        df_validacao["userId"].dropna().unique().astype(object),
+    )
     if max_users is not None:
         users_avaliacao = users_avaliacao[:max_users]
 
-    if not users_avaliacao:
+    if len(users_avaliacao) == 0:
         logger.warning("Nenhum usuário de validação encontrado no modelo.")
         return {"mean_recall": 0.0, "mean_ndcg": 0.0}
 
-    for user in users_avaliacao:
-        # Obter recomendações para o usuário
-        recs = recomendar_logged(user, model_objs, df_users_logged, top_k)
+    logger.info(f"Avaliando {len(users_avaliacao)} usuários logados em lote...")
+    vocab = vocab_itens(aux_dict["item_to_idx"])
+    user_items, tem_historico = montar_historico_lote(df_users_logged, users_avaliacao, vocab)
+    gt_codes, gt_indptr = agrupar_ground_truth(df_validacao, users_avaliacao, vocab)
 
-        # Ground truth: itens com os quais o usuário interagiu no conjunto de validação
-        ground_truth = list(set(df_validacao[df_validacao["userId"] == user]["page"]))
-        if not ground_truth:
-            continue
+    item_factors = fatores_item(model_objs)
+    if isinstance(item_factors, dict):
+        arrays_fatores = {"item_values": item_factors["values"]}
+        if item_factors["scales"] is not None:
+            arrays_fatores["item_scales"] = item_factors["scales"]
+    else:
+        arrays_fatores = {"item_factors": np.asarray(item_factors)}
+    user_items = user_items * getattr(model_als, "alpha", 1.0)
 
-        # Cálculo do Recall para o usuário
-        intersec = set(recs).intersection(set(ground_truth))
-        recall = len(intersec) / float(len(ground_truth))
-        recall_scores.append(recall)
-
-        # Cálculo do DCG para as recomendações (relevância binária: 1 se item estiver no ground truth, 0 caso contrário)
-        dcg = 0.0
-        for i, item in enumerate(recs):
-            if item in ground_truth:
-                dcg += 1.0 / np.log2(
-                    i + 2
-                )  # i+2 pois a posição inicia em 1 (log2(1+1)=log2(2))
-
-        # Cálculo do IDCG: soma dos melhores valores possíveis até top_k
-        ideal_count = min(len(ground_truth), top_k)
-        idcg = sum([1.0 / np.log2(i + 2) for i in range(ideal_count)])
-
-        ndcg = dcg / idcg if idcg > 0 else 0.0
-        ndcg_scores.append(ndcg)
-
-    mean_recall = np.mean(recall_scores) if recall_scores else 0.0
-    mean_ndcg = np.mean(ndcg_scores) if ndcg_scores else 0.0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        caminhos = salvar_arrays_mmap(
+            tmp_dir,
+            {
+                **arrays_fatores,
+                "YtY": model_als.YtY,
+                "regularization": np.array(model_als.regularization, dtype=np.float64),
+                "cutoffs": np.array(cutoffs, dtype=np.int64),
+                "ui_indptr": user_items.indptr,
+                "ui_indices": user_items.indices,
+                "ui_data": user_items.data,
+                "tem_historico": tem_historico,
+                "gt_codes": gt_codes,
+                "gt_indptr": gt_indptr,
+            },
+        )
+        acc = executar_shards(
+            _avaliar_shard_logged, len(users_avaliacao), caminhos, n_workers, shard_size
+        )
 
-    metrics = {"mean_recall": mean_recall, "mean_ndcg": mean_ndcg}
-    logger.info(f"Métricas de avaliação: {metrics}")
+    resultados = finalizar_ranking(acc, top_k)
+    logger.info(
+        f"Métricas de avaliação ({resultados['n_users']} usuários): "
+        f"{resultados['metrics']} | cobertura: {resultados['coverage']}"
+    )
 
-    # Salva as métricas em CSV sem apagar dados anteriores
-    salvar_metricas_csv(metrics, type_model="logged")
-    return metrics
+    # Modelos com fatores quantizados são gravados como "logged_<formato>", ao lado do float
+    type_model = "logged"
+    if model_objs.get("quantizacao"):
+        type_model = f"logged_{model_objs['quantizacao']}"
+    salvar_resultados(resultados, type_model=type_model)
+    return resultados
 
 
 def main():
@@ -105,15 +254,29 @@ def main():
         return
 
     try:
-        model_objs = load_model_logged(MODEL_DIR_LOGGED)
+        model_objs = load_model_logged(MODEL_DIR_LOGGED, quantizacao=None)
     except Exception as e:
         logger.error("Erro ao carregar o modelo logado", exc_info=e)
         return
 
-    avaliar_modelo_logged(
-        model_objs, df_validacao, df_users_logged, top_k=10, max_users=50
+    resultados = avaliar_modelo_logged(
+        model_objs, df_validacao, df_users_logged, top_k=10, max_users=None
     )
 
+    # Qualidade dos fatores quantizados em relação aos fatores em ponto flutuante
+    for tipo in QUANTIZACOES:
+        model_q = load_model_logged(MODEL_DIR_LOGGED, quantizacao=tipo)
+        if model_q["item_factors_q"] is None:
+            continue
+        resultados_q = avaliar_modelo_logged(
+            model_q, df_validacao, df_users_logged, top_k=10, max_users=None
+        )
+        logger.info(
+            f"Fatores {tipo}: recall@10 {resultados_q['mean_recall']:.4f} "
+            f"(float {resultados['mean_recall']:.4f}), ndcg@10 {resultados_q['mean_ndcg']:.4f} "
+            f"(float {resultados['mean_ndcg']:.4f})"
+        )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,324 @@
+import time
+import logging
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+
+import pandas as pd
+import numpy as np
+
+from script_shared import config
+from script_shared.models.model_logged import load_model_logged, fatores_item
+from script_shared.models.model_semianon import load_model_semianon
+from script_shared.models.model_anon import load_model_anon_heuristico
+from script_shared.models.routing import SEGMENTOS, rotear_usuarios, recomendar_roteado
+from script_shared.models.trending import criar_motor_tendencias, recomendar_anon_tendencias
+from script_shared.models.feature_store import criar_feature_store
+from script_shared.models.ann_index import buscar_ivf
+from script_shared.events import COLUNAS_INTERACAO, listar_particoes_eventos, carregar_eventos
+from pipelines.train.foldin_logged import solve_user_factors
+from pipelines.evaluate.engine import agrupar_ground_truth, avaliar_shard
+from pipelines.evaluate.evaluate_logged import (
+    vocab_itens,
+    montar_historico_lote,
+    recomendar_por_fatores,
+)
+from pipelines.evaluate.evaluate_semianon import tabela_clusters_lote
+from pipelines.utils.metrics import (
+    CUTOFFS,
+    normalizar_cutoffs,
+    combinar_ranking,
+    finalizar_ranking,
+    salvar_resultados,
+)
+
+REFINED_DIR = "/opt/airflow/shared/script_shared/data/refined"
+ANN_LOGGED_N_PROBE = config.ANN_LOGGED_N_PROBE
+
+# Partes do caminho do endpoint que a avaliação não reproduz: as recomendações por sessão
+# dependem das páginas da sessão atual, que não existem nos dados de validação
+NAO_REPRODUZIDO = ["session"]
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _remapear(codigos: np.ndarray, origem: pd.Index, destino: pd.Index) -> np.ndarray:
+    """Converte códigos de itens do vocabulário 'origem' para o vocabulário 'destino'."""
+    if not len(origem):
+        return np.full(codigos.shape, -1, dtype=np.int64)
+    mapa = destino.get_indexer(origem)
+    return np.where(codigos >= 0, mapa[np.maximum(codigos, 0)], -1)
+
+
+def lista_anon(models: Dict[str, Any], top_k: int) -> List[str]:
+    """
+    Lista dos anônimos sem sessão, como no endpoint: o ranking heurístico combinado às
+    tendências, se o motor de tendências estiver carregado.
+    """
+    if models.get("trending") is not None:
+        return recomendar_anon_tendencias(models["anon"], models["trending"], top_k=top_k)
+    return list(models["anon"].get("ranking_anon", []))[:top_k]
+
+
+def _recomendar_logged_lote(
+    users: np.ndarray, logged: Dict[str, Any], df_users_logged: pd.DataFrame, top_k: int
+) -> Tuple[np.ndarray, pd.Index]:
+    """
+    Recomendações do modelo logged em lote, com o índice ANN se carregado (como em
+    recomendar_logged). Usuários sem histórico recebem linhas vazias.
+    """
+    model_als = logged["model_als"]
+    vocab_logged = vocab_itens(logged["aux_dict"]["item_to_idx"])
+    user_items, tem_historico = montar_historico_lote(df_users_logged, users, vocab_logged)
+    user_items = user_items * getattr(model_als, "alpha", 1.0)
+
+    ann_index = logged.get("ann_index")
+    if ann_index is None:
+        recs = recomendar_por_fatores(
+            user_items, fatores_item(logged), model_als.YtY, model_als.regularization, top_k
+        )
+    else:
+        user_factors = solve_user_factors(
+            user_items, fatores_item(logged), model_als.YtY, model_als.regularization
+        )
+        recs = np.full((len(users), top_k), -1, dtype=np.int64)
+        for i in range(len(users)):
+            vistos = user_items.indices[user_items.indptr[i] : user_items.indptr[i + 1]]
+            ids, _ = buscar_ivf(ann_index, user_factors[i], top_k, ANN_LOGGED_N_PROBE, excluir=vistos)
+            recs[i, : len(ids)] = ids
+    recs[~tem_historico] = -1
+    return recs, vocab_logged
+
+
+def recomendar_segmento_lote(
+    segmento: str,
+    users: np.ndarray,
+    models: Dict[str, Any],
+    vocab: pd.Index,
+    top_k: int,
+) -> np.ndarray:
+    """
+    Gera em lote as recomendações dos usuários de um segmento, equivalentes às de
+    recomendar_segmento: semi-logados com cluster na feature store usam esse cluster e
+    usuários sem recomendações no seu segmento seguem para o próximo.
+
+    Returns:
+        Matriz (n_usuários x top_k) com códigos de itens em 'vocab', preenchida com -1.
+    """
+    if segmento == "logged":
+        recs, vocab_logged = _recomendar_logged_lote(
+            users, models["logged"], models["df_users_logged"], top_k
+        )
+        recs = _remapear(recs, vocab_logged, vocab)
+    elif segmento == "semianon":
+        semianon = models["semianon"]
+        tabela, linhas, vocab_semianon = tabela_clusters_lote(semianon, users, top_k)
+        feature_store = models.get("feature_store")
+        if feature_store is not None:
+            clusters = pd.Index(sorted(semianon["cluster_top_items"]))
+            for i, user in enumerate(users):
+                cluster = feature_store.cluster(user)
+                if cluster is not None and cluster in clusters:
+                    linhas[i] = clusters.get_loc(cluster)
+        recs = _remapear(tabela, vocab_semianon, vocab)[linhas]
+    else:
+        ranking = lista_anon(models, top_k)
+        linha = np.full(top_k, -1, dtype=np.int64)
+        linha[: len(ranking)] = vocab.get_indexer(ranking)
+        return np.tile(linha, (len(users), 1))
+
+    vazios = (recs < 0).all(axis=1)
+    if vazios.any():
+        proximo = SEGMENTOS[SEGMENTOS.index(segmento) + 1]
+        recs[vazios] = recomendar_segmento_lote(proximo, users[vazios], models, vocab, top_k)
+    return recs
+
+
+def medir_latencia(
+    users: np.ndarray, models: Dict[str, Any], num_recs: int
+) -> Dict[str, float]:
+    """
+    Mede a latência de recomendar_roteado (o mesmo caminho do endpoint) por usuário.
+
+    Returns:
+        Distribuição da latência em milissegundos (média, percentis e máximo).
+    """
+    latencias = np.empty(len(users))
+    for i, user in enumerate(users):
+        inicio = time.perf_counter()
+        recomendar_roteado(
+            user, num_recs, models["logged"], models["semianon"], models["anon"],
+            models["df_users_logged"], trending=models.get("trending"),
+            feature_store=models.get("feature_store"),
+        )
+        latencias[i] = (time.perf_counter() - inicio) * 1000.0
+
+    if not len(latencias):
+        return {"n": 0}
+    p50, p90, p95, p99 = np.percentile(latencias, [50, 90, 95, 99])
+    return {
+        "n": int(len(latencias)),
+        "mean": float(latencias.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(latencias.max()),
+    }
+
+
+def avaliar_roteamento(
+    models: Dict[str, Any],
+    df_validacao: pd.DataFrame,
+    top_k: int = 10,
+    cutoffs: Iterable[int] = CUTOFFS,
+    max_users: Optional[int] = None,
+    amostra_latencia: int = 200,
+    random_state: int = 42,
+) -> Dict[str, Any]:
+    """
+    Avaliação ponta a ponta: todos os usuários de validação são roteados como no endpoint
+    de recomendações (logged -> semianon -> anon), as recomendações de cada segmento são
+    geradas em lote e as métricas são calculadas por segmento e no total. A latência de
+    recomendar_roteado é medida em uma amostra de usuários de cada segmento.
+
+    A feature store, o motor de tendências e o índice ANN são usados quando presentes em
+    models, como no endpoint. As recomendações por sessão não são reproduzidas (ver
+    NAO_REPRODUZIDO): anônimos recebem sempre a lista sem sessão. O que foi reproduzido
+    é registrado em 'replay' no resultado.
+
+    Args:
+        models: Modelos carregados ("logged", "semianon", "anon" e "df_users_logged"; opcionalmente
+                "trending" e "feature_store").
+        df_validacao: DataFrame de validação com as colunas 'userId' e 'page'.
+        top_k: Corte das métricas resumidas e número de recomendações na medição de latência.
+        cutoffs: Cortes das métricas (top_k é sempre incluído).
+        max_users: Se definido, limita a avaliação aos primeiros N usuários.
+        amostra_latencia: Número máximo de usuários por segmento na medição de latência.
+        random_state: Semente da amostragem da latência.
+
+    Returns:
+        Registro de resultados do total (ver finalizar_ranking), com os resultados e a
+        latência de cada segmento em 'segments'.
+    """
+    cutoffs = normalizar_cutoffs(cutoffs, top_k)
+    max_k = cutoffs[-1]
+    rng = np.random.default_rng(random_state)
+
+    users = np.sort(df_validacao["userId"].dropna().unique().astype(object))
+    if max_users is not None:
+        users = users[:max_users]
+    segmentos = rotear_usuarios(
+        users, models["logged"], models["semianon"], models.get("feature_store")
+    )
+
+    # Usuários agrupados por segmento (blocos contíguos de linhas)
+    ordem = np.argsort(pd.Categorical(segmentos, categories=SEGMENTOS).codes, kind="stable")
+    users, segmentos = users[ordem], segmentos[ordem]
+
+    # Vocabulário único: itens do modelo logged, dos clusters, do ranking anônimo e da validação
+    extras = [np.asarray(v, dtype=object) for v in models["semianon"]["cluster_top_items"].values()]
+    extras.append(np.asarray(list(models["anon"].get("ranking_anon", []))[:max_k], dtype=object))
+    extras.append(np.asarray(lista_anon(models, max_k), dtype=object))
+    extras.append(df_validacao["page"].dropna().unique().astype(object))
+    extras = pd.Index(pd.unique(np.concatenate(extras)))
+    vocab = vocab_itens(models["logged"]["aux_dict"]["item_to_idx"])
+    vocab = vocab.append(extras.difference(vocab))
+    gt_codes, gt_indptr = agrupar_ground_truth(df_validacao, users, vocab)
+
+    acumuladores: List[Dict[str, Any]] = []
+    resultados_segmentos = {}
+    for segmento in SEGMENTOS:
+        linhas = np.flatnonzero(segmentos == segmento)
+        if not len(linhas):
+            continue
+        start, end = linhas[0], linhas[-1] + 1
+        users_seg = users[start:end]
+        logger.info(f"Avaliando {len(users_seg)} usuários do segmento {segmento}...")
+
+        inicio = time.perf_counter()
+        recs = recomendar_segmento_lote(segmento, users_seg, models, vocab, max_k)
+        segundos_lote = time.perf_counter() - inicio
+
+        indptr = gt_indptr[start : end + 1]
+        acc = avaliar_shard(
+            recs, gt_codes[indptr[0] : indptr[-1]], indptr - indptr[0], len(vocab), cutoffs
+        )
+        acumuladores.append(acc)
+
+        amostra = rng.choice(users_seg, min(amostra_latencia, len(users_seg)), replace=False)
+        resultados_segmentos[segmento] = {
+            **finalizar_ranking(acc, top_k),
+            "n_routed": int(len(users_seg)),
+            "batch_seconds": segundos_lote,
+            "latency_ms": medir_latencia(amostra, models, top_k),
+        }
+        logger.info(
+            f"Segmento {segmento}: recall@{top_k}={resultados_segmentos[segmento]['mean_recall']:.4f}, "
+            f"ndcg@{top_k}={resultados_segmentos[segmento]['mean_ndcg']:.4f}, "
+            f"latência (ms)={resultados_segmentos[segmento]['latency_ms']}"
+        )
+
+    if not acumuladores:
+        logger.warning("Nenhum usuário de validação encontrado.")
+        return {"mean_recall": 0.0, "mean_ndcg": 0.0}
+
+    resultados = finalizar_ranking(combinar_ranking(acumuladores), top_k)
+    resultados["segments"] = resultados_segmentos
+    resultados["replay"] = {
+        "feature_store": models.get("feature_store") is not None,
+        "trending": models.get("trending") is not None,
+        "ann": models["logged"].get("ann_index") is not None,
+        "not_replayed": NAO_REPRODUZIDO,
+    }
+    logger.info(f"Métricas ponta a ponta ({resultados['n_users']} usuários): {resultados['metrics']}")
+
+    salvar_resultados(resultados, type_model="routing")
+    return resultados
+
+
+def estado_online(semianon_model: Dict[str, Any], anon_model: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Motor de tendências e feature store habilitados na configuração da API, alimentados
+    com os eventos já gravados por POST /events (o estado em memória da API não é salvo).
+    """
+    trending = (
+        criar_motor_tendencias(config.TRENDING_PARAMS, anon_model["catalogo"])
+        if config.TRENDING_ENABLED else None
+    )
+    feature_store = (
+        criar_feature_store(semianon_model, config.FEATURE_STORE_PARAMS)
+        if config.FEATURE_STORE_ENABLED else None
+    )
+    df_eventos = carregar_eventos(listar_particoes_eventos())
+    if len(df_eventos):
+        eventos = list(df_eventos[COLUNAS_INTERACAO].itertuples(index=False, name=None))
+        for consumidor in (trending, feature_store):
+            if consumidor is not None:
+                consumidor.registrar_eventos(eventos)
+    logger.info(f"{len(df_eventos)} eventos reaplicados ao estado online.")
+    return {"trending": trending, "feature_store": feature_store}
+
+
+def main():
+    try:
+        df_validacao = pd.read_parquet(
+            f"{REFINED_DIR}/validacao.parquet", columns=["userId", "page"]
+        )
+        models = {
+            "logged": load_model_logged(config.MODEL_DIR_LOGGED),
+            "semianon": load_model_semianon(config.MODEL_DIR_SEMIANON),
+            "anon": load_model_anon_heuristico(config.MODEL_DIR_ANON_HEURISTICO),
+            "df_users_logged": pd.read_parquet(config.USERS_LOGGED),
+        }
+        models.update(estado_online(models["semianon"], models["anon"]))
+    except Exception as e:
+        logger.error("Erro ao carregar dados ou modelos para a avaliação ponta a ponta", exc_info=e)
+        return
+
+    avaliar_roteamento(models, df_validacao, top_k=10)
+
+
+if __name__ == "__main__":
+    main()
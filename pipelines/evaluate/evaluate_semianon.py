@@ -1,11 +1,24 @@
 import logging
-from typing import Optional, Dict, Any
+import tempfile
+from typing import Optional, Dict, Any, Iterable, Tuple
 
 import pandas as pd
 import numpy as np
 
-from script_shared.models.model_semianon import recomendar_semianon, load_model_semianon
-from pipelines.utils.metrics import salvar_metricas_csv
+from script_shared.models.model_semianon import load_model_semianon
+from pipelines.evaluate.engine import (
+    agrupar_ground_truth,
+    avaliar_shard,
+    salvar_arrays_mmap,
+    executar_shards,
+)
+from pipelines.utils.metrics import (
+    CUTOFFS,
+    normalizar_cutoffs,
+    finalizar_ranking,
+    salvar_resultados,
+    salvar_metricas,
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -13,80 +26,143 @@ logging.basicConfig(
 )
 
 
+def tabela_clusters_lote(
+    model_objs: Dict[str, Any], users: np.ndarray, top_k: int = 10
+) -> Tuple[np.ndarray, np.ndarray, pd.Index]:
+    """
+    Monta a tabela (clusters x top_k) de códigos dos itens populares de cada cluster e a
+    linha da tabela de cada usuário (a última linha, vazia, para usuários sem cluster),
+    como em recomendar_semianon.
+
+    Returns:
+        Tupla (tabela preenchida com -1, linha por usuário, vocabulário de itens dos códigos).
+    """
+    cluster_top_items = model_objs["cluster_top_items"]
+    listas = [np.asarray(v, dtype=object) for v in cluster_top_items.values()]
+    vocab = pd.Index(pd.unique(np.concatenate(listas)) if listas else [], dtype=object)
+
+    clusters = sorted(cluster_top_items)
+    tabela = np.full((len(clusters) + 1, top_k), -1, dtype=np.int64)  # última linha: sem cluster
+    for pos, cluster in enumerate(clusters):
+        codigos = vocab.get_indexer(list(cluster_top_items[cluster])[:top_k])
+        tabela[pos, : len(codigos)] = codigos
+
+    # Primeiro registro de cada usuário, como em recomendar_semianon
+    df_features = model_objs["df_features"].drop_duplicates("userId")
+    cluster_user = (
+        df_features.set_index("userId")["cluster"].reindex(users).to_numpy(dtype=float)
+    )
+    pos_user = pd.Index(clusters).get_indexer(cluster_user)
+    return tabela, np.where(pos_user >= 0, pos_user, len(clusters)), vocab
+
+
+def recomendar_semianon_lote(
+    model_objs: Dict[str, Any], users: np.ndarray, top_k: int = 10
+) -> Tuple[np.ndarray, pd.Index]:
+    """
+    Gera as recomendações de um lote de usuários semi-logados por indexação na tabela
+    de itens populares por cluster.
+
+    Returns:
+        Tupla (matriz n_usuários x top_k de códigos de itens, preenchida com -1;
+        vocabulário de itens dos códigos).
+    """
+    tabela, linhas, vocab = tabela_clusters_lote(model_objs, users, top_k)
+    return tabela[linhas], vocab
+
+
+def _avaliar_shard_semianon(
+    arrays: Dict[str, np.ndarray], start: int, end: int
+) -> Dict[str, Any]:
+    """
+    Avalia os usuários [start, end) a partir dos arrays memory-mapped e retorna o
+    acumulador de métricas do shard.
+    """
+    recs = np.asarray(arrays["tabela"])[np.asarray(arrays["linhas"][start:end])]
+    gt_indptr = np.asarray(arrays["gt_indptr"][start : end + 1], dtype=np.int64)
+    gt_codes = np.asarray(arrays["gt_codes"][gt_indptr[0] : gt_indptr[-1]])
+    return avaliar_shard(
+        recs, gt_codes, gt_indptr - gt_indptr[0], int(arrays["n_itens"]),
+        np.asarray(arrays["cutoffs"]).tolist(),
+    )
+
+
 def avaliar_modelo_semianon(
     model_objs: Dict[str, Any],
     df_validacao: pd.DataFrame,
     df_users_semianon: pd.DataFrame,
     top_k: int = 10,
-    max_users: Optional[int] = 10,
-) -> Dict[str, float]:
+    max_users: Optional[int] = None,
+    n_workers: Optional[int] = None,
+    shard_size: int = 50_000,
+    cutoffs: Iterable[int] = CUTOFFS,
+) -> Dict[str, Any]:
     """
-    Avalia o desempenho do modelo semianon usando mean_recall e mean_ndcg.
+    Avalia o desempenho do modelo semianon com recall, precision, NDCG, MRR, hit-rate e
+    cobertura do catálogo em vários cortes. O catálogo da cobertura é formado pelos itens
+    recomendados a algum cluster e pelos itens de validação.
 
-    Para cada usuário presente no conjunto de validação (df_validacao) e no modelo semianon,
-    gera recomendações (com base no clustering) e compara com as interações reais (ground truth)
-    contidas em df_validacao. Calcula a média de recall e NDCG.
+    O ground truth é agrupado uma única vez e, com a tabela de itens por cluster, gravado
+    como arrays .npy; os usuários são divididos em shards avaliados em um pool de
+    processos (arrays abertos via memory-map), cujos acumuladores são combinados.
 
     Args:
         model_objs: Dicionário com os artefatos do modelo semianon.
         df_validacao: DataFrame de validação contendo, ao menos, as colunas 'userId' e 'page'.
         df_users_semianon: DataFrame com as features dos usuários semianon (utilizado para gerar recomendações).
-        top_k: Número de recomendações consideradas (default 10).
+        top_k: Corte das métricas resumidas "mean_recall" e "mean_ndcg" (default 10).
         max_users: Se definido, limita a avaliação aos primeiros N usuários.
-        csv_path: Caminho do CSV onde as métricas serão salvas.
+        n_workers: Número de processos (default: número de CPUs; 1 avalia no próprio processo).
+        shard_size: Número de usuários por shard.
+        cutoffs: Cortes das métricas (top_k é sempre incluído).
 
     Returns:
-        Um dicionário com as métricas: "mean_recall" e "mean_ndcg".
+        Registro de resultados (ver finalizar_ranking).
     """
-    recall_scores = []
-    ndcg_scores = []
+    cutoffs = normalizar_cutoffs(cutoffs, top_k)
 
     # Considera os usuários presentes no modelo semianon (df_features salvo em model_objs)
-    users_model = set(model_objs["df_features"]["userId"].unique())
-    users_valid = set(df_validacao["userId"].unique())
-    users_avaliacao = list(users_model.intersection(users_valid))
-
+    users_avaliacao = np.intersect1d(
+        model_objs["df_features"]["userId"].dropna().unique().astype(object),
+        df_validacao["userId"].dropna().unique().astype(object),
+    )
     if max_users is not None:
         users_avaliacao = users_avaliacao[:max_users]
 
-    if not users_avaliacao:
+    if len(users_avaliacao) == 0:
         logger.warning("Nenhum usuário de validação encontrado no modelo semianon.")
         metrics = {"mean_recall": 0.0, "mean_ndcg": 0.0}
-        salvar_metricas_csv(metrics, type_model="semianon")
+        salvar_metricas(metrics, type_model="semianon")
         return metrics
 
-    for user in users_avaliacao:
-        # Obter recomendações para o usuário a partir do modelo semianon
-        recs = recomendar_semianon(user, model_objs, top_k)
-
-        # Ground truth: itens com os quais o usuário interagiu no conjunto de validação
-        ground_truth = list(set(df_validacao[df_validacao["userId"] == user]["page"]))
-        if not ground_truth:
-            continue
-
-        # Cálculo do Recall para o usuário
-        intersec = set(recs).intersection(set(ground_truth))
-        recall = len(intersec) / float(len(ground_truth))
-        recall_scores.append(recall)
-
-        # Cálculo do DCG (Discounted Cumulative Gain) para as recomendações (relevância binária)
-        dcg = 0.0
-        for i, item in enumerate(recs):
-            if item in ground_truth:
-                dcg += 1.0 / np.log2(i + 2)  # i+2 pois a posição inicia em 1
-        # Cálculo do IDCG (Ideal DCG) para as primeiras top_k posições
-        ideal_count = min(len(ground_truth), top_k)
-        idcg = sum([1.0 / np.log2(i + 2) for i in range(ideal_count)])
-        ndcg = dcg / idcg if idcg > 0 else 0.0
-        ndcg_scores.append(ndcg)
-
-    mean_recall = np.mean(recall_scores) if recall_scores else 0.0
-    mean_ndcg = np.mean(ndcg_scores) if ndcg_scores else 0.0
-    metrics = {"mean_recall": mean_recall, "mean_ndcg": mean_ndcg}
-
-    logger.info(f"Métricas de avaliação semianon: {metrics}")
-    salvar_metricas_csv(metrics, type_model="semianon")
-    return metrics
+    logger.info(f"Avaliando {len(users_avaliacao)} usuários semianon em lote...")
+    tabela, linhas, vocab = tabela_clusters_lote(model_objs, users_avaliacao, max(cutoffs))
+    vocab = vocab.append(pd.Index(df_validacao["page"].dropna().unique()).difference(vocab))
+    gt_codes, gt_indptr = agrupar_ground_truth(df_validacao, users_avaliacao, vocab)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        caminhos = salvar_arrays_mmap(
+            tmp_dir,
+            {
+                "tabela": tabela,
+                "linhas": linhas,
+                "gt_codes": gt_codes,
+                "gt_indptr": gt_indptr,
+                "n_itens": np.array(len(vocab), dtype=np.int64),
+                "cutoffs": np.array(cutoffs, dtype=np.int64),
+            },
+        )
+        acc = executar_shards(
+            _avaliar_shard_semianon, len(users_avaliacao), caminhos, n_workers, shard_size
+        )
+
+    resultados = finalizar_ranking(acc, top_k)
+    logger.info(
+        f"Métricas de avaliação semianon ({resultados['n_users']} usuários): "
+        f"{resultados['metrics']} | cobertura: {resultados['coverage']}"
+    )
+    salvar_resultados(resultados, type_model="semianon")
+    return resultados
 
 
 def main():
@@ -104,7 +180,7 @@ def main():
         return
 
     avaliar_modelo_semianon(
-        model_objs, df_validacao, df_users_semianon, top_k=10, max_users=50
+        model_objs, df_validacao, df_users_semianon, top_k=10, max_users=None
     )
 
 
@@ -1,6 +1,7 @@
 import os
 import logging
 import glob
+from typing import List
 
 import pandas as pd
 import numpy as np
@@ -8,7 +9,12 @@ from pipelines.process_type_user import (
     process_type_logged,
     process_type_semianon,
     build_and_save_sparse_matrix,
+    update_sparse_matrix_incremental,
+    load_sparse_mappings,
 )
+from pipelines.process_validacao import parse_validacao_file
+from script_shared.artifacts import chave_artefato, artefato_reutilizavel, registrar_artefato
+from script_shared.events import listar_particoes_eventos, carregar_eventos
 
 # Configuração do logger
 logger = logging.getLogger(__name__)
@@ -24,6 +30,32 @@ VALIDACAO_PATH = ("/opt/airflow/shared/script_shared/data/raw/validacao.csv")
 REFINED_DIR = ("/opt/airflow/shared/script_shared/data/refined")
 STAGE_DIR = ("/opt/airflow/shared/script_shared/data/stage")
 
+# Arquivos Parquet gerados pelo modo streaming do download (mesma estrutura do ZIP)
+STAGE_USER_PATH = f"{STAGE_DIR}/files/treino/"
+STAGE_ITEM_PATH = f"{STAGE_DIR}/itens/itens/"
+STAGE_VALIDACAO_PATH = f"{STAGE_DIR}/validacao.parquet"
+
+# Origem das partições: "streaming" lê os Parquet de stage; "extract" lê os CSVs de raw
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "extract")
+
+SPARSE_MATRIX_PATH = f"{REFINED_DIR}/user_item_sparse_mat_logged.npz"
+SPARSE_MAPPINGS_PATH = f"{REFINED_DIR}/user_item_mappings_logged.pkl"
+
+# Módulos cujo código gera os artefatos de refined (entram na chave do registro de artefatos)
+PROCESS_MODULES = [
+    "pipelines.process_data",
+    "pipelines.process_type_user",
+    "pipelines.process_validacao",
+]
+
+DEFAULT_ENGAGEMENT_PARAMS = {
+    "w_time": 0.25,
+    "w_clicks": 1.7,
+    "w_scroll": 0.35,
+    "w_visits": 2.2,
+    "dias_limite": 30,
+}
+
 def tratar_outliers_users(df: pd.DataFrame) -> pd.DataFrame:
     """
     Remove outliers do dataset de usuários com base no percentil 99 para colunas específicas.
@@ -74,35 +106,48 @@ def salvar_dataframe(df: pd.DataFrame, nome_arquivo: str) -> None:
     logger.info(f"✅ {nome_arquivo} salvo em: {caminho_arquivo}")
 
 
-def processar_usuarios(engagement_params: dict = None) -> None:
+def listar_particoes(raw_dir: str, stage_dir: str) -> List[str]:
     """
-    Processa e salva os dados de usuários.
+    Lista as partições de entrada conforme o modo do download: os Parquet do diretório stage
+    no modo streaming (recorrendo aos CSVs de raw se não houver nenhum) ou os CSVs extraídos
+    em raw no modo extract, ignorando arquivos de stage de execuções anteriores.
 
     Args:
-        engagement_params: Dicionário com parâmetros de engajamento. Se None, utiliza os valores padrão.
-                          Valores padrão: {"w_time": 0.25, "w_clicks": 1.7, "w_scroll": 0.35, "w_visits": 2.2, "dias_limite": 30}
+        raw_dir: Diretório com os CSVs extraídos.
+        stage_dir: Diretório com os Parquet convertidos.
+
+    Returns:
+        Lista de caminhos das partições.
     """
-    engagement_params = engagement_params or {
-        "w_time": 0.25,
-        "w_clicks": 1.7,
-        "w_scroll": 0.35,
-        "w_visits": 2.2,
-        "dias_limite": 30,
-    }
+    if DOWNLOAD_MODE == "streaming":
+        parquet_paths = sorted(glob.glob(stage_dir + "*.parquet"))
+        if parquet_paths:
+            logger.info(f"Usando {len(parquet_paths)} partições Parquet de: {stage_dir}")
+            return parquet_paths
+        logger.warning(f"Nenhuma partição Parquet em {stage_dir}; usando os CSVs de: {raw_dir}")
+    return sorted(glob.glob(raw_dir + "*.csv"))
 
-    logger.info("Carregando dados de usuários...")
-    csv_paths = glob.glob((RAW_USER_PATH) + "*.csv") 
 
-    if not csv_paths:
-        logger.error(f"Nenhum arquivo CSV encontrado em: {str(RAW_USER_PATH)}")
-        return
+def ler_particao(path: str) -> pd.DataFrame:
+    """
+    Lê uma partição de entrada em CSV ou Parquet, conforme a extensão do arquivo.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, delimiter=",")
 
-    dfs = [pd.read_csv(p, delimiter=",") for p in csv_paths]
-    if not dfs:
-        logger.error("Nenhum DataFrame foi carregado. Abortando.")
-        return
 
-    dfs = [pd.read_csv(p, delimiter=",") for p in csv_paths]
+def carregar_usuarios(csv_paths: List[str]) -> pd.DataFrame:
+    """
+    Lê as partições de usuários, explode as colunas de listas e remove outliers.
+
+    Args:
+        csv_paths: Lista de arquivos CSV ou Parquet (partições) de usuários.
+
+    Returns:
+        DataFrame com uma linha por interação, já sem outliers e com strings limpas.
+    """
+    dfs = [ler_particao(p) for p in csv_paths]
     df_users_raw = pd.concat(dfs, ignore_index=True)
 
     # Explodir colunas com listas
@@ -140,6 +185,69 @@ def processar_usuarios(engagement_params: dict = None) -> None:
     df_users_clean[string_cols] = df_users_clean[string_cols].apply(
         lambda x: x.str.strip()
     )
+    return df_users_clean
+
+
+def carregar_interacoes(csv_paths: List[str], event_paths: List[str]) -> pd.DataFrame:
+    """
+    Interações das partições de usuários (ver carregar_usuarios) acrescidas dos eventos
+    recebidos pela API (POST /events), que já estão no formato de uma linha por leitura.
+
+    Args:
+        csv_paths: Partições de usuários (CSV ou Parquet).
+        event_paths: Arquivos Parquet de eventos.
+
+    Returns:
+        DataFrame com uma linha por interação.
+    """
+    partes = []
+    if csv_paths:
+        partes.append(carregar_usuarios(csv_paths))
+    if event_paths:
+        df_eventos = carregar_eventos(event_paths)
+        logger.info(f"{len(df_eventos)} interações de {len(event_paths)} arquivos de eventos.")
+        partes.append(df_eventos)
+    return pd.concat(partes, ignore_index=True)
+
+
+def eventos_pendentes(mappings_path: str = SPARSE_MAPPINGS_PATH) -> List[str]:
+    """
+    Arquivos de eventos ainda não aplicados à matriz esparsa, segundo as partições
+    registradas nos mapeamentos.
+    """
+    mappings = load_sparse_mappings(mappings_path) or {}
+    aplicadas = set(mappings.get("partitions", []))
+    return [p for p in listar_particoes_eventos() if os.path.basename(p) not in aplicadas]
+
+
+def processar_usuarios(engagement_params: dict = None) -> None:
+    """
+    Processa e salva os dados de usuários.
+
+    Args:
+        engagement_params: Dicionário com parâmetros de engajamento. Se None, utiliza os valores padrão.
+                          Valores padrão: {"w_time": 0.25, "w_clicks": 1.7, "w_scroll": 0.35, "w_visits": 2.2, "dias_limite": 30}
+    """
+    engagement_params = engagement_params or DEFAULT_ENGAGEMENT_PARAMS
+
+    logger.info("Carregando dados de usuários...")
+    csv_paths = listar_particoes(RAW_USER_PATH, STAGE_USER_PATH)
+
+    if not csv_paths:
+        logger.error(f"Nenhum arquivo CSV encontrado em: {str(RAW_USER_PATH)}")
+        return
+
+    saidas = [
+        f"{REFINED_DIR}/{nome}.parquet"
+        for nome in ["users_clean", "users_logged", "users_semianon", "users_semianon_raw"]
+    ] + [SPARSE_MATRIX_PATH, SPARSE_MAPPINGS_PATH]
+    event_paths = listar_particoes_eventos()
+    chave = chave_artefato(csv_paths + event_paths, engagement_params, PROCESS_MODULES)
+    if artefato_reutilizavel(REFINED_DIR, "usuarios", chave):
+        logger.info("Partições de usuários inalteradas; artefatos reaproveitados.")
+        return
+
+    df_users_clean = carregar_interacoes(csv_paths, event_paths)
 
     # Processar usuários logados e semi-anônimos
     df_users_logged = process_type_logged(df_users_clean, engagement_params)
@@ -159,8 +267,67 @@ def processar_usuarios(engagement_params: dict = None) -> None:
     salvar_dataframe(df_semianon_raw, "users_semianon_raw")
 
     # Construir e salvar a matriz esparsa dos usuários logados
-    output_sparse_path = f"{REFINED_DIR}/user_item_sparse_mat_logged.npz"
-    build_and_save_sparse_matrix(df_users_logged, output_sparse_path)
+    build_and_save_sparse_matrix(
+        df_users_logged,
+        SPARSE_MATRIX_PATH,
+        mappings_path=SPARSE_MAPPINGS_PATH,
+        partitions=[os.path.basename(p) for p in csv_paths + event_paths],
+    )
+    registrar_artefato(
+        REFINED_DIR,
+        "usuarios",
+        chave,
+        saidas,
+        {"n_users_logged": int(df_users_logged["userId"].nunique())},
+    )
+
+
+def processar_usuarios_incremental(
+    csv_paths: List[str],
+    engagement_params: dict = None,
+    decay: float = 1.0,
+    incluir_eventos: bool = True,
+) -> None:
+    """
+    Aplica novas partições de usuários à matriz esparsa dos usuários logados existente,
+    com custo proporcional ao volume das novas interações. Os arquivos de eventos gravados
+    pela API e ainda não aplicados entram no mesmo delta. As interações novas também são
+    acrescentadas a users_logged.parquet, o histórico lido pela API.
+
+    Caso a matriz ou os mapeamentos ainda não existam, executa o processamento completo.
+    A matriz atualizada deixa de corresponder ao registro de artefatos, de modo que o
+    próximo processamento completo a reconstrói.
+
+    Args:
+        csv_paths: Arquivos CSV (partições) com as novas interações.
+        engagement_params: Parâmetros de engajamento. Se None, utiliza os valores padrão.
+        decay: Fator aplicado às interações antigas antes da soma do delta (1.0 = sem decaimento).
+        incluir_eventos: Se True, inclui os arquivos de eventos pendentes (ver eventos_pendentes).
+    """
+    engagement_params = engagement_params or DEFAULT_ENGAGEMENT_PARAMS
+
+    if not (os.path.exists(SPARSE_MATRIX_PATH) and os.path.exists(SPARSE_MAPPINGS_PATH)):
+        logger.warning("Matriz esparsa inexistente; executando processamento completo.")
+        processar_usuarios(engagement_params)
+        return
+
+    event_paths = eventos_pendentes(SPARSE_MAPPINGS_PATH) if incluir_eventos else []
+    if not csv_paths and not event_paths:
+        logger.info("Nenhuma partição nova informada.")
+        return
+
+    logger.info(f"Aplicando {len(csv_paths) + len(event_paths)} partições novas à matriz esparsa...")
+    df_users_clean = carregar_interacoes(csv_paths, event_paths)
+    df_delta_logged = process_type_logged(df_users_clean, engagement_params)
+
+    update_sparse_matrix_incremental(
+        df_delta_logged,
+        SPARSE_MATRIX_PATH,
+        SPARSE_MAPPINGS_PATH,
+        decay=decay,
+        partitions=[os.path.basename(p) for p in csv_paths + event_paths],
+        history_path=f"{REFINED_DIR}/users_logged.parquet",
+    )
 
 
 def processar_itens() -> None:
@@ -168,9 +335,14 @@ def processar_itens() -> None:
     Processa e salva os dados dos itens.
     """
     logger.info("Processando itens...")
-    csv_paths = glob.glob(RAW_ITEM_PATH + "*.csv")
-    
-    dfs = [pd.read_csv(p, delimiter=",") for p in csv_paths]
+    csv_paths = listar_particoes(RAW_ITEM_PATH, STAGE_ITEM_PATH)
+    caminho_arquivo = f"{REFINED_DIR}/items.parquet"
+    chave = chave_artefato(csv_paths, {}, PROCESS_MODULES)
+    if artefato_reutilizavel(REFINED_DIR, "itens", chave):
+        logger.info("Partições de itens inalteradas; artefato reaproveitado.")
+        return
+
+    dfs = [ler_particao(p) for p in csv_paths]
     df_items = pd.concat(dfs, ignore_index=True)
 
     # Limpar espaços em branco em colunas de string
@@ -178,50 +350,36 @@ def processar_itens() -> None:
     df_items[string_cols] = df_items[string_cols].apply(lambda x: x.str.strip())
 
     salvar_dataframe(df_items, "items")
+    registrar_artefato(
+        REFINED_DIR, "itens", chave, [caminho_arquivo], {"n_items": len(df_items)}
+    )
 
 
 def processar_validacao() -> None:
     """
     Processa e salva os dados de validação.
     """
-    if not os.path.exists(VALIDACAO_PATH):
+    validacao_path = (
+        STAGE_VALIDACAO_PATH
+        if DOWNLOAD_MODE == "streaming" and os.path.exists(STAGE_VALIDACAO_PATH)
+        else VALIDACAO_PATH
+    )
+    if not os.path.exists(validacao_path):
         logger.error(f"❌ Arquivo de validação não encontrado: {VALIDACAO_PATH}")
         return
 
-    logger.info("Processando dados de validação...")
-    df_validacao = pd.read_csv(VALIDACAO_PATH, delimiter=",")
-
-    # Tratar colunas de listas
-    list_columns = ["history", "timestampHistory"]
-    for col in list_columns:
-        df_validacao[col] = (
-            df_validacao[col]
-            .astype(str)
-            .str.replace(r"[\n\[\]\'\"]", "", regex=True)
-            .str.strip()
-            .str.split()
-        )
-
-    # Explodir colunas para criar uma linha por interação do usuário
-    df_validacao = df_validacao.explode(list_columns)
+    caminho_arquivo = f"{REFINED_DIR}/validacao.parquet"
+    chave = chave_artefato([validacao_path], {}, PROCESS_MODULES)
+    if artefato_reutilizavel(REFINED_DIR, "validacao", chave):
+        logger.info("Arquivo de validação inalterado; artefato reaproveitado.")
+        return
 
-    # Converter timestampHistory para datetime
-    df_validacao["timestampHistory"] = pd.to_numeric(
-        df_validacao["timestampHistory"], errors="coerce"
-    )
-    df_validacao["timestampHistory"] = pd.to_datetime(
-        df_validacao["timestampHistory"], unit="ms"
+    logger.info("Processando dados de validação...")
+    n_rows = parse_validacao_file(validacao_path, caminho_arquivo)
+    registrar_artefato(
+        REFINED_DIR, "validacao", chave, [caminho_arquivo], {"n_interactions": n_rows}
     )
 
-    # Renomear a coluna 'history' para 'page'
-    df_validacao.rename(columns={"history": "page"}, inplace=True)
-
-    # Limpar espaços em branco em colunas de string
-    string_cols = df_validacao.select_dtypes(include="object").columns
-    df_validacao[string_cols] = df_validacao[string_cols].apply(lambda x: x.str.strip())
-
-    salvar_dataframe(df_validacao, "validacao")
-
 
 def main() -> None:
     """
@@ -1,9 +1,11 @@
+import os
+import pickle
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
 import pandas as pd
 import numpy as np
-from scipy.sparse import csr_matrix, save_npz
+from scipy.sparse import csr_matrix, load_npz, save_npz
 
 # Configuração do logger
 logger = logging.getLogger(__name__)
@@ -164,8 +166,79 @@ def process_type_semianon(
     return df_users_semianon_filtered
 
 
+def aggregate_interactions(df_users_logged: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega explicitamente as interações duplicadas (mesmo usuário e mesmo item),
+    somando o 'final_score'.
+
+    Args:
+        df_users_logged: DataFrame contendo as colunas 'user_idx', 'item_idx' e 'final_score'.
+
+    Returns:
+        DataFrame com uma linha por par (user_idx, item_idx).
+    """
+    return (
+        df_users_logged.groupby(["user_idx", "item_idx"], sort=False)["final_score"]
+        .sum()
+        .reset_index()
+    )
+
+
+def _interactions_to_csr(
+    df_agg: pd.DataFrame, shape: Tuple[int, int]
+) -> csr_matrix:
+    """
+    Converte interações já agregadas em uma matriz CSR com o shape informado.
+    """
+    rows = df_agg["user_idx"].to_numpy(dtype=np.int64)
+    cols = df_agg["item_idx"].to_numpy(dtype=np.int64)
+    vals = df_agg["final_score"].to_numpy(dtype=np.float64)
+    return csr_matrix((vals, (rows, cols)), shape=shape)
+
+
+def save_sparse_mappings(mappings: Dict[str, Any], mappings_path: str) -> None:
+    """
+    Salva os mapeamentos usuário/item da matriz esparsa (e as partições já aplicadas).
+    """
+    with open(mappings_path, "wb") as f:
+        pickle.dump(mappings, f)
+    logger.info(f"✅ Mapeamentos da matriz esparsa salvos em: {mappings_path}")
+
+
+def load_sparse_mappings(mappings_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Carrega os mapeamentos usuário/item da matriz esparsa, se existirem.
+    """
+    if not os.path.exists(mappings_path):
+        return None
+    with open(mappings_path, "rb") as f:
+        return pickle.load(f)
+
+
+def build_sparse_matrix(df_users_logged: pd.DataFrame) -> csr_matrix:
+    """
+    Constrói a matriz esparsa usuário-item a partir do DataFrame de usuários logados,
+    somando explicitamente as interações duplicadas (mesmo usuário e item).
+
+    Args:
+        df_users_logged: DataFrame processado de usuários logados, contendo as colunas 'user_idx',
+                         'item_idx' e 'final_score'.
+
+    Returns:
+        A matriz esparsa construída (csr_matrix).
+    """
+    # Assume que os mapeamentos já foram criados em process_type_logged
+    n_users = df_users_logged["userId"].nunique()
+    n_items = df_users_logged["history"].nunique()
+    df_agg = aggregate_interactions(df_users_logged)
+    return _interactions_to_csr(df_agg, shape=(n_users, n_items))
+
+
 def build_and_save_sparse_matrix(
-    df_users_logged: pd.DataFrame, output_path: str
+    df_users_logged: pd.DataFrame,
+    output_path: str,
+    mappings_path: Optional[str] = None,
+    partitions: Optional[List[str]] = None,
 ) -> csr_matrix:
     """
     Constrói a matriz esparsa usuário-item a partir do DataFrame de usuários logados
@@ -175,19 +248,131 @@ def build_and_save_sparse_matrix(
         df_users_logged: DataFrame processado de usuários logados, contendo as colunas 'user_idx',
                          'item_idx' e 'final_score'.
         output_path: Caminho onde a matriz esparsa será salva.
+        mappings_path: Se informado, salva os mapeamentos usuário/item utilizados na matriz,
+                       necessários para as atualizações incrementais.
+        partitions: Partições (arquivos CSV) que deram origem à matriz.
 
     Returns:
         A matriz esparsa construída (csr_matrix).
     """
-    # Assume que os mapeamentos já foram criados em process_type_logged
-    users = df_users_logged["userId"].unique()
-    items = df_users_logged["history"].unique()
-
-    rows = df_users_logged["user_idx"].values
-    cols = df_users_logged["item_idx"].values
-    vals = df_users_logged["final_score"].values
-
-    sparse_mat = csr_matrix((vals, (rows, cols)), shape=(len(users), len(items)))
+    sparse_mat = build_sparse_matrix(df_users_logged)
     save_npz(output_path, sparse_mat)
     logger.info(f"✅ Matriz esparsa salva em: {output_path}")
+
+    if mappings_path is not None:
+        users = df_users_logged["userId"].unique()
+        items = df_users_logged["history"].unique()
+        save_sparse_mappings(
+            {
+                "user_to_idx": {u: i for i, u in enumerate(users)},
+                "item_to_idx": {p: i for i, p in enumerate(items)},
+                "partitions": sorted(partitions or []),
+            },
+            mappings_path,
+        )
+    return sparse_mat
+
+
+def update_sparse_matrix_incremental(
+    df_delta_logged: pd.DataFrame,
+    matrix_path: str,
+    mappings_path: str,
+    decay: float = 1.0,
+    partitions: Optional[List[str]] = None,
+    history_path: Optional[str] = None,
+) -> csr_matrix:
+    """
+    Aplica interações novas (delta) à matriz esparsa existente, sem reconstruí-la.
+
+    Usuários e itens inéditos recebem índices ao final dos mapeamentos existentes, de modo
+    que os índices já atribuídos permanecem estáveis. As interações antigas podem ser
+    atenuadas pelo fator 'decay' antes da soma do delta. Os usuários do delta são
+    acumulados em mappings["changed_users"] até o próximo fold-in (ver
+    fold_in_logged_users), que recalcula seus fatores.
+
+    Args:
+        df_delta_logged: DataFrame de interações novas dos usuários logados, contendo as colunas
+                         'userId', 'history' e 'final_score'.
+        matrix_path: Caminho da matriz esparsa existente (NPZ). É sobrescrita com o resultado.
+        mappings_path: Caminho dos mapeamentos usuário/item da matriz.
+        decay: Fator multiplicativo aplicado às interações antigas (1.0 = sem decaimento).
+        partitions: Partições que compõem o delta; partições já aplicadas são ignoradas.
+        history_path: Se informado, o histórico de interações (users_logged.parquet) ao qual
+                      as linhas do delta são acrescentadas, para que a API encontre o
+                      histórico dos usuários novos.
+
+    Returns:
+        A matriz esparsa atualizada (csr_matrix).
+    """
+    if not 0.0 < decay <= 1.0:
+        raise ValueError(f"decay deve estar no intervalo (0, 1], recebido: {decay}")
+
+    mappings = load_sparse_mappings(mappings_path)
+    if mappings is None or not os.path.exists(matrix_path):
+        raise FileNotFoundError(
+            f"Matriz ou mapeamentos inexistentes ({matrix_path}, {mappings_path}); "
+            "execute a construção completa primeiro."
+        )
+
+    partitions = sorted(partitions or [])
+    applied = set(mappings.get("partitions", []))
+    repeated = [p for p in partitions if p in applied]
+    if partitions and len(repeated) == len(partitions):
+        logger.info("Todas as partições já foram aplicadas; matriz mantida.")
+        return load_npz(matrix_path).tocsr()
+    if repeated:
+        raise ValueError(f"Partições já aplicadas à matriz: {repeated}")
+
+    user_to_idx = mappings["user_to_idx"]
+    item_to_idx = mappings["item_to_idx"]
+
+    # Estende os mapeamentos apenas com usuários/itens inéditos
+    for col, mapping in (("userId", user_to_idx), ("history", item_to_idx)):
+        novos = pd.unique(df_delta_logged[col])
+        novos = [v for v in novos if v not in mapping]
+        start = len(mapping)
+        mapping.update({v: start + i for i, v in enumerate(novos)})
+        logger.info(f"{len(novos)} novos valores de '{col}' adicionados ao mapeamento.")
+
+    df_delta = pd.DataFrame(
+        {
+            "user_idx": df_delta_logged["userId"].map(user_to_idx).to_numpy(),
+            "item_idx": df_delta_logged["history"].map(item_to_idx).to_numpy(),
+            "final_score": df_delta_logged["final_score"].to_numpy(),
+        }
+    )
+    shape = (len(user_to_idx), len(item_to_idx))
+    delta_mat = _interactions_to_csr(aggregate_interactions(df_delta), shape=shape)
+
+    sparse_mat = load_npz(matrix_path).tocsr().astype(np.float64)
+    if decay != 1.0:
+        sparse_mat.data *= decay
+    sparse_mat.resize(shape)
+    sparse_mat = (sparse_mat + delta_mat).tocsr()
+    sparse_mat.sum_duplicates()
+
+    # O histórico é gravado em arquivo temporário e só substitui o atual após a matriz e os
+    # mapeamentos, que registram as partições aplicadas
+    history_tmp = None
+    if history_path is not None:
+        df_history = df_delta_logged.assign(
+            user_idx=df_delta["user_idx"].to_numpy(), item_idx=df_delta["item_idx"].to_numpy()
+        )
+        if os.path.exists(history_path):
+            df_history = pd.concat([pd.read_parquet(history_path), df_history], ignore_index=True)
+        history_tmp = f"{history_path}.tmp"
+        df_history.to_parquet(history_tmp, index=False)
+
+    save_npz(matrix_path, sparse_mat)
+    mappings["partitions"] = sorted(applied.union(partitions))
+    mappings["changed_users"] = sorted(
+        set(mappings.get("changed_users", [])).union(pd.unique(df_delta_logged["userId"]))
+    )
+    save_sparse_mappings(mappings, mappings_path)
+    if history_tmp is not None:
+        os.replace(history_tmp, history_path)
+        logger.info(f"✅ {len(df_delta_logged)} interações acrescentadas ao histórico: {history_path}")
+    logger.info(
+        f"✅ Matriz esparsa atualizada ({delta_mat.nnz} interações no delta, shape {shape})."
+    )
     return sparse_mat
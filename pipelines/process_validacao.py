@@ -0,0 +1,150 @@
+import logging
+from typing import Iterator
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+# Configuração do logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Colunas com listas serializadas (ex.: "['a' 'b']" e "[1 2]")
+LIST_COLUMNS = ["history", "timestampHistory"]
+LIST_STRIP_PATTERN = r"[\n\[\]'\"]"
+
+
+def parse_list_column(values: pa.Array) -> pa.ListArray:
+    """
+    Converte uma coluna de listas serializadas em um ListArray do Arrow, de forma vetorizada.
+
+    Args:
+        values: Array de strings no formato "['a' 'b']".
+
+    Returns:
+        ListArray com os tokens de cada linha (listas vazias para valores vazios/nulos).
+    """
+    values = pc.cast(values, pa.string())
+    cleaned = pc.utf8_trim_whitespace(
+        pc.replace_substring_regex(values, pattern=LIST_STRIP_PATTERN, replacement="")
+    )
+    cleaned = pc.fill_null(cleaned, "")
+    tokens = pc.split_pattern_regex(cleaned, pattern=r"\s+")
+    # "" gera [""]; remove os tokens vazios mantendo o alinhamento por linha
+    flat = pc.list_flatten(tokens)
+    keep = pc.not_equal(flat, "")
+    parents = pc.filter(pc.list_parent_indices(tokens), keep)
+    lengths = np.bincount(parents.to_numpy(), minlength=len(values))
+    offsets = pa.array(np.concatenate([[0], np.cumsum(lengths)]), pa.int32())
+    return pa.ListArray.from_arrays(offsets, pc.filter(flat, keep))
+
+
+def parse_validacao_batch(batch: pa.RecordBatch) -> pa.Table:
+    """
+    Explode as colunas de listas de um bloco do conjunto de validação, gerando uma linha por
+    interação, com 'page' em string e 'timestampHistory' em milissegundos. Como no
+    DataFrame.explode, linhas com histórico vazio geram uma linha com 'page' e
+    'timestampHistory' nulos.
+
+    Args:
+        batch: Bloco com, ao menos, as colunas 'userId', 'history' e 'timestampHistory'.
+
+    Returns:
+        Tabela com uma linha por interação.
+    """
+    history = parse_list_column(batch.column("history"))
+    timestamps = parse_list_column(batch.column("timestampHistory"))
+
+    if not pc.all(
+        pc.equal(pc.list_value_length(history), pc.list_value_length(timestamps))
+    ).as_py():
+        raise ValueError("history e timestampHistory com tamanhos diferentes por linha.")
+
+    # Posição de cada linha de saída nos tokens; -1 (nulo) para as linhas de histórico vazio
+    tamanhos = pc.list_value_length(history).to_numpy(zero_copy_only=False)
+    tamanhos_saida = np.maximum(tamanhos, 1)
+    parents = pa.array(np.repeat(np.arange(batch.num_rows), tamanhos_saida))
+    posicoes = np.full(int(tamanhos_saida.sum()), -1, dtype=np.int64)
+    posicoes[np.repeat(tamanhos > 0, tamanhos_saida)] = np.arange(int(tamanhos.sum()))
+    posicoes = pa.array(posicoes, mask=posicoes < 0)
+
+    pages = pc.take(pc.list_flatten(history), posicoes)
+    ts_tokens = pc.take(pc.list_flatten(timestamps), posicoes)
+    # Equivalente vetorizado de pd.to_numeric(errors="coerce")
+    ts_valid = pc.match_substring_regex(ts_tokens, pattern=r"^-?\d+$")
+    ts_ms = pc.cast(pc.if_else(ts_valid, ts_tokens, pa.scalar(None, pa.string())), pa.int64())
+
+    columns, names = [], []
+    for name in batch.schema.names:
+        if name == "history":
+            names.append("page")
+            columns.append(pages)
+        elif name == "timestampHistory":
+            names.append("timestampHistory")
+            columns.append(ts_ms.cast(pa.timestamp("ms")))
+        else:
+            column = pc.take(batch.column(name), parents)
+            if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+                column = pc.utf8_trim_whitespace(column)
+            names.append(name)
+            columns.append(column)
+
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def iter_validacao_batches(path: str, block_size: int = 1 << 24) -> Iterator[pa.RecordBatch]:
+    """
+    Itera sobre o arquivo de validação (CSV ou Parquet) em blocos, sem carregá-lo inteiro.
+
+    Args:
+        path: Caminho do arquivo de validação.
+        block_size: Tamanho aproximado dos blocos de leitura do CSV, em bytes.
+    """
+    if path.endswith(".parquet"):
+        yield from pq.ParquetFile(path).iter_batches()
+        return
+
+    reader = pv.open_csv(
+        path,
+        read_options=pv.ReadOptions(block_size=block_size),
+        convert_options=pv.ConvertOptions(
+            column_types={c: pa.string() for c in ["userId", "userType"] + LIST_COLUMNS}
+        ),
+    )
+    yield from reader
+
+
+def parse_validacao_file(input_path: str, output_path: str) -> int:
+    """
+    Converte o arquivo de validação em Parquet com uma linha por interação, processando-o
+    em blocos e sem colunas intermediárias de objetos Python.
+
+    Args:
+        input_path: Caminho do arquivo de validação (CSV ou Parquet).
+        output_path: Caminho do Parquet de saída.
+
+    Returns:
+        Número de interações gravadas.
+    """
+    writer = None
+    n_rows = 0
+    schema = None
+    try:
+        for batch in iter_validacao_batches(input_path):
+            table = parse_validacao_batch(batch)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(output_path, schema)
+            writer.write_table(table.cast(schema))
+            n_rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info(f"✅ {n_rows} interações de validação gravadas em: {output_path}")
+    return n_rows
+
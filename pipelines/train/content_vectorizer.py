@@ -0,0 +1,185 @@
+import os
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import load_npz, save_npz
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from script_shared import config
+
+CONTENT_CACHE_DIR = config.CONTENT_CACHE_DIR
+CONTENT_N_FEATURES = config.CONTENT_N_FEATURES
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def build_hashing_vectorizer(n_features: int = CONTENT_N_FEATURES) -> HashingVectorizer:
+    """
+    Vetorizador sem estado (vocabulário estável via hashing) que gera contagens de termos.
+    """
+    return HashingVectorizer(
+        stop_words="english",
+        n_features=n_features,
+        alternate_sign=False,
+        norm=None,
+        dtype=np.float32,
+    )
+
+
+def _texto_itens(df_item: pd.DataFrame) -> pd.Series:
+    return df_item["title"].fillna("") + " " + df_item["body"].fillna("")
+
+
+def contar_termos(
+    textos: pd.Series,
+    vectorizer: HashingVectorizer,
+    n_jobs: int = -1,
+    chunk_size: int = 5000,
+) -> sp.csr_matrix:
+    """
+    Tokeniza os textos em paralelo (blocos de chunk_size documentos) e retorna as
+    contagens de termos em uma matriz CSR.
+    """
+    if len(textos) == 0:
+        return sp.csr_matrix((0, vectorizer.n_features), dtype=np.float32)
+
+    blocos = [textos.iloc[i : i + chunk_size] for i in range(0, len(textos), chunk_size)]
+    if len(blocos) == 1:
+        return vectorizer.transform(blocos[0]).tocsr()
+    partes = Parallel(n_jobs=n_jobs)(delayed(vectorizer.transform)(b) for b in blocos)
+    return sp.vstack(partes).tocsr()
+
+
+def calcular_idf(tf: sp.csr_matrix) -> np.ndarray:
+    """
+    IDF suavizado, igual ao do TfidfVectorizer: log((1 + n) / (1 + df)) + 1.
+    """
+    n_docs = tf.shape[0]
+    df = np.bincount(tf.indices, minlength=tf.shape[1])
+    return (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def _carregar_cache(cache_dir: str) -> Optional[Dict[str, Any]]:
+    meta_path = os.path.join(cache_dir, "content_meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    index = pd.read_parquet(os.path.join(cache_dir, "content_index.parquet"))
+    return {
+        "meta": meta,
+        "index": index,
+        "tf": load_npz(os.path.join(cache_dir, "content_tf.npz")).tocsr(),
+        "idf": np.load(os.path.join(cache_dir, "content_idf.npy")),
+    }
+
+
+def _salvar_cache(
+    cache_dir: str, pages: np.ndarray, fingerprints: np.ndarray, tf: sp.csr_matrix,
+    idf: np.ndarray, meta: Dict[str, Any],
+) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    pd.DataFrame({"page": pages, "fingerprint": fingerprints}).to_parquet(
+        os.path.join(cache_dir, "content_index.parquet"), index=False
+    )
+    save_npz(os.path.join(cache_dir, "content_tf.npz"), tf)
+    np.save(os.path.join(cache_dir, "content_idf.npy"), idf)
+    with open(os.path.join(cache_dir, "content_meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def vetorizar_conteudo(
+    df_item: pd.DataFrame,
+    cache_dir: str = CONTENT_CACHE_DIR,
+    n_features: int = CONTENT_N_FEATURES,
+    idf_refresh_ratio: float = 0.1,
+    force_idf_refresh: bool = False,
+    n_jobs: int = -1,
+) -> Tuple[sp.csr_matrix, HashingVectorizer, np.ndarray]:
+    """
+    Gera a matriz TF-IDF dos itens reaproveitando as contagens de termos já calculadas.
+
+    Apenas itens novos ou com título/corpo alterados (detectados por um hash do texto) são
+    tokenizados. O IDF é recalculado quando o número de itens variou mais que
+    idf_refresh_ratio desde o último recálculo (ou se force_idf_refresh); caso contrário,
+    o IDF anterior é mantido.
+
+    Args:
+        df_item: DataFrame dos itens, com as colunas 'page', 'title' e 'body'.
+        cache_dir: Diretório do cache de contagens por página.
+        n_features: Dimensão do espaço de hashing.
+        idf_refresh_ratio: Variação relativa do número de itens que dispara o recálculo do IDF.
+        force_idf_refresh: Força o recálculo do IDF.
+        n_jobs: Número de processos para a tokenização.
+
+    Returns:
+        Tupla (matriz TF-IDF float32 com linhas normalizadas (L2), na ordem de df_item;
+        vetorizador; vetor IDF).
+    """
+    vectorizer = build_hashing_vectorizer(n_features)
+    textos = _texto_itens(df_item).reset_index(drop=True)
+    pages = df_item["page"].to_numpy()
+    fingerprints = pd.util.hash_pandas_object(textos, index=False).to_numpy()
+
+    cache = _carregar_cache(cache_dir)
+    if cache is not None and cache["meta"].get("n_features") != n_features:
+        logger.info("Dimensão do hashing alterada; cache de conteúdo descartado.")
+        cache = None
+
+    # Linhas do cache reaproveitáveis (mesma página e mesmo texto)
+    reuse_rows = np.full(len(pages), -1, dtype=np.int64)
+    if cache is not None:
+        cached = cache["index"]
+        pos = pd.Series(np.arange(len(cached)), index=cached["page"].to_numpy())
+        pos = pos[~pos.index.duplicated(keep="last")]
+        candidato = pos.reindex(pages).to_numpy()
+        tem = ~np.isnan(candidato)
+        cand_rows = candidato[tem].astype(np.int64)
+        iguais = cached["fingerprint"].to_numpy()[cand_rows] == fingerprints[tem]
+        reuse_rows[np.flatnonzero(tem)[iguais]] = cand_rows[iguais]
+
+    novos = np.flatnonzero(reuse_rows < 0)
+    logger.info(
+        f"Vetorização de conteúdo: {len(novos)} itens novos/alterados, "
+        f"{len(pages) - len(novos)} reaproveitados do cache."
+    )
+    tf_novos = contar_termos(textos.iloc[novos], vectorizer, n_jobs=n_jobs)
+
+    # Monta a matriz de contagens na ordem de df_item
+    reusados = np.flatnonzero(reuse_rows >= 0)
+    partes = [tf_novos]
+    if len(reusados):
+        partes.insert(0, cache["tf"][reuse_rows[reusados]])
+    combinado = sp.vstack(partes).tocsr()
+    ordem = np.empty(len(pages), dtype=np.int64)
+    ordem[np.concatenate([reusados, novos])] = np.arange(len(pages))
+    tf = combinado[ordem].astype(np.float32)
+
+    n_docs_idf = cache["meta"].get("n_docs_idf") if cache is not None else None
+    refresh = (
+        force_idf_refresh
+        or n_docs_idf is None
+        or abs(len(pages) - n_docs_idf) > idf_refresh_ratio * n_docs_idf
+    )
+    if refresh:
+        logger.info("Recalculando IDF.")
+        idf = calcular_idf(tf)
+        n_docs_idf = len(pages)
+    else:
+        idf = cache["idf"]
+
+    tfidf_matrix = normalize(tf @ sp.diags(idf), norm="l2").astype(np.float32).tocsr()
+
+    _salvar_cache(
+        cache_dir, pages, fingerprints, tf, idf,
+        {"n_features": n_features, "n_docs_idf": n_docs_idf},
+    )
+    return tfidf_matrix, vectorizer, idf
@@ -0,0 +1,193 @@
+import os
+import pickle
+import logging
+from typing import Dict, Any, Iterable, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import load_npz
+from script_shared import config
+from pipelines.process_type_user import load_sparse_mappings, save_sparse_mappings
+from script_shared.artifacts import registrar_artefato, hash_arquivo
+from script_shared.models.model_logged import ARTEFATOS_LOGGED, consistencia_logged
+from script_shared.models.quantization import Fatores, linhas_fatores
+
+ALS_DEFAULT_PARAMS = config.ALS_DEFAULT_PARAMS
+SPARSE_MATRIX_PATH = config.SPARSE_MATRIX_PATH
+SPARSE_MAPPINGS_PATH = config.SPARSE_MAPPINGS_PATH
+MODEL_DIR_LOGGED = config.MODEL_DIR_LOGGED
+USERS_LOGGED = config.USERS_LOGGED
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def solve_user_factors(
+    user_items: sp.csr_matrix,
+    item_factors: Fatores,
+    YtY: np.ndarray,
+    regularization: float,
+    max_nnz_per_batch: int = 16384,
+) -> np.ndarray:
+    """
+    Resolve os fatores de usuário do ALS implícito com os fatores de item fixos (fold-in).
+
+    Para cada usuário u, com confianças C_u (valores da linha da matriz), resolve
+    (YtY + Y_u^T (C_u - I) Y_u + reg * I) x_u = Y_u^T C_u p_u. Os sistemas são montados
+    e resolvidos em lote (np.linalg.solve vetorizado), agrupando usuários até
+    'max_nnz_per_batch' interações para limitar a memória.
+
+    Args:
+        user_items: Matriz CSR (usuários x itens) com as confianças (score * alpha).
+        item_factors: Fatores de item do modelo ALS (n_items x k), em ponto flutuante ou
+                      quantizados (apenas as linhas dos itens consumidos são desquantizadas).
+        YtY: Produto item_factors.T @ item_factors pré-calculado.
+        regularization: Regularização do ALS.
+        max_nnz_per_batch: Número máximo de interações por lote.
+
+    Returns:
+        Matriz (n_usuários x k) com os fatores de usuário.
+    """
+    user_items = user_items.tocsr()
+    n_users, k = user_items.shape[0], YtY.shape[0]
+    base = np.asarray(YtY, dtype=np.float64) + regularization * np.eye(k)
+    dtype = np.float32 if isinstance(item_factors, dict) else item_factors.dtype
+    user_factors = np.zeros((n_users, k), dtype=dtype)
+    indptr = user_items.indptr
+
+    start = 0
+    while start < n_users:
+        end = np.searchsorted(indptr, indptr[start] + max_nnz_per_batch, side="right") - 1
+        end = min(max(end, start + 1), n_users)
+
+        batch = user_items[start:end]
+        conf = batch.data.astype(np.float64)
+        Yi = linhas_fatores(item_factors, batch.indices).astype(np.float64)
+        nonempty = np.flatnonzero(np.diff(batch.indptr))
+
+        A = np.broadcast_to(base, (end - start, k, k)).copy()
+        b = np.zeros((end - start, k))
+        if nonempty.size:
+            offsets = batch.indptr[nonempty]
+            outer = np.einsum("n,ni,nj->nij", conf - 1.0, Yi, Yi)
+            A[nonempty] += np.add.reduceat(outer, offsets, axis=0)
+            b[nonempty] = np.add.reduceat(conf[:, None] * Yi, offsets, axis=0)
+
+        user_factors[start:end] = np.linalg.solve(A, b[..., None])[..., 0]
+        start = end
+
+    return user_factors
+
+
+def fold_in_logged_users(
+    model_dir: str = MODEL_DIR_LOGGED,
+    sparse_matrix_path: str = SPARSE_MATRIX_PATH,
+    mappings_path: str = SPARSE_MAPPINGS_PATH,
+    changed_users: Optional[Iterable[str]] = None,
+    als_params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Calcula os fatores de usuários logados novos (ou alterados) sem retreinar o ALS e os
+    acrescenta aos artefatos do modelo.
+
+    Usuários novos são os presentes nos mapeamentos da matriz esparsa (atualizada de forma
+    incremental) cujo índice ainda não possui fator; alterados, por padrão, os que
+    receberam interações nas atualizações incrementais desde o último fold-in
+    (mappings["changed_users"], esvaziado ao final). Itens sem fator (surgidos após o
+    treino) são ignorados no cálculo.
+
+    Args:
+        model_dir: Diretório com os artefatos do modelo logado.
+        sparse_matrix_path: Caminho da matriz esparsa usuário-item.
+        mappings_path: Caminho dos mapeamentos usuário/item da matriz esparsa.
+        changed_users: Usuários já existentes cujos fatores devem ser recalculados. Se None,
+                       usa os registrados pelas atualizações incrementais da matriz.
+        als_params: Parâmetros do ALS (usa 'alpha' e 'regularization'). Se None, usa os padrões.
+
+    Returns:
+        Dicionário com o número de usuários novos e recalculados.
+    """
+    als_params = als_params or ALS_DEFAULT_PARAMS
+
+    mappings = load_sparse_mappings(mappings_path)
+    if mappings is None:
+        raise FileNotFoundError(f"Mapeamentos da matriz esparsa não encontrados: {mappings_path}")
+
+    model_path = os.path.join(model_dir, "model_logged_als.npz")
+    aux_path = os.path.join(model_dir, "objetos_logged_auxiliares.pkl")
+    with np.load(model_path) as data:
+        artefatos = {key: data[key] for key in data.files}
+    with open(aux_path, "rb") as f:
+        aux_dict = pickle.load(f)
+
+    user_factors = artefatos["user_factors"]
+    item_factors = artefatos["item_factors"]
+    YtY = artefatos.get("YtY")
+    if YtY is None:
+        YtY = item_factors.T.dot(item_factors)
+
+    registrados = changed_users is None
+    if registrados:
+        changed_users = mappings.get("changed_users", [])
+    user_to_idx = mappings["user_to_idx"]
+    n_trained = user_factors.shape[0]
+    new_rows = np.arange(n_trained, len(user_to_idx))
+    changed_rows = np.array(
+        [user_to_idx[u] for u in changed_users if user_to_idx.get(u, n_trained) < n_trained],
+        dtype=np.int64,
+    )
+    rows = np.concatenate([changed_rows, new_rows]).astype(np.int64)
+    logger.info(f"Fold-in de {len(new_rows)} usuários novos e {len(changed_rows)} alterados...")
+
+    if len(rows):
+        sparse_mat = load_npz(sparse_matrix_path).tocsr()
+        user_items = sparse_mat[rows][:, : item_factors.shape[0]] * als_params["alpha"]
+        solved = solve_user_factors(
+            user_items, item_factors, YtY, als_params["regularization"]
+        )
+        user_factors = np.vstack(
+            [user_factors, np.zeros((len(new_rows), user_factors.shape[1]), user_factors.dtype)]
+        )
+        user_factors[rows] = solved
+
+        artefatos["user_factors"] = user_factors
+        np.savez(model_path, **artefatos)
+        aux_dict["user_to_idx"] = dict(user_to_idx)
+        with open(aux_path, "wb") as f:
+            pickle.dump(aux_dict, f)
+        logger.info(f"Fatores de usuário atualizados em: {model_path}")
+
+        # Mantém a chave do treino e atualiza os hashes e invariantes do manifesto
+        consistencia = consistencia_logged(
+            aux_dict, user_factors, item_factors,
+            load_npz(os.path.join(model_dir, "tfidf_logged_matrix.npz")),
+        )
+        if os.path.exists(USERS_LOGGED):
+            consistencia["history_sha256"] = hash_arquivo(USERS_LOGGED)
+        registrar_artefato(
+            model_dir,
+            "logged",
+            None,
+            # Modelos treinados antes do índice ANN não possuem o arquivo do índice
+            [
+                os.path.join(model_dir, nome) for nome in ARTEFATOS_LOGGED
+                if os.path.exists(os.path.join(model_dir, nome))
+            ],
+            consistencia,
+        )
+
+    if registrados and mappings.get("changed_users"):
+        mappings["changed_users"] = []
+        save_sparse_mappings(mappings, mappings_path)
+
+    return {"novos": int(len(new_rows)), "alterados": int(len(changed_rows))}
+
+
+def main():
+    fold_in_logged_users()
+
+
+if __name__ == "__main__":
+    main()
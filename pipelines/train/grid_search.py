@@ -0,0 +1,436 @@
+import os
+import json
+import pickle
+import tempfile
+import hashlib
+import logging
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from threadpoolctl import threadpool_limits
+from implicit.als import AlternatingLeastSquares
+from sklearn.preprocessing import StandardScaler
+from sklearn.decomposition import PCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from script_shared import config
+from pipelines.process_type_user import process_type_logged, build_sparse_matrix
+from pipelines.train.train_semianon import cap_outliers
+from pipelines.train.content_vectorizer import vetorizar_conteudo
+from script_shared.artifacts import hash_arquivo
+
+FEATURE_COLUMNS_SEMIANON = config.FEATURE_COLUMNS_SEMIANON
+CONTENT_N_FEATURES = config.CONTENT_N_FEATURES
+GRID_SEARCH_DIR = config.GRID_SEARCH_DIR
+GRID_SEARCH_CACHE_DIR = os.path.join(GRID_SEARCH_DIR, "cache")
+REFINED_DIR = os.path.join(config.BASE_PATH, "data", "refined")
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Grades padrão (mesmas faixas do grid fino do notebook test_model/modelo_teste.ipynb)
+GRID_LOGGED = {
+    "engagement": [
+        {"w_time": 0.2, "w_clicks": 1.5, "w_scroll": 0.3, "w_visits": 2.0},
+        {"w_time": 0.25, "w_clicks": 1.7, "w_scroll": 0.35, "w_visits": 2.2},
+        {"w_time": 0.27, "w_clicks": 1.8, "w_scroll": 0.37, "w_visits": 2.3},
+    ],
+    "als": [
+        {"factors": 40, "reg": 0.04, "iterations": 15, "alpha": 12},
+        {"factors": 45, "reg": 0.05, "iterations": 15, "alpha": 12},
+        {"factors": 50, "reg": 0.05, "iterations": 15, "alpha": 15},
+    ],
+    "weight_cf": [0.20, 0.25, 0.30],
+    "top_n_cf": [80, 100, 120],
+}
+GRID_SEMIANON = {
+    "n_components": [4, 5, 6],
+    "algorithm": ["kmeans", "minibatch"],
+    "n_clusters": [4, 5, 6],
+    "init": ["k-means++", "random"],
+    "max_iter": [300, 600],
+}
+
+COLUMNS_LOGGED = [
+    "w_time", "w_clicks", "w_scroll", "w_visits", "factors", "reg", "iterations",
+    "alpha", "weight_cf", "top_n_cf", "recall_k", "ndcg_k",
+]
+COLUMNS_SEMIANON = [
+    "algorithm", "n_clusters", "init", "max_iter", "silhouette", "eps", "min_samples",
+]
+
+# Dados carregados uma única vez por processo (ver _init_worker)
+_DADOS: Dict[str, Any] = {}
+
+
+def impressao_entradas(dados: Dict[str, str]) -> str:
+    """
+    Impressão digital dos arquivos de entrada da busca (hash do conteúdo de cada um).
+    """
+    hashes = {nome: hash_arquivo(path) for nome, path in dados.items()}
+    return cache_key(hashes)
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    """
+    Gera a chave de cache de um estágio a partir apenas dos parâmetros que o afetam.
+    """
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _cached(stage: str, params: Dict[str, Any], build: Callable[[], Any]) -> Any:
+    """
+    Retorna o artefato do estágio a partir do cache em disco (compartilhado entre os
+    processos) ou o constrói e salva de forma atômica. A chave inclui a impressão digital
+    dos arquivos de entrada, de modo que artefatos de dados anteriores não são reaproveitados.
+    """
+    chave = cache_key({**params, "_entradas": _DADOS["impressao"]})
+    path = os.path.join(GRID_SEARCH_CACHE_DIR, f"{stage}_{chave}.pkl")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    artefato = build()
+    os.makedirs(GRID_SEARCH_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(artefato, f)
+    os.replace(tmp_path, path)
+    return artefato
+
+
+def _init_worker(tipo: str, dados: Dict[str, str], impressao: str) -> None:
+    """
+    Inicializa um processo do pool: limita o BLAS a uma thread e carrega os dados de entrada.
+    """
+    threadpool_limits(1)
+    _DADOS["impressao"] = impressao
+    if tipo == "logged":
+        df_users = pd.read_parquet(dados["users_clean"])
+        df_validacao = pd.read_parquet(dados["validacao"], columns=["userId", "page"]).dropna()
+        ground_truth = df_validacao.groupby("userId")["page"].agg(set)
+        _DADOS["df_users_logged"] = df_users[df_users["userType"] == "Logged"]
+        _DADOS["ground_truth"] = ground_truth
+        # Ordem fixa: cada rodada do successive halving usa um prefixo da mesma amostra
+        _DADOS["val_users"] = ground_truth.index.to_series().sample(
+            frac=1.0, random_state=42
+        ).tolist()
+        _DADOS["df_item"] = pd.read_parquet(dados["items"], columns=["page", "title", "body"])
+    else:
+        _DADOS["df_semianon"] = pd.read_parquet(dados["users_semianon"])
+
+
+# ---------------------------------------------------------------------------
+# Modelo logado (engajamento + ALS + conteúdo)
+# ---------------------------------------------------------------------------
+def _matriz_engajamento(engagement: Dict[str, float]) -> Tuple[sp.csr_matrix, Dict[str, int], np.ndarray]:
+    """
+    Matriz usuário-item para os pesos de engajamento (depende apenas deles).
+    """
+    def build():
+        df_logged = process_type_logged(_DADOS["df_users_logged"], engagement)
+        user_ids = df_logged["userId"].unique()
+        item_ids = df_logged["history"].unique()
+        return (
+            build_sparse_matrix(df_logged),
+            {u: i for i, u in enumerate(user_ids)},
+            np.asarray(item_ids),
+        )
+
+    return _cached("matriz", engagement, build)
+
+
+def _fatores_als(engagement: Dict[str, float], als: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fatores do ALS (dependem dos pesos de engajamento e dos parâmetros do ALS).
+    """
+    def build():
+        sparse_mat, _, _ = _matriz_engajamento(engagement)
+        model_als = AlternatingLeastSquares(
+            factors=als["factors"],
+            regularization=als["reg"],
+            iterations=als["iterations"],
+            random_state=42,
+        )
+        model_als.fit(sparse_mat * als["alpha"], show_progress=False)
+        return np.asarray(model_als.user_factors), np.asarray(model_als.item_factors)
+
+    return _cached("als", {**engagement, **als}, build)
+
+
+def _tfidf() -> Tuple[sp.csr_matrix, Dict[str, int]]:
+    """
+    Matriz TF-IDF dos itens (independe dos parâmetros da busca), com o mesmo vetorizador
+    do treino (hashing + IDF, ver vetorizar_conteudo). O cache de contagens do treino não
+    é usado: a matriz é calculada do zero, com o IDF de todos os itens.
+    """
+    def build():
+        df_item = _DADOS["df_item"]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            tfidf_matrix, _, _ = vetorizar_conteudo(
+                df_item, cache_dir=cache_dir, n_features=CONTENT_N_FEATURES, n_jobs=1
+            )
+        return tfidf_matrix, {p: i for i, p in enumerate(df_item["page"].values)}
+
+    return _cached("tfidf", {"vetorizador": "hashing", "n_features": CONTENT_N_FEATURES}, build)
+
+
+def avaliar_config_logged(cfg: Dict[str, Any], n_users: int, top_k: int = 10) -> Dict[str, Any]:
+    """
+    Avalia uma configuração do modelo híbrido (CF + conteúdo) nos primeiros n_users
+    usuários de validação, gerando as recomendações em lote.
+
+    Args:
+        cfg: Configuração com as chaves 'engagement', 'als', 'weight_cf' e 'top_n_cf'.
+        n_users: Número de usuários de validação avaliados (recurso do successive halving).
+        top_k: Tamanho da lista de recomendações.
+
+    Returns:
+        Linha de resultado no layout de COLUMNS_LOGGED.
+    """
+    engagement, als = cfg["engagement"], cfg["als"]
+    sparse_mat, user_to_idx, item_ids = _matriz_engajamento(engagement)
+    user_factors, item_factors = _fatores_als(engagement, als)
+    tfidf_matrix, item_to_idx_content = _tfidf()
+
+    users = [u for u in _DADOS["val_users"] if u in user_to_idx][:n_users]
+    row = {**engagement, **als, "weight_cf": cfg["weight_cf"], "top_n_cf": cfg["top_n_cf"]}
+    if not users:
+        return {**row, "recall_k": 0.0, "ndcg_k": 0.0}
+
+    model_als = AlternatingLeastSquares(factors=als["factors"], random_state=42)
+    model_als.user_factors = user_factors
+    model_als.item_factors = item_factors
+    uidx = np.array([user_to_idx[u] for u in users])
+    user_items = sparse_mat[uidx]
+    cf_items, cf_scores = model_als.recommend(uidx, user_items, N=cfg["top_n_cf"])
+
+    # Perfil de conteúdo: média das linhas TF-IDF dos itens consumidos
+    content_of_item = np.array([item_to_idx_content.get(p, -1) for p in item_ids])
+    hist = user_items.tocoo()
+    hist_content = content_of_item[hist.col]
+    valid = hist_content >= 0
+    H = sp.csr_matrix(
+        (np.ones(valid.sum()), (hist.row[valid], hist_content[valid])),
+        shape=(len(users), tfidf_matrix.shape[0]),
+    )
+    counts = np.maximum(np.asarray(H.sum(axis=1)).ravel(), 1.0)
+    profiles = sp.diags(1.0 / counts) @ H @ tfidf_matrix
+    norms = np.sqrt(np.asarray(profiles.multiply(profiles).sum(axis=1)).ravel())
+
+    # Similaridade de cosseno entre o perfil e cada candidato do CF
+    cand = np.where(cf_items >= 0, cf_items, 0)
+    cand_content = content_of_item[cand].ravel()
+    rep = np.repeat(np.arange(len(users)), cf_items.shape[1])
+    ok = (cand_content >= 0) & (cf_items.ravel() >= 0) & (norms[rep] > 0)
+    sims = np.zeros(cand_content.shape[0])
+    sims[ok] = np.asarray(
+        tfidf_matrix[cand_content[ok]].multiply(profiles[rep[ok]]).sum(axis=1)
+    ).ravel() / norms[rep[ok]]
+
+    final = cfg["weight_cf"] * cf_scores + (1 - cfg["weight_cf"]) * sims.reshape(cf_scores.shape)
+    final[cf_items < 0] = -np.inf
+    top = np.argsort(-final, axis=1)[:, :top_k]
+    recs = item_ids[np.take_along_axis(cand, top, axis=1)]
+
+    discounts = 1.0 / np.log2(np.arange(2, top_k + 2))
+    recalls, ndcgs = [], []
+    for u, rec in zip(users, recs):
+        ground_truth = _DADOS["ground_truth"][u]
+        hits = np.fromiter((item in ground_truth for item in rec), bool, len(rec))
+        recalls.append(hits.sum() / len(ground_truth))
+        idcg = discounts[: min(len(ground_truth), top_k)].sum()
+        ndcgs.append((discounts[: len(hits)] * hits).sum() / idcg)
+
+    return {**row, "recall_k": float(np.mean(recalls)), "ndcg_k": float(np.mean(ndcgs))}
+
+
+# ---------------------------------------------------------------------------
+# Modelo semi-logado (PCA + clusterização)
+# ---------------------------------------------------------------------------
+def _features_pca(n_components: int) -> np.ndarray:
+    """
+    Features normalizadas e reduzidas via PCA (dependem apenas de n_components).
+    """
+    def build():
+        df_features = cap_outliers(_DADOS["df_semianon"], FEATURE_COLUMNS_SEMIANON)
+        X_scaled = StandardScaler().fit_transform(df_features[FEATURE_COLUMNS_SEMIANON].values)
+        return PCA(n_components=n_components, random_state=42).fit_transform(X_scaled)
+
+    return _cached("pca", {"n_components": n_components}, build)
+
+
+def avaliar_config_semianon(cfg: Dict[str, Any], sample_size: int) -> Dict[str, Any]:
+    """
+    Avalia uma configuração de clusterização pelo silhouette em uma amostra de sample_size
+    usuários (recurso do successive halving). Os rótulos são reaproveitados entre rodadas.
+
+    Args:
+        cfg: Configuração com 'n_components', 'algorithm', 'n_clusters', 'init' e 'max_iter'.
+        sample_size: Tamanho da amostra usada no cálculo do silhouette.
+
+    Returns:
+        Linha de resultado no layout de COLUMNS_SEMIANON, acrescida de 'n_components'.
+    """
+    X_pca = _features_pca(cfg["n_components"])
+
+    def build():
+        if cfg["algorithm"] == "kmeans":
+            model = KMeans(
+                n_clusters=cfg["n_clusters"], init=cfg["init"],
+                max_iter=cfg["max_iter"], random_state=42,
+            )
+        else:
+            model = MiniBatchKMeans(
+                n_clusters=cfg["n_clusters"], init=cfg["init"], max_iter=cfg["max_iter"],
+                batch_size=5000, random_state=42,
+            )
+        return model.fit_predict(X_pca)
+
+    labels = _cached("clusters", cfg, build)
+    silhouette = silhouette_score(
+        X_pca, labels, sample_size=min(sample_size, len(labels)), random_state=42
+    )
+    return {
+        "algorithm": cfg["algorithm"],
+        "n_clusters": cfg["n_clusters"],
+        "init": cfg["init"],
+        "max_iter": cfg["max_iter"],
+        "silhouette": float(silhouette),
+        "eps": None,
+        "min_samples": None,
+        "n_components": cfg["n_components"],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Execução
+# ---------------------------------------------------------------------------
+def _avaliar(args: Tuple[str, Dict[str, Any], int]) -> Dict[str, Any]:
+    tipo, cfg, recurso = args
+    if tipo == "logged":
+        return avaliar_config_logged(cfg, recurso)
+    return avaliar_config_semianon(cfg, recurso)
+
+
+def successive_halving(
+    executor: ProcessPoolExecutor,
+    tipo: str,
+    configs: List[Dict[str, Any]],
+    score_key: str,
+    min_resource: int,
+    max_resource: int,
+    eta: int = 3,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Avalia as configurações com recurso crescente, mantendo apenas a melhor fração 1/eta
+    a cada rodada, até atingir max_resource.
+
+    Returns:
+        Tupla (linhas de todas as rodadas, com o recurso usado na coluna 'resource';
+        linhas da última rodada, avaliadas com max_resource).
+    """
+    resource = min_resource
+    vivos = list(range(len(configs)))
+    rodadas: List[Dict[str, Any]] = []
+    while True:
+        linhas = list(executor.map(_avaliar, [(tipo, configs[i], resource) for i in vivos]))
+        rodadas += [{**linha, "resource": resource} for linha in linhas]
+        logger.info(f"Rodada com recurso={resource}: {len(vivos)} configurações avaliadas.")
+
+        if resource >= max_resource:
+            break
+        ordem = np.argsort([-linha[score_key] for linha in linhas], kind="stable")
+        vivos = [vivos[j] for j in ordem[: max(1, len(vivos) // eta)]]
+        resource = min(resource * eta, max_resource)
+
+    return rodadas, linhas
+
+
+def expandir_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Produto cartesiano da grade de parâmetros.
+    """
+    chaves = list(grid)
+    return [dict(zip(chaves, valores)) for valores in itertools.product(*grid.values())]
+
+
+def executar_grid_search(
+    tipo: str,
+    grid: Optional[Dict[str, List[Any]]] = None,
+    output_csv: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    min_resource: Optional[int] = None,
+    max_resource: Optional[int] = None,
+    eta: int = 3,
+) -> pd.DataFrame:
+    """
+    Executa a busca de hiperparâmetros do modelo 'logged' ou 'semianon' em um pool de
+    processos, com cache de artefatos intermediários e successive halving.
+
+    Args:
+        tipo: "logged" (recurso = usuários de validação) ou "semianon" (recurso = amostra do silhouette).
+        grid: Grade de parâmetros. Se None, usa GRID_LOGGED ou GRID_SEMIANON.
+        output_csv: Caminho do CSV de resultados. Se None, grava em GRID_SEARCH_DIR.
+        max_workers: Número de processos do pool.
+        min_resource, max_resource: Recurso da primeira e da última rodada.
+        eta: Fator de redução do successive halving (use max_resource == min_resource para desativar).
+
+    As configurações que chegaram à última rodada são gravadas em output_csv, no mesmo
+    layout dos CSVs de test_model/resultado_metricas; as linhas de todas as rodadas (com
+    'resource' e, no semianon, 'n_components') vão para <output_csv>_rodadas.csv.
+
+    Returns:
+        DataFrame com os resultados da última rodada, no layout de output_csv.
+    """
+    if tipo == "logged":
+        grid = grid or GRID_LOGGED
+        configs, score_key, columns = expandir_grid(grid), "ndcg_k", COLUMNS_LOGGED
+        min_resource, max_resource = min_resource or 500, max_resource or 20000
+        dados = {
+            "users_clean": os.path.join(REFINED_DIR, "users_clean.parquet"),
+            "validacao": os.path.join(REFINED_DIR, "validacao.parquet"),
+            "items": os.path.join(REFINED_DIR, "items.parquet"),
+        }
+    elif tipo == "semianon":
+        grid = grid or GRID_SEMIANON
+        configs, score_key, columns = expandir_grid(grid), "silhouette", COLUMNS_SEMIANON
+        min_resource, max_resource = min_resource or 5000, max_resource or 50000
+        dados = {"users_semianon": os.path.join(REFINED_DIR, "users_semianon.parquet")}
+    else:
+        raise ValueError(f"Tipo de modelo desconhecido: {tipo}")
+
+    logger.info(f"Grid search '{tipo}': {len(configs)} configurações.")
+    impressao = impressao_entradas(dados)
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(tipo, dados, impressao)
+    ) as executor:
+        rodadas, finais = successive_halving(
+            executor, tipo, configs, score_key, min_resource, max_resource, eta
+        )
+
+    df_results = pd.DataFrame(finais, columns=columns)
+    output_csv = output_csv or os.path.join(GRID_SEARCH_DIR, f"grid_search_{tipo}.csv")
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+    df_results.to_csv(output_csv, index=False)
+    pd.DataFrame(rodadas).to_csv(f"{os.path.splitext(output_csv)[0]}_rodadas.csv", index=False)
+
+    best = pd.DataFrame(finais).loc[df_results[score_key].idxmax()]
+    logger.info(f"Resultados salvos em {output_csv}. Melhor configuração:\n{best}")
+    return df_results
+
+
+def main():
+    executar_grid_search("logged")
+    executar_grid_search("semianon")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import logging
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from script_shared import config
+
+REFINED_DIR = os.path.join(config.BASE_PATH, "data", "refined")
+TRAIN_INPUTS_DIR = config.TRAIN_INPUTS_DIR
+
+# Entradas compartilhadas pelos treinamentos (nome -> arquivo Parquet em refined)
+TRAIN_INPUTS = {
+    "items": "items.parquet",
+    "users_clean": "users_clean.parquet",
+    "users_logged": "users_logged.parquet",
+    "users_semianon": "users_semianon.parquet",
+    "users_semianon_raw": "users_semianon_raw.parquet",
+}
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _caminho_feather(nome: str) -> str:
+    return os.path.join(TRAIN_INPUTS_DIR, f"{nome}.arrow")
+
+
+def caminho_entrada(nome: str) -> str:
+    """Caminho do Parquet de refined que origina a entrada (usado nas chaves de artefatos)."""
+    return os.path.join(REFINED_DIR, TRAIN_INPUTS[nome])
+
+
+def _atualizado(destino: str, origem: str) -> bool:
+    return os.path.exists(destino) and (
+        not os.path.exists(origem) or os.path.getmtime(destino) >= os.path.getmtime(origem)
+    )
+
+
+def preparar_entradas(nomes: Optional[List[str]] = None) -> None:
+    """
+    Materializa as entradas dos treinamentos em Arrow IPC (Feather) sem compressão, que é
+    lido via memory-map pelos processos de treino sem decodificação do Parquet.
+
+    Entradas cujo Feather já é mais recente que o Parquet de origem são mantidas.
+
+    Args:
+        nomes: Entradas a preparar. Se None, prepara todas de TRAIN_INPUTS.
+    """
+    os.makedirs(TRAIN_INPUTS_DIR, exist_ok=True)
+    for nome in nomes or list(TRAIN_INPUTS):
+        origem = caminho_entrada(nome)
+        destino = _caminho_feather(nome)
+        if not os.path.exists(origem):
+            logger.warning(f"Entrada não encontrada, ignorada: {origem}")
+            continue
+        if _atualizado(destino, origem):
+            logger.info(f"Entrada {nome} já preparada.")
+            continue
+
+        tmp = f"{destino}.tmp"
+        feather.write_feather(pq.read_table(origem), tmp, compression="uncompressed")
+        os.replace(tmp, destino)
+        logger.info(f"✅ Entrada {nome} preparada em: {destino}")
+
+
+def carregar_entrada(nome: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Carrega uma entrada de treino, usando o Feather preparado quando disponível e não
+    defasado em relação ao Parquet de refined, e recorrendo ao Parquet caso contrário.
+
+    Args:
+        nome: Nome da entrada (chave de TRAIN_INPUTS).
+        columns: Colunas a carregar. Se None, carrega todas.
+    """
+    origem = caminho_entrada(nome)
+    destino = _caminho_feather(nome)
+    if _atualizado(destino, origem):
+        return feather.read_feather(destino, columns=columns, memory_map=True)
+    return pd.read_parquet(origem, columns=columns)
+
+
+def main():
+    preparar_entradas()
+
+
+if __name__ == "__main__":
+    main()
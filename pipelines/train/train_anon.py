@@ -6,6 +6,9 @@ from typing import Dict, Any
 import pandas as pd
 import numpy as np
 from script_shared import config
+from pipelines.train.shared_inputs import carregar_entrada, caminho_entrada
+from script_shared.artifacts import chave_artefato, artefato_reutilizavel, registrar_artefato
+from script_shared.models.model_anon import ANON_SCORES_FILE
 
 MODEL_DIR_ANON_HEURISTICO = config.MODEL_DIR_ANON_HEURISTICO
 DEFAULT_W_ISSUED = config.DEFAULT_W_ISSUED
@@ -64,9 +67,16 @@ def calcular_score_heuristico(
         w_issued * df_item["time_decay_issued"]
         + w_modified * df_item["time_decay_modified"]
     )
+    # Mesmo score em escala log: o decaimento chega a 0.0 (underflow) para itens com mais
+    # de ~2 anos, enquanto o log mantém a ordem e a razão entre os scores
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df_item["log_score"] = np.logaddexp(
+            np.log(w_issued) - df_item["hours_diff_issued"] / 24,
+            np.log(w_modified) - df_item["hours_diff_modified"] / 24,
+        )
 
     # Ordenar o DataFrame pelo score de forma decrescente e resetar o índice
-    df_item_sorted = df_item.sort_values(by="score", ascending=False).reset_index(
+    df_item_sorted = df_item.sort_values(by="log_score", ascending=False).reset_index(
         drop=True
     )
     logger.info("Score heurístico calculado com sucesso.")
@@ -91,10 +101,19 @@ def treinar_modelo_anon_heuristico(
     df_ranked = calcular_score_heuristico(df_item)
     ranking_item_ids = df_ranked["page"].tolist()
 
+    # Scores relativos ao primeiro do ranking: como o decaimento é comum a todos os itens,
+    # a razão entre scores não depende do instante do cálculo e vale na inferência. A razão
+    # é calculada em escala log, sem dividir scores que já sofreram underflow.
+    log_scores = df_ranked["log_score"].to_numpy(dtype=np.float64)
+    scores = np.zeros(len(log_scores))
+    if len(log_scores) and np.isfinite(log_scores[0]):
+        scores = np.nan_to_num(np.exp(log_scores - log_scores[0]), nan=0.0)
+
     os.makedirs(model_dir, exist_ok=True)
     ranking_path = os.path.join(model_dir, "ranking_anon_heuristico.pkl")
     with open(ranking_path, "wb") as f:
         pickle.dump(ranking_item_ids, f)
+    np.save(os.path.join(model_dir, ANON_SCORES_FILE), scores.astype(np.float32))
 
     logger.info("Modelo anônimo heurístico treinado e salvo com sucesso.")
     return {"ranking_anon": ranking_item_ids, "method": "heurístico"}
@@ -102,9 +121,30 @@ def treinar_modelo_anon_heuristico(
 
 def main():
     model_dir = MODEL_DIR_ANON_HEURISTICO
+    # A ordem do ranking não depende do instante do cálculo (o decaimento de 24h é comum
+    # às duas datas), então o ranking só muda com os itens, os pesos ou o código.
+    chave = chave_artefato(
+        [caminho_entrada("items")],
+        {"w_issued": DEFAULT_W_ISSUED, "w_modified": DEFAULT_W_MODIFIED},
+        ["pipelines.train.train_anon", "script_shared.models.model_anon"],
+    )
+    if artefato_reutilizavel(model_dir, "anon_heuristico", chave):
+        logger.info("Itens e parâmetros inalterados; ranking anônimo reaproveitado.")
+        return
+
     try:
-        df_item = pd.read_parquet("/opt/airflow/shared/script_shared/data/refined/items.parquet")
-        treinar_modelo_anon_heuristico(df_item, model_dir)
+        df_item = carregar_entrada("items")
+        resultado = treinar_modelo_anon_heuristico(df_item, model_dir)
+        registrar_artefato(
+            model_dir,
+            "anon_heuristico",
+            chave,
+            [
+                os.path.join(model_dir, "ranking_anon_heuristico.pkl"),
+                os.path.join(model_dir, ANON_SCORES_FILE),
+            ],
+            {"n_items": len(resultado["ranking_anon"])},
+        )
     except Exception as e:
         logger.warning(
             "Não foi possível treinar o modelo anônimo heurístico.", exc_info=e
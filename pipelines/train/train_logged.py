@@ -3,32 +3,40 @@ import pickle
 import logging
 from typing import Dict, Any, Optional
 import pandas as pd
-import scipy.sparse as sp
 from scipy.sparse import load_npz, save_npz
 from implicit.als import AlternatingLeastSquares
-from sklearn.feature_extraction.text import TfidfVectorizer
 from script_shared import config
+from pipelines.train.shared_inputs import carregar_entrada, caminho_entrada
+from script_shared.artifacts import (
+    chave_artefato,
+    artefato_reutilizavel,
+    registrar_artefato,
+    hash_arquivo,
+)
+from script_shared.models.model_logged import (
+    ARTEFATOS_LOGGED,
+    consistencia_logged,
+    completar_artefatos_als,
+)
+from script_shared.models.ann_index import ANN_INDEX_FILE, construir_indice_ivf, salvar_indice_ivf
+from pipelines.process_type_user import build_sparse_matrix, load_sparse_mappings
+from pipelines.train.content_vectorizer import vetorizar_conteudo
 
 ALS_DEFAULT_PARAMS = config.ALS_DEFAULT_PARAMS
 SPARSE_MATRIX_PATH = config.SPARSE_MATRIX_PATH
+SPARSE_MAPPINGS_PATH = config.SPARSE_MAPPINGS_PATH
 MODEL_DIR_LOGGED = config.MODEL_DIR_LOGGED
+ANN_LOGGED_PARAMS = config.ANN_LOGGED_PARAMS
 
-logger = logging.getLogger(__name__)
-
+TRAIN_MODULES = [
+    "pipelines.train.train_logged",
+    "pipelines.process_type_user",
+    "pipelines.train.content_vectorizer",
+    "script_shared.models.ann_index",
+    "script_shared.models.quantization",
+]
 
-def build_sparse_matrix(df_users: pd.DataFrame) -> sp.csr_matrix:
-    """
-    Constrói a matriz esparsa a partir do DataFrame de usuários logados.
-    """
-    logger.info("Construindo a matriz esparsa a partir do DataFrame...")
-    users = df_users["userId"].unique()
-    items = df_users["history"].unique()
-    rows = df_users["user_idx"].values
-    cols = df_users["item_idx"].values
-    vals = df_users["final_score"].values
-    matrix = sp.csr_matrix((vals, (rows, cols)), shape=(len(users), len(items)))
-    logger.info("Matriz esparsa construída.")
-    return matrix
+logger = logging.getLogger(__name__)
 
 
 def treinar_modelo_logged(
@@ -47,9 +55,12 @@ def treinar_modelo_logged(
     logger.info(f"{num_users} usuários logados encontrados.")
 
     # Carregar ou construir a matriz esparsa
+    sparse_mappings = None
     if os.path.exists(SPARSE_MATRIX_PATH):
         logger.info(f"Carregando matriz esparsa de: {SPARSE_MATRIX_PATH}")
         sparse_mat = load_npz(SPARSE_MATRIX_PATH)
+        # Mapeamentos persistidos junto à matriz (mantidos estáveis pela atualização incremental)
+        sparse_mappings = load_sparse_mappings(SPARSE_MAPPINGS_PATH)
         logger.info("Matriz esparsa carregada.")
     else:
         sparse_mat = build_sparse_matrix(df_users_logged)
@@ -65,22 +76,21 @@ def treinar_modelo_logged(
     model_als.fit(sparse_mat * als_params["alpha"])
     logger.info("Modelo ALS treinado.")
 
-    # Treinamento do modelo TF‑IDF
-    logger.info("Preparando dados para TF‑IDF...")
-    df_item["text_content"] = (
-        df_item["title"].fillna("") + " " + df_item["body"].fillna("")
-    )
-    logger.info("Treinando modelo TF‑IDF...")
-    tfidf = TfidfVectorizer(stop_words="english", max_features=20000)
-    tfidf_matrix = tfidf.fit_transform(df_item["text_content"])
-    logger.info("Modelo TF‑IDF treinado.")
+    # Vetorização de conteúdo (TF‑IDF incremental: só itens novos/alterados são tokenizados)
+    logger.info("Vetorizando conteúdo dos itens (TF‑IDF)...")
+    tfidf_matrix, tfidf, idf = vetorizar_conteudo(df_item)
+    logger.info("Matriz TF‑IDF gerada.")
 
     # Montar mapeamentos para inferência
     logger.info("Montando mapeamentos para inferência...")
-    user_ids = df_users_logged["userId"].unique()
-    item_ids_history = df_users_logged["history"].unique()
-    user_to_idx = {user: idx for idx, user in enumerate(user_ids)}
-    item_to_idx = {item: idx for idx, item in enumerate(item_ids_history)}
+    if sparse_mappings is not None:
+        user_to_idx = sparse_mappings["user_to_idx"]
+        item_to_idx = sparse_mappings["item_to_idx"]
+    else:
+        user_ids = df_users_logged["userId"].unique()
+        item_ids_history = df_users_logged["history"].unique()
+        user_to_idx = {user: idx for idx, user in enumerate(user_ids)}
+        item_to_idx = {item: idx for idx, item in enumerate(item_ids_history)}
     item_to_idx_content = {p: i for i, p in enumerate(df_item["page"].values)}
 
     aux_dict = {
@@ -90,27 +100,81 @@ def treinar_modelo_logged(
         "weight_cf": weight_cf,
         "top_n_cf": top_n_cf,
         "tfidf": tfidf,
+        "idf": idf,
     }
 
     # Salvando os artefatos treinados
     os.makedirs(MODEL_DIR_LOGGED, exist_ok=True)
     logger.info(f"Salvando modelo e artefatos em: {MODEL_DIR_LOGGED}")
     model_als.save(os.path.join(MODEL_DIR_LOGGED, "model_logged_als.npz"))
+    completar_artefatos_als(os.path.join(MODEL_DIR_LOGGED, "model_logged_als.npz"))
     with open(
         os.path.join(MODEL_DIR_LOGGED, "objetos_logged_auxiliares.pkl"), "wb"
     ) as f:
         pickle.dump(aux_dict, f)
     save_npz(os.path.join(MODEL_DIR_LOGGED, "tfidf_logged_matrix.npz"), tfidf_matrix)
 
+    # Índice ANN dos fatores de item (opcional na inferência, ver ANN_LOGGED_ENABLED)
+    ann_index = construir_indice_ivf(model_als.item_factors, **ANN_LOGGED_PARAMS)
+    salvar_indice_ivf(ann_index, os.path.join(MODEL_DIR_LOGGED, ANN_INDEX_FILE))
+
     logger.info("Modelo logado treinado e salvo com sucesso.")
     return {"model_als": model_als, "aux_dict": aux_dict, "tfidf_matrix": tfidf_matrix}
 
 
+def registrar_modelo_logged(
+    resultado: Dict[str, Any],
+    chave: Optional[Dict[str, Any]],
+    model_dir: str = MODEL_DIR_LOGGED,
+) -> None:
+    """
+    Registra os artefatos do modelo logado no manifesto, com os invariantes usados pelo
+    carregador da API (mapeamentos x fatores x histórico).
+    """
+    model_als = resultado["model_als"]
+    consistencia = consistencia_logged(
+        resultado["aux_dict"],
+        model_als.user_factors,
+        model_als.item_factors,
+        resultado["tfidf_matrix"],
+    )
+    consistencia["history_sha256"] = hash_arquivo(caminho_entrada("users_logged"))
+    registrar_artefato(
+        model_dir,
+        "logged",
+        chave,
+        [os.path.join(model_dir, nome) for nome in ARTEFATOS_LOGGED],
+        consistencia,
+    )
+
+
 def main():
+    params = {"als": ALS_DEFAULT_PARAMS, "weight_cf": 0.25, "top_n_cf": 120, "ann": ANN_LOGGED_PARAMS}
+    chave = chave_artefato(
+        [
+            caminho_entrada("users_logged"),
+            caminho_entrada("items"),
+            SPARSE_MATRIX_PATH,
+            SPARSE_MAPPINGS_PATH,
+        ],
+        params,
+        TRAIN_MODULES,
+    )
+    if artefato_reutilizavel(MODEL_DIR_LOGGED, "logged", chave):
+        logger.info("Entradas, parâmetros e código inalterados; modelo logado reaproveitado.")
+        return
+
     logger.info("Carregando dados processados...")
-    df_users_logged = pd.read_parquet("/opt/airflow/shared/script_shared/data/refined/users_logged.parquet")
-    df_item = pd.read_parquet("/opt/airflow/shared/script_shared/data/refined/items.parquet")
-    treinar_modelo_logged(df_users_logged, df_item)
+    df_users_logged = carregar_entrada("users_logged")
+    df_item = carregar_entrada("items")
+    resultado = treinar_modelo_logged(
+        df_users_logged,
+        df_item,
+        als_params=params["als"],
+        weight_cf=params["weight_cf"],
+        top_n_cf=params["top_n_cf"],
+    )
+    registrar_modelo_logged(resultado, chave)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,24 @@
 import os
+import time
 import pickle
+import tempfile
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterator, Union
 
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from script_shared import config
+from pipelines.train.shared_inputs import carregar_entrada, caminho_entrada
+from script_shared.artifacts import chave_artefato, artefato_reutilizavel, registrar_artefato
+from script_shared.models.model_semianon import ARTEFATOS_SEMIANON
 
 MODEL_DIR_SEMIANON = config.MODEL_DIR_SEMIANON
 FEATURE_COLUMNS_SEMIANON = config.FEATURE_COLUMNS_SEMIANON
+SEMIANON_TRAIN_MODE = config.SEMIANON_TRAIN_MODE
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -40,6 +48,7 @@ def treinar_modelo_semianon(
     best_init: str = "random",
     best_max_iter: int = 600,
     n_components: int = 5,
+    model_dir: str = MODEL_DIR_SEMIANON,
 ) -> Dict[str, Any]:
     """
     Treina o modelo para usuários semi-logados usando dados já processados.
@@ -50,6 +59,7 @@ def treinar_modelo_semianon(
       - df_semianon_raw: DataFrame com as interações individuais dos usuários semi-logados.
                         Se fornecido, será usado para gerar o mapeamento de itens populares por cluster.
       - dias_limite, best_k, best_init, best_max_iter, n_components: parâmetros para filtragem, PCA e clustering.
+      - model_dir: diretório onde os artefatos são salvos.
 
     Retorna um dicionário com:
       - kmeans_model: modelo KMeans treinado.
@@ -57,6 +67,7 @@ def treinar_modelo_semianon(
       - pca: objeto PCA.
       - cluster_top_items: mapeamento dos itens populares por cluster.
       - df_features: DataFrame com as features e cluster para cada usuário.
+      - metrics: tempo de treinamento do KMeans e inércia.
     """
     logger.info(f"{df_semianon.shape[0]} usuários semi-logados agregados encontrados.")
 
@@ -70,6 +81,7 @@ def treinar_modelo_semianon(
     df_features = cap_outliers(df_features, FEATURE_COLUMNS_SEMIANON)
 
     # Normalização e redução de dimensionalidade via PCA
+    inicio = time.perf_counter()
     scaler = StandardScaler()
     X_raw = df_features[FEATURE_COLUMNS_SEMIANON].values
     X_scaled = scaler.fit_transform(X_raw)
@@ -85,74 +97,431 @@ def treinar_modelo_semianon(
         n_clusters=best_k, init=best_init, max_iter=best_max_iter, random_state=42
     )
     kmeans_model.fit(X_pca)
+    metrics = {
+        "train_seconds": time.perf_counter() - inicio,
+        "inertia": float(kmeans_model.inertia_),
+    }
+    logger.info(
+        f"Scaler, PCA e KMeans treinados em {metrics['train_seconds']:.2f}s (inércia: {metrics['inertia']:.2f})."
+    )
     df_features["cluster"] = kmeans_model.labels_
     logger.info("Distribuição dos clusters:")
     logger.info(df_features["cluster"].value_counts())
 
-    # Gerar mapeamento de itens populares por cluster (se dados individuais disponíveis)
+    cluster_top_items = gerar_top_itens_cluster(df_semianon_raw, df_features)
+    salvar_artefatos_semianon(
+        kmeans_model, scaler, pca, cluster_top_items, df_features, model_dir
+    )
+
+    logger.info("Modelo de usuários semi-logados treinado e salvo!")
+    return {
+        "kmeans_model": kmeans_model,
+        "scaler": scaler,
+        "pca": pca,
+        "cluster_top_items": cluster_top_items,
+        "df_features": df_features,
+        "metrics": metrics,
+    }
+
+
+def gerar_top_itens_cluster(
+    df_semianon_raw: Optional[pd.DataFrame],
+    df_features: pd.DataFrame,
+    top_n: int = 10,
+    half_life_days: Optional[float] = None,
+) -> Dict[int, List[Any]]:
+    """
+    Gera o mapeamento dos itens mais populares por cluster a partir das interações
+    individuais (se disponíveis), com uma única contagem agrupada por (cluster, item)
+    seguida da seleção dos top_n de cada grupo.
+
+    Args:
+        df_semianon_raw: Interações individuais (colunas 'userId', 'history' e, para recência,
+                         'timestampHistory' em ms).
+        df_features: DataFrame com as colunas 'userId' e 'cluster'.
+        top_n: Número de itens por cluster.
+        half_life_days: Se definido, cada interação pesa 0.5 ** (idade em dias / half_life_days).
+
+    Returns:
+        Dicionário cluster -> lista de itens, ordenados por popularidade.
+    """
     cluster_top_items: Dict[int, List[Any]] = {}
-    if df_semianon_raw is not None:
-        logger.info("Gerando mapeamento de itens populares por cluster...")
-        df_merged = df_semianon_raw.merge(
-            df_features[["userId", "cluster"]], on="userId", how="left"
-        )
-        for cluster in df_merged["cluster"].dropna().unique():
-            top_items = (
-                df_merged[df_merged["cluster"] == cluster]["history"]
-                .value_counts()
-                .head(10)
-                .index.tolist()
-            )
-            cluster_top_items[int(cluster)] = top_items
-        logger.info("Mapa de itens por cluster gerado.")
-    else:
+    if df_semianon_raw is None:
         logger.info("Dados individuais não fornecidos; usando mapeamento vazio.")
+        return cluster_top_items
+
+    logger.info("Gerando mapeamento de itens populares por cluster...")
+    cluster_por_usuario = pd.Series(
+        df_features["cluster"].to_numpy(), index=df_features["userId"].to_numpy()
+    )
+    cluster_por_usuario = cluster_por_usuario[~cluster_por_usuario.index.duplicated()]
+    df_inter = pd.DataFrame(
+        {
+            "cluster": df_semianon_raw["userId"].map(cluster_por_usuario).to_numpy(),
+            "history": df_semianon_raw["history"].to_numpy(),
+        }
+    )
+    if half_life_days is not None:
+        ts = pd.to_numeric(df_semianon_raw["timestampHistory"], errors="coerce").to_numpy()
+        idade_dias = (np.nanmax(ts) - ts) / (1000 * 60 * 60 * 24)
+        df_inter["peso"] = np.nan_to_num(0.5 ** (idade_dias / half_life_days))
+    else:
+        df_inter["peso"] = 1.0
+    df_inter = df_inter.dropna(subset=["cluster"])
+
+    contagens = (
+        df_inter.groupby(["cluster", "history"], sort=False)["peso"]
+        .sum()
+        .reset_index()
+        .sort_values(["cluster", "peso", "history"], ascending=[True, False, True])
+    )
+    top = contagens.groupby("cluster", sort=True).head(top_n)
+    for cluster, itens in top.groupby("cluster", sort=True)["history"]:
+        cluster_top_items[int(cluster)] = itens.tolist()
+
+    logger.info("Mapa de itens por cluster gerado.")
+    return cluster_top_items
+
 
-    # Salvar artefatos do modelo
-    os.makedirs(MODEL_DIR_SEMIANON, exist_ok=True)
-    with open(
-        os.path.join(MODEL_DIR_SEMIANON, "modelo_semianon_kmeans.pkl"), "wb"
-    ) as f:
+def top_itens_para_arrays(cluster_top_items: Dict[int, List[Any]]) -> Dict[str, np.ndarray]:
+    """
+    Converte o mapeamento cluster -> itens em arrays compactos (formato CSR):
+    'clusters', 'indptr' e 'items'.
+    """
+    clusters = np.array(sorted(cluster_top_items), dtype=np.int64)
+    tamanhos = [len(cluster_top_items[c]) for c in clusters]
+    itens = [str(item) for c in clusters for item in cluster_top_items[c]]
+    return {
+        "clusters": clusters,
+        "indptr": np.concatenate([[0], np.cumsum(tamanhos)]).astype(np.int64),
+        "items": np.array(itens, dtype=str),
+    }
+
+
+def salvar_artefatos_semianon(
+    kmeans_model: Any,
+    scaler: Any,
+    pca: Any,
+    cluster_top_items: Dict[int, List[Any]],
+    df_features: pd.DataFrame,
+    model_dir: str = MODEL_DIR_SEMIANON,
+) -> None:
+    """
+    Salva os artefatos do modelo de usuários semi-logados.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, "modelo_semianon_kmeans.pkl"), "wb") as f:
         pickle.dump(kmeans_model, f)
-    with open(os.path.join(MODEL_DIR_SEMIANON, "scaler_semianon.pkl"), "wb") as f:
+    with open(os.path.join(model_dir, "scaler_semianon.pkl"), "wb") as f:
         pickle.dump(scaler, f)
-    with open(os.path.join(MODEL_DIR_SEMIANON, "pca_semianon.pkl"), "wb") as f:
+    with open(os.path.join(model_dir, "pca_semianon.pkl"), "wb") as f:
         pickle.dump(pca, f)
-    with open(os.path.join(MODEL_DIR_SEMIANON, "cluster_top_items.pkl"), "wb") as f:
-        pickle.dump(cluster_top_items, f)
+    np.savez(
+        os.path.join(model_dir, "cluster_top_items.npz"),
+        **top_itens_para_arrays(cluster_top_items),
+    )
     df_features.to_csv(
-        os.path.join(MODEL_DIR_SEMIANON, "df_features_semianon.csv"), index=False
+        os.path.join(model_dir, "df_features_semianon.csv"), index=False
     )
 
-    logger.info("Modelo de usuários semi-logados treinado e salvo!")
+
+def iterar_features(
+    source: Union[str, pd.DataFrame], chunk_size: int, dias_limite: int
+) -> Iterator[pd.DataFrame]:
+    """
+    Itera sobre as features dos usuários semi-logados em blocos, já filtradas por recência.
+
+    Args:
+        source: Caminho de um arquivo Parquet ou DataFrame em memória.
+        chunk_size: Número de linhas por bloco.
+        dias_limite: Limite de dias desde a última interação.
+    """
+    colunas = ["userId", "days_since_last"] + FEATURE_COLUMNS_SEMIANON
+    if isinstance(source, pd.DataFrame):
+        blocos = (
+            source.iloc[i : i + chunk_size][colunas]
+            for i in range(0, len(source), chunk_size)
+        )
+    else:
+        blocos = (
+            b.to_pandas()
+            for b in pq.ParquetFile(source).iter_batches(batch_size=chunk_size, columns=colunas)
+        )
+    for bloco in blocos:
+        bloco = bloco[bloco["days_since_last"] <= dias_limite]
+        if not bloco.empty:
+            yield bloco
+
+
+def _carregar_modelo_anterior(model_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Carrega scaler, PCA e centróides da execução anterior (para warm start), se existirem.
+    """
+    try:
+        objetos = {}
+        for chave, arquivo in [
+            ("kmeans_model", "modelo_semianon_kmeans.pkl"),
+            ("scaler", "scaler_semianon.pkl"),
+            ("pca", "pca_semianon.pkl"),
+        ]:
+            with open(os.path.join(model_dir, arquivo), "rb") as f:
+                objetos[chave] = pickle.load(f)
+        return objetos
+    except (OSError, pickle.UnpicklingError):
+        return None
+
+
+def treinar_modelo_semianon_streaming(
+    features_source: Union[str, pd.DataFrame],
+    df_semianon_raw: Optional[pd.DataFrame] = None,
+    dias_limite: int = 30,
+    best_k: int = 5,
+    n_components: int = 5,
+    chunk_size: int = 100_000,
+    n_epochs: int = 3,
+    cap_quantile: float = 0.99,
+    cap_sample_size: int = 200_000,
+    warm_start: bool = True,
+    model_dir: str = MODEL_DIR_SEMIANON,
+) -> Dict[str, Any]:
+    """
+    Treina o modelo semi-logado consumindo as features em blocos, com StandardScaler.partial_fit,
+    IncrementalPCA e MiniBatchKMeans, sem manter a tabela de features inteira em memória.
+
+    Passadas sobre os dados: (1) amostra para os limites de outliers, (2) scaler, (3) PCA
+    incremental, (4) n_epochs de mini-batch k-means e (5) atribuição dos clusters e inércia.
+    Com warm_start, os centróides da execução anterior são levados ao espaço original (PCA e
+    scaler inversos) e projetados no novo espaço para iniciar o k-means.
+
+    Args:
+        features_source: Parquet (ex.: "users_semianon.parquet") ou DataFrame agregado dos usuários.
+        df_semianon_raw: Interações individuais, usadas para os itens populares por cluster.
+        dias_limite, best_k, n_components: parâmetros de filtragem, clustering e PCA.
+        chunk_size: Número de usuários por bloco.
+        n_epochs: Número de passadas do mini-batch k-means.
+        cap_quantile: Quantil usado para limitar outliers.
+        cap_sample_size: Tamanho máximo da amostra usada no cálculo dos limites.
+        warm_start: Inicia o k-means a partir dos centróides da execução anterior.
+        model_dir: Diretório dos artefatos.
+
+    Returns:
+        Dicionário com os mesmos artefatos do modo em lote, mais "metrics"
+        (tempo de treinamento e inércia).
+    """
+    inicio = time.perf_counter()
+
+    def blocos() -> Iterator[pd.DataFrame]:
+        return iterar_features(features_source, chunk_size, dias_limite)
+
+    # (1) Limites de outliers a partir de uma amostra uniforme (bottom-k por chave aleatória)
+    rng = np.random.default_rng(42)
+    amostra, total = None, 0
+    for bloco in blocos():
+        total += len(bloco)
+        parte = bloco[FEATURE_COLUMNS_SEMIANON].assign(_chave=rng.random(len(bloco)))
+        amostra = parte if amostra is None else pd.concat([amostra, parte])
+        amostra = amostra.nsmallest(cap_sample_size, "_chave")
+    if total == 0:
+        raise ValueError("Nenhum usuário semi-logado dentro do limite de dias.")
+    limites = amostra[FEATURE_COLUMNS_SEMIANON].quantile(cap_quantile)
+    logger.info(f"{total} usuários semi-logados após filtragem por dias.")
+
+    def preparar(bloco: pd.DataFrame) -> np.ndarray:
+        return bloco[FEATURE_COLUMNS_SEMIANON].clip(upper=limites, axis=1).fillna(0).values
+
+    # (2) Normalização
+    scaler = StandardScaler()
+    for bloco in blocos():
+        scaler.partial_fit(preparar(bloco))
+
+    # (3) PCA incremental (cada bloco precisa ter ao menos n_components linhas)
+    pca = IncrementalPCA(n_components=n_components)
+    for bloco in blocos():
+        if len(bloco) >= n_components:
+            pca.partial_fit(scaler.transform(preparar(bloco)))
+    logger.info(
+        f"Soma da variância explicada pelo PCA: {pca.explained_variance_ratio_.sum():.2f}"
+    )
+
+    # (4) Mini-batch k-means, com warm start opcional
+    init: Any = "k-means++"
+    anterior = _carregar_modelo_anterior(model_dir) if warm_start else None
+    if anterior is not None and anterior["kmeans_model"].n_clusters == best_k:
+        centros = anterior["scaler"].inverse_transform(
+            anterior["pca"].inverse_transform(anterior["kmeans_model"].cluster_centers_)
+        )
+        init = pca.transform(scaler.transform(centros))
+        logger.info("Warm start a partir dos centróides da execução anterior.")
+
+    kmeans_model = MiniBatchKMeans(
+        n_clusters=best_k, init=init, n_init=1, batch_size=min(chunk_size, 10_000),
+        random_state=42,
+    )
+    for _ in range(n_epochs):
+        for bloco in blocos():
+            X_pca = pca.transform(scaler.transform(preparar(bloco)))
+            if len(X_pca) >= best_k:
+                kmeans_model.partial_fit(X_pca)
+
+    # (5) Atribuição dos clusters e inércia
+    partes, inertia = [], 0.0
+    for bloco in blocos():
+        X_pca = pca.transform(scaler.transform(preparar(bloco)))
+        distancias = kmeans_model.transform(X_pca)
+        labels = distancias.argmin(axis=1)
+        inertia += float((distancias.min(axis=1) ** 2).sum())
+        df_bloco = bloco[["userId"]].copy()
+        df_bloco[FEATURE_COLUMNS_SEMIANON] = preparar(bloco)
+        df_bloco["cluster"] = labels
+        partes.append(df_bloco)
+    df_features = pd.concat(partes, ignore_index=True)
+
+    metrics = {"train_seconds": time.perf_counter() - inicio, "inertia": inertia}
+    logger.info(
+        f"Mini-batch k-means treinado em {metrics['train_seconds']:.2f}s "
+        f"(inércia: {metrics['inertia']:.2f})."
+    )
+    logger.info("Distribuição dos clusters:")
+    logger.info(df_features["cluster"].value_counts())
+
+    cluster_top_items = gerar_top_itens_cluster(df_semianon_raw, df_features)
+    salvar_artefatos_semianon(
+        kmeans_model, scaler, pca, cluster_top_items, df_features, model_dir
+    )
+
+    logger.info("Modelo de usuários semi-logados (streaming) treinado e salvo!")
     return {
         "kmeans_model": kmeans_model,
         "scaler": scaler,
         "pca": pca,
         "cluster_top_items": cluster_top_items,
         "df_features": df_features,
+        "metrics": metrics,
     }
 
 
+def _inercia(X: np.ndarray, labels: np.ndarray) -> float:
+    """Soma das distâncias quadradas de cada ponto à média do seu cluster."""
+    return float(sum(
+        ((X[labels == c] - X[labels == c].mean(axis=0)) ** 2).sum() for c in np.unique(labels)
+    ))
+
+
+def comparar_modos_semianon(
+    df_semianon: pd.DataFrame, df_item: pd.DataFrame, **params: Any
+) -> pd.DataFrame:
+    """
+    Treina o modelo semi-logado nos modos em lote e streaming (em diretórios temporários,
+    sem warm start) e compara o tempo total de cada treinamento (da filtragem à gravação
+    dos artefatos) e a inércia.
+
+    Cada modo ajusta o próprio scaler e PCA, então as inércias internas não são
+    comparáveis: os clusters dos dois modos são avaliados no mesmo espaço, o das features
+    do modo em lote (outliers limitados) padronizadas, sem PCA.
+
+    Args:
+        df_semianon: DataFrame agregado dos usuários semi-logados.
+        df_item: DataFrame dos itens.
+        params: Parâmetros comuns (dias_limite, best_k, n_components).
+
+    Returns:
+        DataFrame com uma linha por modo ('train_seconds' e 'inertia').
+    """
+    tempos = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inicio = time.perf_counter()
+        batch = treinar_modelo_semianon(
+            df_semianon, df_item, model_dir=os.path.join(tmp_dir, "batch"), **params
+        )
+        tempos["batch"] = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        streaming = treinar_modelo_semianon_streaming(
+            df_semianon, model_dir=os.path.join(tmp_dir, "streaming"),
+            warm_start=False, **params,
+        )
+        tempos["streaming"] = time.perf_counter() - inicio
+
+    df_comum = batch["df_features"].drop_duplicates("userId")
+    X = StandardScaler().fit_transform(df_comum[FEATURE_COLUMNS_SEMIANON].values)
+    resultados = []
+    for modo, resultado in [("batch", batch), ("streaming", streaming)]:
+        clusters = resultado["df_features"].drop_duplicates("userId").set_index("userId")["cluster"]
+        labels = df_comum["userId"].map(clusters)
+        presentes = labels.notna().to_numpy()
+        resultados.append({
+            "mode": modo,
+            "train_seconds": tempos[modo],
+            "inertia": _inercia(X[presentes], labels[presentes].to_numpy()),
+        })
+
+    df_resultados = pd.DataFrame(resultados)
+    logger.info(f"Comparação dos modos de treinamento:\n{df_resultados}")
+    return df_resultados
+
+
+def registrar_modelo_semianon(
+    resultado: Dict[str, Any],
+    chave: Optional[Dict[str, Any]],
+    model_dir: str = MODEL_DIR_SEMIANON,
+) -> None:
+    """
+    Registra os artefatos do modelo semi-logado no manifesto, com os invariantes usados
+    pelo carregador da API.
+    """
+    registrar_artefato(
+        model_dir,
+        "semianon",
+        chave,
+        [os.path.join(model_dir, nome) for nome in ARTEFATOS_SEMIANON],
+        {
+            "n_clusters": int(resultado["kmeans_model"].n_clusters),
+            "n_users": int(len(resultado["df_features"])),
+        },
+    )
+
+
 def main():
-    try:
-        df_semianon = pd.read_parquet("/opt/airflow/shared/script_shared/data/refined/users_semianon.parquet")
-        df_item = pd.read_parquet("/opt/airflow/shared/script_shared/data/refined/items.parquet")
-        df_semianon_raw = pd.read_parquet("/opt/airflow/shared/script_shared/data/refined/users_semianon_raw.parquet")
-    except Exception as e:
-        logger.error("Erro ao carregar dados para treinamento semianon", exc_info=e)
+    if SEMIANON_TRAIN_MODE == "streaming":
+        params = {"dias_limite": 30, "best_k": 5, "n_components": 5}
+    else:
+        params = {
+            "dias_limite": 30,
+            "best_k": 5,
+            "best_init": "random",
+            "best_max_iter": 600,
+            "n_components": 5,
+        }
+    chave = chave_artefato(
+        [caminho_entrada("users_semianon"), caminho_entrada("users_semianon_raw")],
+        {"mode": SEMIANON_TRAIN_MODE, **params},
+        ["pipelines.train.train_semianon"],
+    )
+    if artefato_reutilizavel(MODEL_DIR_SEMIANON, "semianon", chave):
+        logger.info("Entradas, parâmetros e código inalterados; modelo semianon reaproveitado.")
         return
 
-    treinar_modelo_semianon(
-        df_semianon,
-        df_item,
-        df_semianon_raw,
-        dias_limite=30,
-        best_k=5,
-        best_init="random",
-        best_max_iter=600,
-        n_components=5,
-    )
+    if SEMIANON_TRAIN_MODE == "streaming":
+        try:
+            df_semianon_raw = carregar_entrada("users_semianon_raw")
+        except Exception as e:
+            logger.error("Erro ao carregar dados para treinamento semianon", exc_info=e)
+            return
+
+        resultado = treinar_modelo_semianon_streaming(
+            caminho_entrada("users_semianon"), df_semianon_raw, **params
+        )
+    else:
+        try:
+            df_semianon = carregar_entrada("users_semianon")
+            df_item = carregar_entrada("items")
+            df_semianon_raw = carregar_entrada("users_semianon_raw")
+        except Exception as e:
+            logger.error("Erro ao carregar dados para treinamento semianon", exc_info=e)
+            return
+
+        resultado = treinar_modelo_semianon(df_semianon, df_item, df_semianon_raw, **params)
+
+    registrar_modelo_semianon(resultado, chave)
     logger.info("Treinamento concluído.")
 
 
@@ -0,0 +1,159 @@
+import os
+import logging
+from typing import Dict, Any, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from script_shared import config
+from pipelines.train.shared_inputs import carregar_entrada, caminho_entrada
+from script_shared.artifacts import chave_artefato, artefato_reutilizavel, registrar_artefato
+from script_shared.models.model_similar import salvar_tabela_similares
+from script_shared.models.model_session import COVISITATION_FILE
+
+MODEL_DIR_SESSION = config.MODEL_DIR_SESSION
+SESSION_COVIS_PARAMS = config.SESSION_COVIS_PARAMS
+
+TRAIN_MODULES = [
+    "pipelines.train.train_session",
+    "script_shared.models.model_similar",
+]
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def montar_sessoes(
+    df_users: pd.DataFrame, window_minutes: int = 30
+) -> Tuple[sp.csr_matrix, np.ndarray]:
+    """
+    Agrupa as leituras em sessões e monta a matriz binária sessões x páginas. As leituras
+    de cada usuário são ordenadas pelo timestamp e uma nova sessão começa quando o
+    intervalo desde a leitura anterior passa de window_minutes minutos. Sessões com uma
+    única página não geram pares e são descartadas.
+
+    Args:
+        df_users: Interações com as colunas 'userId', 'history' e 'timestampHistory' (ms).
+        window_minutes: Intervalo máximo entre leituras consecutivas da mesma sessão.
+
+    Returns:
+        Tupla (matriz CSR sessões x páginas, páginas na ordem das colunas).
+    """
+    df = df_users[["userId", "history", "timestampHistory"]].dropna()
+    ts = pd.to_numeric(df["timestampHistory"], errors="coerce").to_numpy()
+    valido = ~np.isnan(ts)
+    usuarios, _ = pd.factorize(df["userId"].to_numpy()[valido])
+    ts = ts[valido]
+    ordem = np.lexsort((ts, usuarios))
+    nova = np.ones(len(ordem), dtype=bool)
+    nova[1:] = (np.diff(usuarios[ordem]) != 0) | (np.diff(ts[ordem]) > window_minutes * 60 * 1000)
+    sessoes = np.empty(len(ordem), dtype=np.int64)
+    sessoes[ordem] = np.cumsum(nova) - 1
+    itens, pages = pd.factorize(df["history"].to_numpy()[valido])
+
+    X = sp.coo_matrix(
+        (np.ones(len(sessoes), dtype=np.float32), (sessoes, itens)),
+        shape=(sessoes.max(initial=-1) + 1, len(pages)),
+    ).tocsr()
+    X.sum_duplicates()
+    X.data[:] = 1.0
+    X = X[np.diff(X.indptr) > 1]
+    logger.info(f"{X.shape[0]} sessões com mais de uma página, {len(pages)} páginas.")
+    return X, np.asarray(pages)
+
+
+def podar_top_n(
+    rows: np.ndarray, cols: np.ndarray, data: np.ndarray, n_rows: int, top_n: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mantém as top_n maiores entradas de cada linha de uma matriz em coordenadas.
+
+    Returns:
+        Tupla (indptr, indices, data) em CSR, com as entradas de cada linha em ordem
+        decrescente de valor.
+    """
+    ordem = np.lexsort((cols, -data, rows))
+    rows, cols, data = rows[ordem], cols[ordem], data[ordem]
+    inicio_linha = np.searchsorted(rows, np.arange(n_rows))
+    manter = np.arange(len(rows)) - inicio_linha[rows] < top_n
+    rows, cols, data = rows[manter], cols[manter], data[manter]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_rows))])
+    return indptr.astype(np.int64), cols, data
+
+
+def contar_covisitacao(
+    X: sp.csr_matrix, top_n: int = 50, block_size: int = 4096
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Conta, para cada par de páginas, o número de sessões em que ambas foram lidas
+    (X^T X) em blocos de block_size páginas, podando cada bloco para os top_n vizinhos
+    de cada página antes de calcular o próximo. A memória fica limitada ao produto de um
+    bloco, e não à matriz completa de co-visitação.
+
+    Returns:
+        Tupla (indptr, indices, contagens) da tabela de co-visitação em CSR.
+    """
+    n_itens = X.shape[1]
+    Xt = X.T.tocsr()
+    partes_ptr, partes_idx, partes_val = [np.zeros(1, dtype=np.int64)], [], []
+    for start in range(0, n_itens, block_size):
+        end = min(start + block_size, n_itens)
+        C = (Xt[start:end] @ X).tocoo()
+        fora_diagonal = C.row + start != C.col
+        indptr, indices, data = podar_top_n(
+            C.row[fora_diagonal], C.col[fora_diagonal], C.data[fora_diagonal], end - start, top_n
+        )
+        partes_ptr.append(indptr[1:] + partes_ptr[-1][-1])
+        partes_idx.append(indices)
+        partes_val.append(data)
+        logger.info(f"Co-visitação: páginas {start}-{end} de {n_itens}.")
+
+    return (
+        np.concatenate(partes_ptr),
+        np.concatenate(partes_idx) if partes_idx else np.zeros(0, dtype=np.int32),
+        np.concatenate(partes_val) if partes_val else np.zeros(0, dtype=np.float32),
+    )
+
+
+def treinar_modelo_sessao(
+    df_users: pd.DataFrame,
+    model_dir: str = MODEL_DIR_SESSION,
+    window_minutes: int = 30,
+    top_n: int = 50,
+    block_size: int = 4096,
+) -> Dict[str, Any]:
+    """
+    Gera e salva a tabela de co-visitação usada nas recomendações por sessão de anônimos.
+    """
+    X, pages = montar_sessoes(df_users, window_minutes)
+    indptr, indices, contagens = contar_covisitacao(X, top_n, block_size)
+
+    os.makedirs(model_dir, exist_ok=True)
+    salvar_tabela_similares(os.path.join(model_dir, COVISITATION_FILE), pages, indptr, indices, contagens)
+    logger.info("Modelo de sessão treinado e salvo com sucesso.")
+    return {"n_items": int(len(pages)), "n_neighbours": int(len(indices))}
+
+
+def main():
+    chave = chave_artefato(
+        [caminho_entrada("users_clean")], SESSION_COVIS_PARAMS, TRAIN_MODULES
+    )
+    if artefato_reutilizavel(MODEL_DIR_SESSION, "session", chave):
+        logger.info("Interações e parâmetros inalterados; tabela de co-visitação reaproveitada.")
+        return
+
+    df_users = carregar_entrada("users_clean", columns=["userId", "history", "timestampHistory"])
+    resultado = treinar_modelo_sessao(df_users, MODEL_DIR_SESSION, **SESSION_COVIS_PARAMS)
+    registrar_artefato(
+        MODEL_DIR_SESSION,
+        "session",
+        chave,
+        [os.path.join(MODEL_DIR_SESSION, COVISITATION_FILE)],
+        resultado,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import os
+import pickle
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import load_npz
+from threadpoolctl import threadpool_limits
+from script_shared import config
+from script_shared.artifacts import chave_artefato, artefato_reutilizavel, registrar_artefato
+from script_shared.models.model_similar import SIMILAR_TABLE_FILE, salvar_tabela_similares
+from pipelines.evaluate.engine import salvar_arrays_mmap, carregar_arrays_mmap, linhas_csr
+
+MODEL_DIR_LOGGED = config.MODEL_DIR_LOGGED
+MODEL_DIR_SIMILAR = config.MODEL_DIR_SIMILAR
+SIMILAR_ITEMS_PARAMS = config.SIMILAR_ITEMS_PARAMS
+
+TRAIN_MODULES = [
+    "pipelines.train.train_similar",
+    "script_shared.models.model_similar",
+]
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Arrays memory-mapped do processo (preenchidos pelo inicializador do pool)
+_ARRAYS: Dict[str, Any] = {}
+
+
+def fatores_normalizados(
+    item_factors: np.ndarray, item_to_idx: Dict[str, int], pages: np.ndarray
+) -> np.ndarray:
+    """
+    Fatores do ALS normalizados (L2) na ordem de 'pages'. Páginas sem fator (sem
+    interações no treino) recebem vetor nulo, ou seja, similaridade colaborativa 0.
+    """
+    rows = np.array([item_to_idx.get(p, -1) for p in pages], dtype=np.int64)
+    fatores = np.zeros((len(pages), item_factors.shape[1]), dtype=np.float32)
+    fatores[rows >= 0] = item_factors[rows[rows >= 0]]
+    normas = np.linalg.norm(fatores, axis=1)
+    normas[normas == 0] = 1.0
+    return fatores / normas[:, None]
+
+
+def top_similares_bloco(
+    arrays: Dict[str, Any], start: int, end: int
+) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Calcula os top_n vizinhos dos itens [start, end): similaridade de cosseno dos fatores
+    do ALS (produto denso) e do TF-IDF (produto esparso), combinadas por weight_cf.
+
+    Returns:
+        Tupla (start, índices dos vizinhos, scores), ambos (end - start) x top_n.
+    """
+    top_n = int(arrays["top_n"])
+    weight_cf = float(arrays["weight_cf"])
+    n_itens = arrays["fatores"].shape[0]
+
+    scores = np.zeros((end - start, n_itens), dtype=np.float32)
+    if weight_cf > 0:
+        scores += weight_cf * (np.asarray(arrays["fatores"][start:end]) @ np.asarray(arrays["fatores"]).T)
+    if weight_cf < 1:
+        bloco = linhas_csr(
+            arrays["tfidf_indptr"], arrays["tfidf_indices"], arrays["tfidf_data"],
+            start, end, arrays["tfidf_shape"][1],
+        )
+        scores += ((1.0 - weight_cf) * (bloco @ arrays["tfidf_T"])).toarray()
+    scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+    k = min(top_n, n_itens - 1)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    ordem = np.argsort(-top_scores, axis=1, kind="stable")
+    return (
+        start,
+        np.take_along_axis(top, ordem, axis=1).astype(np.int32),
+        np.take_along_axis(top_scores, ordem, axis=1),
+    )
+
+
+def _preparar_arrays(caminhos: Dict[str, str]) -> Dict[str, Any]:
+    arrays: Dict[str, Any] = carregar_arrays_mmap(caminhos)
+    # Transposta do TF-IDF em CSR, montada sobre os arrays memory-mapped (sem cópia)
+    arrays["tfidf_T"] = sp.csr_matrix(
+        (arrays["tfidf_T_data"], arrays["tfidf_T_indices"], arrays["tfidf_T_indptr"]),
+        shape=(arrays["tfidf_shape"][1], arrays["tfidf_shape"][0]),
+    )
+    return arrays
+
+
+def _init_worker(caminhos: Dict[str, str]) -> None:
+    threadpool_limits(1)
+    _ARRAYS.clear()
+    _ARRAYS.update(_preparar_arrays(caminhos))
+
+
+def _executar_bloco(start: int, end: int) -> Tuple[int, np.ndarray, np.ndarray]:
+    return top_similares_bloco(_ARRAYS, start, end)
+
+
+def calcular_tabela_similares(
+    fatores: np.ndarray,
+    tfidf_matrix: sp.csr_matrix,
+    top_n: int = 20,
+    weight_cf: float = 0.5,
+    n_workers: Optional[int] = None,
+    max_scores: int = 1 << 25,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calcula os top_n itens mais similares de cada item em blocos de linhas, com no máximo
+    max_scores similaridades materializadas por bloco. Os blocos são distribuídos em um
+    pool de processos, que abrem os fatores e o TF-IDF via memory-map.
+
+    Args:
+        fatores: Fatores do ALS normalizados, alinhados às linhas do TF-IDF.
+        tfidf_matrix: Matriz TF-IDF com linhas normalizadas (L2).
+        top_n: Número de vizinhos por item.
+        weight_cf: Peso da similaridade colaborativa (1 - weight_cf para o conteúdo).
+        n_workers: Número de processos (default: número de CPUs; 1 calcula no próprio processo).
+        max_scores: Número máximo de similaridades (itens x itens) por bloco.
+
+    Returns:
+        Tupla (indptr, indices, scores) da tabela em CSR. Vizinhos com similaridade não
+        positiva são descartados.
+    """
+    n_itens = fatores.shape[0]
+    tfidf_matrix = tfidf_matrix.tocsr()
+    tfidf_T = tfidf_matrix.T.tocsr()
+    bloco = max(1, max_scores // max(n_itens, 1))
+    blocos = [(s, min(s + bloco, n_itens)) for s in range(0, n_itens, bloco)]
+    k = min(top_n, n_itens - 1)
+    vizinhos = np.zeros((n_itens, k), dtype=np.int32)
+    scores = np.full((n_itens, k), -np.inf, dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        caminhos = salvar_arrays_mmap(
+            tmp_dir,
+            {
+                "fatores": fatores.astype(np.float32),
+                "tfidf_indptr": tfidf_matrix.indptr,
+                "tfidf_indices": tfidf_matrix.indices,
+                "tfidf_data": tfidf_matrix.data.astype(np.float32),
+                "tfidf_T_indptr": tfidf_T.indptr,
+                "tfidf_T_indices": tfidf_T.indices,
+                "tfidf_T_data": tfidf_T.data.astype(np.float32),
+                "tfidf_shape": np.array(tfidf_matrix.shape, dtype=np.int64),
+                "top_n": np.array(top_n, dtype=np.int64),
+                "weight_cf": np.array(weight_cf, dtype=np.float64),
+            },
+        )
+        n_workers = n_workers or os.cpu_count() or 1
+        logger.info(f"Calculando vizinhos de {n_itens} itens em {len(blocos)} blocos...")
+        if n_workers == 1 or len(blocos) <= 1:
+            arrays = _preparar_arrays(caminhos)
+            resultados = (top_similares_bloco(arrays, s, e) for s, e in blocos)
+            for start, idx, sc in resultados:
+                vizinhos[start : start + len(idx)], scores[start : start + len(idx)] = idx, sc
+        else:
+            with ProcessPoolExecutor(
+                max_workers=min(n_workers, len(blocos)), initializer=_init_worker, initargs=(caminhos,)
+            ) as executor:
+                futures = [executor.submit(_executar_bloco, s, e) for s, e in blocos]
+                for future in futures:
+                    start, idx, sc = future.result()
+                    vizinhos[start : start + len(idx)], scores[start : start + len(idx)] = idx, sc
+
+    # Compacta em CSR mantendo apenas vizinhos com similaridade positiva
+    validos = scores > 0
+    indptr = np.concatenate([[0], np.cumsum(validos.sum(axis=1))]).astype(np.int64)
+    return indptr, vizinhos[validos], scores[validos]
+
+
+def treinar_itens_similares(
+    model_dir_logged: str = MODEL_DIR_LOGGED,
+    model_dir: str = MODEL_DIR_SIMILAR,
+    top_n: int = 20,
+    weight_cf: float = 0.5,
+    n_workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Gera a tabela de itens similares a partir dos artefatos do modelo logado (fatores do
+    ALS e matriz TF-IDF), cobrindo todos os itens do catálogo com conteúdo.
+    """
+    with open(os.path.join(model_dir_logged, "objetos_logged_auxiliares.pkl"), "rb") as f:
+        aux_dict = pickle.load(f)
+    with np.load(os.path.join(model_dir_logged, "model_logged_als.npz")) as data:
+        item_factors = data["item_factors"]
+    tfidf_matrix = load_npz(os.path.join(model_dir_logged, "tfidf_logged_matrix.npz"))
+
+    content = aux_dict["item_to_idx_content"]
+    pages = np.empty(len(content), dtype=object)
+    pages[np.fromiter(content.values(), dtype=np.int64, count=len(content))] = list(content.keys())
+    fatores = fatores_normalizados(item_factors, aux_dict["item_to_idx"], pages)
+
+    indptr, indices, scores = calcular_tabela_similares(
+        fatores, tfidf_matrix, top_n=top_n, weight_cf=weight_cf, n_workers=n_workers
+    )
+    os.makedirs(model_dir, exist_ok=True)
+    salvar_tabela_similares(os.path.join(model_dir, SIMILAR_TABLE_FILE), pages, indptr, indices, scores)
+    return {"n_items": len(pages), "n_neighbours": int(len(indices))}
+
+
+def main():
+    entradas = [
+        os.path.join(MODEL_DIR_LOGGED, nome)
+        for nome in ("model_logged_als.npz", "objetos_logged_auxiliares.pkl", "tfidf_logged_matrix.npz")
+    ]
+    chave = chave_artefato(entradas, SIMILAR_ITEMS_PARAMS, TRAIN_MODULES)
+    if artefato_reutilizavel(MODEL_DIR_SIMILAR, "similar", chave):
+        logger.info("Modelo logado e parâmetros inalterados; tabela de similares reaproveitada.")
+        return
+
+    resultado = treinar_itens_similares(**SIMILAR_ITEMS_PARAMS)
+    registrar_artefato(
+        MODEL_DIR_SIMILAR,
+        "similar",
+        chave,
+        [os.path.join(MODEL_DIR_SIMILAR, SIMILAR_TABLE_FILE)],
+        resultado,
+    )
+
+
+if __name__ == "__main__":
+    main()
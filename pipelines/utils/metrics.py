@@ -1,43 +1,219 @@
-import os
-import datetime
-import pandas as pd
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 
-def salvar_metricas_csv(
+from script_shared import config
+from script_shared.metrics_store import inserir_metricas
+
+# Cortes padrão das métricas de ranking
+CUTOFFS = (5, 10, 20, 50)
+RANKING_METRICS = ("recall", "precision", "ndcg", "mrr", "hit_rate")
+HIST_BINS = 20
+EVALUATION_DB_PATH = config.EVALUATION_DB_PATH
+
+
+def salvar_metricas(
     metrics: dict,
     type_model: str = "logged",
-) -> None:
+    resultados: Optional[Dict[str, Any]] = None,
+    db_path: str = EVALUATION_DB_PATH,
+) -> str:
     """
-    Salva (ou adiciona) as métricas de avaliação em um arquivo CSV.
-
-    Se o arquivo já existir, a nova linha é adicionada sem sobrescrever os dados anteriores.
-    Verifica se o diretório existe e o cria, se necessário.
+    Acrescenta as métricas de avaliação ao banco de métricas (SQLite em modo WAL), que
+    serializa escritas de avaliadores concorrentes.
 
     Args:
         metrics: Dicionário com as métricas de avaliação (ex.: {"mean_recall": ..., "mean_ndcg": ...}).
         type_model: Tipo de modelo avaliado (ex.: "logged").
-        csv_path: Caminho do arquivo CSV onde as métricas serão salvas.
-    """
-    csv_path = os.path.abspath("/opt/airflow/shared/script_shared/evaluation/evaluation_metrics.csv")
-    print(f"Salvando métricas em {csv_path}...")
-
-    # Adiciona um timestamp para registrar quando a avaliação foi feita
-    timestamp = datetime.datetime.now().isoformat()
-    # Cria uma nova linha com as colunas desejadas
-    new_row = {
-        "type_model": type_model,
-        "mean_recall": metrics.get("mean_recall", 0.0),
-        "mean_ndcg": metrics.get("mean_ndcg", 0.0),
-        "timestamp": timestamp,
-    }
-    df_novo = pd.DataFrame([new_row])
+        resultados: Registro estruturado completo (todas as métricas e cortes), opcional.
+        db_path: Caminho do banco SQLite.
 
+    Returns:
+        Timestamp da avaliação gravada.
+    """
+    print(f"Salvando métricas em {db_path}...")
     try:
-        if os.path.exists(csv_path):
-            df_novo.to_csv(csv_path, mode="a", header=False, index=False)
-        else:
-            df_novo.to_csv(csv_path, index=False)
-
-        print(f"Métricas salvas com sucesso em {csv_path}")
+        timestamp = inserir_metricas(type_model, metrics, resultados=resultados, db_path=db_path)
+        print(f"Métricas salvas com sucesso em {db_path}")
+        return timestamp
     except Exception as e:
         print(f"Erro ao salvar métricas: {e}")
+        return ""
+
+
+@lru_cache(maxsize=8)
+def tabela_descontos(max_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tabelas pré-calculadas de descontos do DCG (1 / log2(posição + 1)) e do IDCG
+    acumulado (idcg[n] = DCG ideal com n itens relevantes), até a posição max_k.
+    """
+    descontos = 1.0 / np.log2(np.arange(max_k) + 2.0)
+    idcg = np.concatenate([[0.0], np.cumsum(descontos)])
+    descontos.flags.writeable = False
+    idcg.flags.writeable = False
+    return descontos, idcg
+
+
+def normalizar_cutoffs(cutoffs: Iterable[int], top_k: Optional[int] = None) -> Tuple[int, ...]:
+    """Cortes ordenados e sem repetição, incluindo top_k (se informado)."""
+    return tuple(sorted(set(cutoffs) | ({top_k} if top_k else set())))
+
+
+def metricas_ranking(
+    hits: np.ndarray, gt_len: np.ndarray, cutoffs: Iterable[int] = CUTOFFS
+) -> Dict[str, np.ndarray]:
+    """
+    Calcula, em uma única passada vetorizada sobre a lista ranqueada de cada usuário,
+    recall, precision, NDCG, MRR e hit-rate em todos os cortes (relevância binária).
+
+    Args:
+        hits: Matriz booleana (n_usuários x K) indicando se o item na posição é relevante,
+              com K >= maior corte (posições vazias são False).
+        gt_len: Número de itens relevantes de cada usuário.
+        cutoffs: Cortes avaliados.
+
+    Returns:
+        Dicionário métrica -> matriz (n_usuários x n_cortes).
+    """
+    cutoffs = normalizar_cutoffs(cutoffs)
+    max_k = cutoffs[-1]
+    if hits.shape[1] < max_k:
+        hits = np.pad(hits, ((0, 0), (0, max_k - hits.shape[1])))
+    hits = hits[:, :max_k]
+    idx = np.array(cutoffs) - 1
+    gt_len = np.asarray(gt_len)
+
+    descontos, idcg = tabela_descontos(max_k)
+    acertos = np.cumsum(hits, axis=1)[:, idx]
+    dcg = np.cumsum(hits * descontos, axis=1)[:, idx]
+    ideal = idcg[np.minimum(gt_len[:, None], np.array(cutoffs)[None, :])]
+
+    # Posição do primeiro acerto (max_k se nenhum)
+    primeiro = np.where(hits.any(axis=1), hits.argmax(axis=1), max_k)
+    rr = np.where(primeiro[:, None] <= idx[None, :], 1.0 / (primeiro[:, None] + 1.0), 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "recall": np.where(gt_len[:, None] > 0, acertos / gt_len[:, None], 0.0),
+            "precision": acertos / np.array(cutoffs, dtype=np.float64),
+            "ndcg": np.where(ideal > 0, dcg / ideal, 0.0),
+            "mrr": rr,
+            "hit_rate": (acertos > 0).astype(np.float64),
+        }
+
+
+def acumular_ranking(
+    hits: np.ndarray,
+    gt_len: np.ndarray,
+    recs: np.ndarray,
+    n_itens: int,
+    cutoffs: Iterable[int] = CUTOFFS,
+    n_bins: int = HIST_BINS,
+) -> Dict[str, Any]:
+    """
+    Acumulador combinável das métricas de ranking de um conjunto de usuários: somas,
+    contagem e histogramas (intervalos iguais em [0, 1]) de cada métrica por corte, e a
+    melhor posição em que cada item do catálogo foi recomendado (para a cobertura).
+
+    Args:
+        hits: Matriz booleana de acertos (ver metricas_ranking).
+        gt_len: Número de itens relevantes de cada usuário.
+        recs: Códigos dos itens recomendados (n x K), preenchidos com -1, considerados na
+              cobertura (podem incluir usuários fora de hits).
+        n_itens: Tamanho do catálogo (códigos 0..n_itens-1).
+        cutoffs: Cortes avaliados.
+        n_bins: Número de intervalos dos histogramas.
+    """
+    cutoffs = normalizar_cutoffs(cutoffs)
+    max_k = cutoffs[-1]
+    por_usuario = metricas_ranking(hits, gt_len, cutoffs)
+    bins = np.linspace(0.0, 1.0, n_bins + 1)
+
+    # Melhor posição de cada item entre as recomendações (max_k se nunca recomendado)
+    recs = recs[:, :max_k]
+    posicoes = np.broadcast_to(np.arange(recs.shape[1]), recs.shape)
+    valido = recs >= 0
+    min_rank = np.full(n_itens, max_k, dtype=np.int64)
+    np.minimum.at(min_rank, recs[valido], posicoes[valido])
+
+    return {
+        "n_users": int(hits.shape[0]),
+        "cutoffs": list(cutoffs),
+        "sums": {m: v.sum(axis=0) for m, v in por_usuario.items()},
+        "hist": {
+            m: np.stack([np.histogram(v[:, c], bins=bins)[0] for c in range(len(cutoffs))])
+            for m, v in por_usuario.items()
+        },
+        "min_rank": min_rank,
+    }
+
+
+def combinar_ranking(acumuladores: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combina acumuladores de ranking (mesmos cortes e catálogo): soma das contagens, somas
+    e histogramas e mínimo das posições dos itens.
+    """
+    total = None
+    for acc in acumuladores:
+        if total is None:
+            total = {
+                "n_users": acc["n_users"],
+                "cutoffs": acc["cutoffs"],
+                "sums": {m: v.copy() for m, v in acc["sums"].items()},
+                "hist": {m: v.copy() for m, v in acc["hist"].items()},
+                "min_rank": acc["min_rank"].copy(),
+            }
+            continue
+        total["n_users"] += acc["n_users"]
+        for m in total["sums"]:
+            total["sums"][m] += acc["sums"][m]
+            total["hist"][m] += acc["hist"][m]
+        np.minimum(total["min_rank"], acc["min_rank"], out=total["min_rank"])
+    return total
+
+
+def finalizar_ranking(acc: Dict[str, Any], top_k: int = 10) -> Dict[str, Any]:
+    """
+    Converte o acumulador combinado no registro estruturado de resultados: médias de cada
+    métrica por corte, cobertura do catálogo por corte e histogramas. Inclui também
+    'mean_recall' e 'mean_ndcg' no corte top_k (colunas resumidas de salvar_metricas).
+    """
+    cutoffs = acc["cutoffs"]
+    n = acc["n_users"]
+    metrics = {
+        m: {str(k): (float(v[i]) / n if n else 0.0) for i, k in enumerate(cutoffs)}
+        for m, v in acc["sums"].items()
+    }
+    n_itens = len(acc["min_rank"])
+    coverage = {
+        str(k): (float((acc["min_rank"] < k).sum()) / n_itens if n_itens else 0.0)
+        for k in cutoffs
+    }
+    return {
+        "n_users": n,
+        "n_items": n_itens,
+        "cutoffs": cutoffs,
+        "metrics": metrics,
+        "coverage": coverage,
+        "hist": {m: v.tolist() for m, v in acc["hist"].items()},
+        "top_k": top_k,
+        "mean_recall": metrics["recall"].get(str(top_k), 0.0),
+        "mean_ndcg": metrics["ndcg"].get(str(top_k), 0.0),
+    }
+
+
+def salvar_resultados(
+    resultados: Dict[str, Any],
+    type_model: str = "logged",
+    db_path: str = EVALUATION_DB_PATH,
+) -> Dict[str, Any]:
+    """
+    Grava no banco de métricas a linha resumida da avaliação junto com o registro
+    estruturado de resultados (todas as métricas e cortes).
+
+    Returns:
+        Registro gravado.
+    """
+    timestamp = salvar_metricas(resultados, type_model=type_model, resultados=resultados, db_path=db_path)
+    return {"type_model": type_model, "timestamp": timestamp, **resultados}
@@ -0,0 +1,222 @@
+import os
+import importlib
+import json
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+from script_shared import config
+
+ARTIFACT_HASH_CACHE = config.ARTIFACT_HASH_CACHE
+MANIFEST_FILE = "manifest.json"
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _sha256(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _carregar_json(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logger.warning(f"Arquivo JSON inválido ignorado: {path}")
+        return {}
+
+
+def _salvar_json(path: str, conteudo: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(conteudo, f, indent=2, sort_keys=True, default=str)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _lock(path: str) -> Iterator[None]:
+    """Lock exclusivo entre processos (treinos paralelos) para leitura-modificação-escrita."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def hash_arquivo(path: str, cache_path: Optional[str] = ARTIFACT_HASH_CACHE) -> str:
+    """
+    SHA-256 do conteúdo de um arquivo (ou de todos os arquivos de um diretório).
+
+    Os hashes são memorizados em cache_path por (tamanho, mtime), de forma que arquivos
+    inalterados não são relidos a cada execução.
+    """
+    if os.path.isdir(path):
+        partes = [
+            f"{os.path.relpath(p, path)}:{hash_arquivo(p, cache_path)}"
+            for p in sorted(
+                os.path.join(raiz, nome) for raiz, _, nomes in os.walk(path) for nome in nomes
+            )
+        ]
+        return _sha256("\n".join(partes).encode())
+
+    stat = os.stat(path)
+    assinatura = f"{stat.st_size}:{stat.st_mtime_ns}"
+    cache = _carregar_json(cache_path) if cache_path else {}
+    registro = cache.get(os.path.abspath(path))
+    if registro and registro["assinatura"] == assinatura:
+        return registro["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    digest = h.hexdigest()
+
+    if cache_path:
+        try:
+            with _lock(cache_path):
+                cache = _carregar_json(cache_path)
+                cache[os.path.abspath(path)] = {"assinatura": assinatura, "sha256": digest}
+                _salvar_json(cache_path, cache)
+        except OSError:
+            # Ex.: volume somente leitura na API; o hash apenas não é memorizado
+            logger.debug(f"Cache de hashes não gravado: {cache_path}")
+    return digest
+
+
+def versao_codigo(modulos: Iterable[str]) -> str:
+    """
+    Hash do código-fonte dos módulos informados (nomes completos, ex.:
+    "pipelines.train.train_logged"), usado para invalidar artefatos quando a lógica que
+    os gera muda.
+    """
+    partes = []
+    for nome in sorted(modulos):
+        with open(importlib.import_module(nome).__file__, "rb") as f:
+            partes.append(f"{nome}:{_sha256(f.read())}")
+    return _sha256("\n".join(partes).encode())
+
+
+def chave_artefato(
+    entradas: Iterable[str], params: Dict[str, Any], modulos: Iterable[str]
+) -> Dict[str, Any]:
+    """
+    Calcula a chave de conteúdo de um estágio a partir das entradas, parâmetros e código.
+
+    Args:
+        entradas: Arquivos/diretórios de entrada (partições) do estágio. Entradas ausentes
+                  entram na chave como tal.
+        params: Parâmetros do estágio (serializáveis em JSON).
+        modulos: Módulos cujo código-fonte gera os artefatos.
+
+    Returns:
+        Dicionário com 'key' e os componentes ('inputs', 'params', 'code_version').
+    """
+    inputs = {
+        p: (hash_arquivo(p) if os.path.exists(p) else None) for p in sorted(set(entradas))
+    }
+    code_version = versao_codigo(modulos)
+    payload = json.dumps(
+        {"inputs": inputs, "params": params, "code_version": code_version},
+        sort_keys=True,
+        default=str,
+    )
+    return {
+        "key": _sha256(payload.encode()),
+        "inputs": inputs,
+        "params": params,
+        "code_version": code_version,
+    }
+
+
+def carregar_manifesto(artifact_dir: str) -> Dict[str, Any]:
+    """
+    Carrega o manifesto de um diretório de artefatos ({} se inexistente).
+    """
+    return _carregar_json(os.path.join(artifact_dir, MANIFEST_FILE)).get("stages", {})
+
+
+def artefato_reutilizavel(artifact_dir: str, stage: str, chave: Dict[str, Any]) -> bool:
+    """
+    Indica se os artefatos de um estágio podem ser reaproveitados: a chave registrada é
+    igual à atual e todos os arquivos de saída existem com o conteúdo registrado.
+    """
+    registro = carregar_manifesto(artifact_dir).get(stage)
+    if not registro or registro.get("key") != chave["key"]:
+        return False
+    for path, digest in registro.get("outputs", {}).items():
+        if not os.path.exists(path) or hash_arquivo(path) != digest:
+            logger.info(f"Artefato ausente ou alterado: {path}")
+            return False
+    return True
+
+
+def registrar_artefato(
+    artifact_dir: str,
+    stage: str,
+    chave: Optional[Dict[str, Any]],
+    saidas: List[str],
+    consistencia: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Registra no manifesto os artefatos produzidos por um estágio.
+
+    Args:
+        artifact_dir: Diretório do manifesto.
+        stage: Nome do estágio.
+        chave: Chave retornada por chave_artefato. Se None, mantém a chave já registrada
+               (atualização dos artefatos sem novo treino, ex.: fold-in).
+        saidas: Arquivos produzidos.
+        consistencia: Invariantes verificáveis pelo carregador (ex.: número de usuários).
+
+    Returns:
+        Registro gravado.
+    """
+    manifest_path = os.path.join(artifact_dir, MANIFEST_FILE)
+    with _lock(manifest_path):
+        manifesto = _carregar_json(manifest_path)
+        stages = manifesto.setdefault("stages", {})
+        anterior = stages.get(stage, {})
+        registro = dict(chave) if chave is not None else {
+            k: anterior.get(k) for k in ("key", "inputs", "params", "code_version")
+        }
+        registro["outputs"] = {p: hash_arquivo(p) for p in saidas}
+        registro["consistency"] = consistencia or {}
+        registro["created_at"] = datetime.now().isoformat()
+        stages[stage] = registro
+        _salvar_json(manifest_path, manifesto)
+    logger.info(f"Manifesto atualizado ({stage}): {manifest_path}")
+    return registro
+
+
+def verificar_consistencia(
+    artifact_dir: str, stage: str, observado: Dict[str, Any]
+) -> List[str]:
+    """
+    Compara os invariantes registrados no manifesto com os observados nos artefatos
+    carregados.
+
+    Returns:
+        Lista de divergências (vazia se consistente ou se não houver manifesto).
+    """
+    registro = carregar_manifesto(artifact_dir).get(stage)
+    if not registro:
+        logger.warning(f"Manifesto sem registro para o estágio '{stage}' em: {artifact_dir}")
+        return []
+    esperado = registro.get("consistency", {})
+    return [
+        f"{campo}: esperado {esperado[campo]}, encontrado {valor}"
+        for campo, valor in observado.items()
+        if campo in esperado and esperado[campo] != valor
+    ]
@@ -17,6 +17,14 @@ MODEL_DIR_ANON_HEURISTICO = os.path.join(BASE_PATH, "models", "anon_heuristico")
 DEFAULT_W_ISSUED = 0.8
 DEFAULT_W_MODIFIED = 0.2
 
+# Tendências para anônimos: contagens por página com decaimento exponencial (meia-vida),
+# alimentadas pelos eventos, em um count-min sketch (width x depth) com heap dos top_k.
+# O ranking anônimo combina as tendências (peso TRENDING_WEIGHT) com o score de recência.
+TRENDING_ENABLED = os.getenv("TRENDING_ENABLED", "true").lower() == "true"
+TRENDING_PARAMS = {"width": 2**15, "depth": 4, "top_k": 500, "half_life_s": 3600.0}
+TRENDING_WEIGHT = 0.5
+TRENDING_RECENCY_CANDIDATES = 500
+
 # Configuração Treino Logged
 ALS_DEFAULT_PARAMS = {
     "factors": 40,
@@ -25,10 +33,82 @@ ALS_DEFAULT_PARAMS = {
     "alpha": 12,
 }
 SPARSE_MATRIX_PATH = os.path.join(BASE_PATH, "data", "refined", "user_item_sparse_mat_logged.npz")
+SPARSE_MAPPINGS_PATH = os.path.join(BASE_PATH, "data", "refined", "user_item_mappings_logged.pkl")
 MODEL_DIR_LOGGED = os.path.join(BASE_PATH, "models", "logged")
+CONTENT_CACHE_DIR = os.path.join(BASE_PATH, "data", "refined", "content_cache")
+CONTENT_N_FEATURES = 2**18
+
+# Índice ANN (IVF) sobre os fatores de item do ALS: construído no treino e usado na
+# inferência se habilitado. N_PROBE controla o compromisso recall x latência.
+ANN_LOGGED_ENABLED = os.getenv("ANN_LOGGED_ENABLED", "false").lower() == "true"
+ANN_LOGGED_PARAMS = {"n_lists": None, "n_iter": 15}
+ANN_LOGGED_N_PROBE = int(os.getenv("ANN_LOGGED_N_PROBE", "32"))
+
+# Fatores de item quantizados usados na inferência: "float16", "int8" ou vazio (float).
+# int8 ocupa 1/4 da memória com custo de pontuação equivalente ao float32; float16 ocupa
+# metade, mas a conversão para float32 na pontuação é mais lenta no NumPy.
+ALS_QUANTIZATION = os.getenv("ALS_QUANTIZATION", "") or None
+
+# Entradas compartilhadas dos treinamentos em Arrow IPC (preparadas antes dos treinos paralelos)
+TRAIN_INPUTS_DIR = os.path.join(BASE_PATH, "data", "refined", "train_inputs")
+
+# Registro de artefatos (cache de hashes de conteúdo por tamanho/mtime)
+ARTIFACT_HASH_CACHE = os.path.join(BASE_PATH, "data", "refined", "_hash_cache.json")
+
+# Itens similares (tabela de vizinhos a partir dos fatores do ALS e do TF-IDF)
+MODEL_DIR_SIMILAR = os.path.join(BASE_PATH, "models", "similar")
+SIMILAR_ITEMS_PARAMS = {"top_n": 20, "weight_cf": 0.5}
+
+# Recomendações por sessão para anônimos (co-visitação de páginas na mesma sessão; uma nova
+# sessão começa após window_minutes minutos sem leituras do usuário)
+MODEL_DIR_SESSION = os.path.join(BASE_PATH, "models", "session")
+SESSION_COVIS_PARAMS = {"window_minutes": 30, "top_n": 50, "block_size": 4096}
+SESSION_RECENCY_DECAY = 0.8
+
+# Orçamento de latência das recomendações personalizadas (logged/semianon): estourado o
+# prazo, a requisição recebe a lista anônima. 0 desabilita. O cálculo roda em um pool de
+# RECOMMENDATION_WORKERS threads.
+RECOMMENDATION_BUDGET_MS = float(os.getenv("RECOMMENDATION_BUDGET_MS", "150"))
+RECOMMENDATION_WORKERS = int(os.getenv("RECOMMENDATION_WORKERS", str(os.cpu_count() or 4)))
+
+# Executor das recomendações: "thread" (NumPy libera o GIL no cálculo) ou "process" (o
+# caminho logged roda em RECOMMENDATION_PROCESS_WORKERS processos criados por fork após a
+# carga dos modelos). RECOMMENDATION_BLAS_THREADS limita as threads BLAS/OpenMP de cada
+# worker, para que workers x threads BLAS não ultrapassem os núcleos disponíveis.
+RECOMMENDATION_EXECUTOR = os.getenv("RECOMMENDATION_EXECUTOR", "thread")
+RECOMMENDATION_PROCESS_WORKERS = int(os.getenv("RECOMMENDATION_PROCESS_WORKERS", str(os.cpu_count() or 4)))
+RECOMMENDATION_BLAS_THREADS = int(os.getenv("RECOMMENDATION_BLAS_THREADS", "1"))
+
+# Controle de admissão da rota de recomendações: até ADMISSION_MAX_CONCURRENCY requisições
+# em atendimento e ADMISSION_MAX_QUEUE aguardando vaga por até ADMISSION_QUEUE_TIMEOUT_MS;
+# as demais recebem a lista anônima (ou 503, se o modelo anônimo não estiver carregado).
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", str(2 * RECOMMENDATION_WORKERS)))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "100"))
+
+# Ingestão de eventos (POST /events): buffer circular em memória descarregado em micro-lotes
+# Parquet particionados por data, lidos pelo processamento incremental de usuários
+EVENTS_DIR = os.path.join(BASE_PATH, "data", "events")
+EVENTS_BUFFER_CAPACITY = int(os.getenv("EVENTS_BUFFER_CAPACITY", "100000"))
+EVENTS_FLUSH_BATCH = int(os.getenv("EVENTS_FLUSH_BATCH", "5000"))
+EVENTS_FLUSH_INTERVAL_S = float(os.getenv("EVENTS_FLUSH_INTERVAL_S", "5"))
+# Limites dos campos de um evento (a API recusa valores acima deles e o processamento
+# descarta eventos fora dos limites), no lugar do filtro de outliers pelo percentil 99
+# aplicado às partições de treino
+EVENTS_MAX_CLICKS = float(os.getenv("EVENTS_MAX_CLICKS", "500"))
+EVENTS_MAX_PAGE_VISITS = float(os.getenv("EVENTS_MAX_PAGE_VISITS", "50"))
+# Maior timestamp (ms) aceito em um evento: 9999-12-31T23:59:59.999Z, último instante
+# representável na data da partição
+EVENTS_MAX_TIMESTAMP_MS = 253_402_300_799_999
 
 # Configuração Treino Semi-Anônimo
 MODEL_DIR_SEMIANON = os.path.join(BASE_PATH, "models", "semianon")
+SEMIANON_TRAIN_MODE = os.getenv("SEMIANON_TRAIN_MODE", "batch")  # "batch" ou "streaming"
+# Feature store online dos semi-logados: agregados atualizados pelos eventos e cluster
+# recalculado na leitura. Usuários inativos por ttl_s segundos são descartados, com no
+# máximo max_users em memória; páginas distintas contadas com HyperLogLog de 2**hll_bits registros.
+FEATURE_STORE_ENABLED = os.getenv("FEATURE_STORE_ENABLED", "true").lower() == "true"
+FEATURE_STORE_PARAMS = {"ttl_s": 6 * 3600.0, "max_users": 200_000, "hll_bits": 6}
 FEATURE_COLUMNS_SEMIANON = [
     "sum_time",
     "sum_clicks",
@@ -42,6 +122,13 @@ FEATURE_COLUMNS_SEMIANON = [
     "log_clicks_per_page",
 ]
 
+# Busca de hiperparâmetros (resultados e cache de artefatos intermediários)
+GRID_SEARCH_DIR = os.path.join(BASE_PATH, "evaluation", "grid_search")
+
+# Métricas de avaliação (banco SQLite; o CSV legado é importado na criação do banco)
+EVALUATION_DB_PATH = os.path.join(BASE_PATH, "evaluation", "evaluation_metrics.db")
+EVALUATION_CSV_PATH = os.path.join(BASE_PATH, "evaluation", "evaluation_metrics.csv")
+
 # Arquivos parquet
 USERS_LOGGED = os.path.join(BASE_PATH, "data", "refined", "users_logged.parquet")
 
@@ -0,0 +1,145 @@
+import os
+import glob
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from script_shared import config
+
+EVENTS_DIR = config.EVENTS_DIR
+
+# Valor máximo de cada campo numérico de um evento
+LIMITES_EVENTO = {
+    "numberOfClicksHistory": config.EVENTS_MAX_CLICKS,
+    "timeOnPageHistory": 1_800_000,  # 30 minutos em milissegundos
+    "scrollPercentageHistory": 100,
+    "pageVisitsCountHistory": config.EVENTS_MAX_PAGE_VISITS,
+}
+
+# Colunas das interações em refined (users_clean), uma linha por leitura de página
+COLUNAS_INTERACAO = [
+    "userId",
+    "userType",
+    "history",
+    "timestampHistory",
+    "numberOfClicksHistory",
+    "timeOnPageHistory",
+    "scrollPercentageHistory",
+    "pageVisitsCountHistory",
+]
+
+SCHEMA_EVENTOS = pa.schema(
+    [
+        ("userId", pa.string()),
+        ("userType", pa.string()),
+        ("history", pa.string()),
+        ("timestampHistory", pa.string()),
+        ("numberOfClicksHistory", pa.float64()),
+        ("timeOnPageHistory", pa.float64()),
+        ("scrollPercentageHistory", pa.float64()),
+        ("pageVisitsCountHistory", pa.float64()),
+    ]
+)
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _data_evento(timestamp_ms: str) -> str:
+    return datetime.fromtimestamp(int(timestamp_ms) / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def separar_invalidos(
+    eventos: Sequence[Sequence[Any]],
+) -> Tuple[List[Sequence[Any]], List[Sequence[Any]]]:
+    """
+    Separa os eventos que não podem ser gravados (timestamp fora de
+    [0, EVENTS_MAX_TIMESTAMP_MS] ou campos numéricos não numéricos), que falhariam em
+    escrever_lote a cada nova tentativa.
+
+    Returns:
+        Tupla (válidos, inválidos), preservando a ordem.
+    """
+    validos, invalidos = [], []
+    for evento in eventos:
+        try:
+            ok = 0 <= int(evento[3]) <= config.EVENTS_MAX_TIMESTAMP_MS
+            for valor in evento[4:]:
+                float(valor)
+        except (TypeError, ValueError):
+            ok = False
+        (validos if ok else invalidos).append(evento)
+    return validos, invalidos
+
+
+def escrever_lote(
+    eventos: Sequence[Sequence[Any]], events_dir: str = EVENTS_DIR, sufixo: str = ""
+) -> List[str]:
+    """
+    Grava um micro-lote de eventos em Parquet, particionado pela data (UTC) do evento
+    (events_dir/date=AAAA-MM-DD/). Os arquivos de todas as partições são escritos em
+    temporários e só renomeados depois que todos foram gravados: se uma gravação falha,
+    nenhuma partição do lote é publicada e o lote pode ser regravado sem duplicar eventos.
+
+    Args:
+        eventos: Tuplas na ordem de COLUNAS_INTERACAO.
+        events_dir: Diretório raiz das partições.
+        sufixo: Identificador acrescentado ao nome dos arquivos (ex.: sequência do lote).
+
+    Returns:
+        Caminhos dos arquivos gravados.
+    """
+    por_data: Dict[str, List[Sequence[Any]]] = {}
+    for evento in eventos:
+        por_data.setdefault(_data_evento(evento[3]), []).append(evento)
+
+    caminhos = []
+    instante = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    try:
+        for data, linhas in por_data.items():
+            particao = os.path.join(events_dir, f"date={data}")
+            os.makedirs(particao, exist_ok=True)
+            colunas = list(zip(*linhas))
+            tabela = pa.Table.from_arrays(
+                [pa.array(col, type=campo.type) for col, campo in zip(colunas, SCHEMA_EVENTOS)],
+                schema=SCHEMA_EVENTOS,
+            )
+            path = os.path.join(particao, f"events-{instante}{sufixo}.parquet")
+            caminhos.append(path)
+            pq.write_table(tabela, f"{path}.tmp")
+    except Exception:
+        for path in caminhos:
+            if os.path.exists(f"{path}.tmp"):
+                os.remove(f"{path}.tmp")
+        raise
+
+    for path in caminhos:
+        os.replace(f"{path}.tmp", path)
+    return caminhos
+
+
+def listar_particoes_eventos(events_dir: str = EVENTS_DIR) -> List[str]:
+    """Arquivos Parquet de eventos já gravados, em ordem."""
+    return sorted(glob.glob(os.path.join(events_dir, "date=*", "*.parquet")))
+
+
+def carregar_eventos(paths: Iterable[str]) -> pd.DataFrame:
+    """
+    Lê os arquivos de eventos como interações no formato de users_clean, descartando os
+    eventos com campos acima de LIMITES_EVENTO (como os outliers das partições de treino).
+    """
+    paths = list(paths)
+    if not paths:
+        return pd.DataFrame(columns=COLUNAS_INTERACAO)
+    df = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+    dentro = pd.Series(True, index=df.index)
+    for col, limite in LIMITES_EVENTO.items():
+        dentro &= df[col] <= limite
+    if not dentro.all():
+        logger.info(f"{int((~dentro).sum())} eventos descartados por exceder os limites.")
+    return df[dentro].reset_index(drop=True)
@@ -0,0 +1,191 @@
+import os
+import csv
+import json
+import sqlite3
+import logging
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from script_shared import config
+
+EVALUATION_DB_PATH = config.EVALUATION_DB_PATH
+EVALUATION_CSV_PATH = config.EVALUATION_CSV_PATH
+
+# Colunas resumidas expostas pela API (mesmo formato do antigo CSV)
+COLUNAS_RESUMO = ("type_model", "mean_recall", "mean_ndcg", "timestamp")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluation_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type_model TEXT NOT NULL,
+    mean_recall REAL NOT NULL,
+    mean_ndcg REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    results TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_evaluation_metrics_model_ts
+    ON evaluation_metrics (type_model, timestamp);
+CREATE INDEX IF NOT EXISTS idx_evaluation_metrics_ts
+    ON evaluation_metrics (timestamp);
+"""
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def conectar(db_path: str = EVALUATION_DB_PATH, timeout: float = 30.0) -> sqlite3.Connection:
+    """
+    Abre o banco de métricas em modo WAL: leitores (API) não bloqueiam o escritor e
+    escritas concorrentes (avaliadores em paralelo) aguardam o lock por até 'timeout'
+    segundos em vez de falhar.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
+
+
+def inicializar(db_path: str = EVALUATION_DB_PATH, csv_path: Optional[str] = EVALUATION_CSV_PATH) -> None:
+    """
+    Cria a tabela e os índices, se necessário. Na criação do banco, importa as linhas do
+    CSV de métricas legado (quando existir) para manter o histórico.
+    """
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    with closing(conectar(db_path)) as conn:
+        conn.executescript(_SCHEMA)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            vazio = conn.execute("SELECT COUNT(*) FROM evaluation_metrics").fetchone()[0] == 0
+            if vazio and csv_path and os.path.exists(csv_path):
+                with open(csv_path, "r", encoding="utf-8") as f:
+                    linhas = [
+                        (r["type_model"], float(r["mean_recall"]), float(r["mean_ndcg"]), r["timestamp"])
+                        for r in csv.DictReader(f)
+                    ]
+                conn.executemany(
+                    "INSERT INTO evaluation_metrics (type_model, mean_recall, mean_ndcg, timestamp) "
+                    "VALUES (?, ?, ?, ?)",
+                    linhas,
+                )
+                logger.info(f"{len(linhas)} linhas importadas de {csv_path}")
+
+
+def inserir_metricas(
+    type_model: str,
+    metrics: Dict[str, Any],
+    timestamp: Optional[str] = None,
+    resultados: Optional[Dict[str, Any]] = None,
+    db_path: str = EVALUATION_DB_PATH,
+) -> str:
+    """
+    Acrescenta uma avaliação ao banco em uma transação curta.
+
+    Args:
+        type_model: Tipo de modelo avaliado (ex.: "logged").
+        metrics: Dicionário com 'mean_recall' e 'mean_ndcg'.
+        timestamp: Momento da avaliação (ISO 8601). Se None, usa o horário atual.
+        resultados: Registro estruturado completo (ver finalizar_ranking), gravado em JSON.
+        db_path: Caminho do banco SQLite.
+
+    Returns:
+        Timestamp gravado.
+    """
+    timestamp = timestamp or datetime.now().isoformat()
+    inicializar(db_path)
+    with closing(conectar(db_path)) as conn, conn:
+        conn.execute(
+            "INSERT INTO evaluation_metrics (type_model, mean_recall, mean_ndcg, timestamp, results) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                type_model,
+                float(metrics.get("mean_recall", 0.0)),
+                float(metrics.get("mean_ndcg", 0.0)),
+                timestamp,
+                json.dumps(resultados, default=str) if resultados is not None else None,
+            ),
+        )
+    return timestamp
+
+
+def assinatura(db_path: str = EVALUATION_DB_PATH) -> Optional[Tuple[int, ...]]:
+    """
+    Assinatura (tamanho, mtime) do banco e do seu WAL, que muda a cada escrita. None se o
+    banco não existir.
+    """
+    if not os.path.exists(db_path):
+        return None
+    partes: List[int] = []
+    for path in (db_path, f"{db_path}-wal"):
+        try:
+            stat = os.stat(path)
+            partes += [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            partes += [0, 0]
+    return tuple(partes)
+
+
+def _filtros(
+    type_model: Optional[str], inicio: Optional[str], fim: Optional[str]
+) -> Tuple[str, List[Any]]:
+    """Cláusula WHERE (atendida pelos índices de type_model/timestamp) e seus parâmetros."""
+    filtros, params = [], []
+    if type_model is not None:
+        filtros.append("type_model = ?")
+        params.append(type_model)
+    if inicio is not None:
+        filtros.append("timestamp >= ?")
+        params.append(inicio)
+    if fim is not None:
+        filtros.append("timestamp <= ?")
+        params.append(fim)
+    return (" WHERE " + " AND ".join(filtros) if filtros else ""), params
+
+
+def consultar_metricas(
+    db_path: str = EVALUATION_DB_PATH,
+    type_model: Optional[str] = None,
+    inicio: Optional[str] = None,
+    fim: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Consulta as métricas resumidas em ordem cronológica.
+
+    Args:
+        db_path: Caminho do banco SQLite.
+        type_model: Se definido, filtra pelo tipo de modelo.
+        inicio, fim: Se definidos, limites (inclusivos) do timestamp em ISO 8601.
+        limit, offset: Paginação.
+
+    Returns:
+        Lista de dicionários com as colunas de COLUNAS_RESUMO ([] se o banco não existir).
+    """
+    if not os.path.exists(db_path):
+        return []
+    where, params = _filtros(type_model, inicio, fim)
+    sql = f"SELECT {', '.join(COLUNAS_RESUMO)} FROM evaluation_metrics{where} ORDER BY timestamp, id"
+    if limit is not None or offset:
+        # LIMIT -1: sem limite (apenas o offset)
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limit) if limit is not None else -1, int(offset)]
+
+    with closing(conectar(db_path)) as conn:
+        return [dict(zip(COLUNAS_RESUMO, linha)) for linha in conn.execute(sql, params)]
+
+
+def contar_metricas(
+    db_path: str = EVALUATION_DB_PATH,
+    type_model: Optional[str] = None,
+    inicio: Optional[str] = None,
+    fim: Optional[str] = None,
+) -> int:
+    """Número de métricas que atendem aos filtros de consultar_metricas (0 se o banco não existir)."""
+    if not os.path.exists(db_path):
+        return 0
+    where, params = _filtros(type_model, inicio, fim)
+    with closing(conectar(db_path)) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM evaluation_metrics{where}", params).fetchone()[0]
@@ -0,0 +1,164 @@
+import os
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from script_shared.models.quantization import linhas_fatores
+
+# Arquivo do índice, salvo junto a model_logged_als.npz
+ANN_INDEX_FILE = "model_logged_ann.npz"
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _aumentar(item_factors: np.ndarray) -> np.ndarray:
+    """
+    Transforma a busca por produto interno máximo em busca por vizinho mais próximo (L2):
+    cada item recebe a coordenada extra sqrt(M² - ||y||²), com M a maior norma, de forma
+    que ||[q, 0] - y'||² = ||q||² + M² - 2 q·y e a ordem por distância é a ordem por score.
+    """
+    Y = np.asarray(item_factors, dtype=np.float32)
+    normas2 = np.einsum("ij,ij->i", Y, Y)
+    extra = np.sqrt(np.maximum(normas2.max(initial=0.0) - normas2, 0.0))
+    return np.hstack([Y, extra[:, None]])
+
+
+def _atribuir(X: np.ndarray, centroids: np.ndarray, chunk: int = 65_536) -> np.ndarray:
+    """Índice do centróide mais próximo (L2) de cada linha, calculado em blocos."""
+    c_norm = np.einsum("ij,ij->i", centroids, centroids)
+    rotulos = np.empty(len(X), dtype=np.int32)
+    for s in range(0, len(X), chunk):
+        rotulos[s : s + chunk] = np.argmin(c_norm - 2.0 * X[s : s + chunk] @ centroids.T, axis=1)
+    return rotulos
+
+
+def _kmeans(
+    X: np.ndarray, n_lists: int, n_iter: int, rng: np.random.Generator
+) -> np.ndarray:
+    """K-means (Lloyd) em NumPy; listas vazias são reiniciadas com pontos aleatórios."""
+    centroids = X[rng.choice(len(X), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        rotulos = _atribuir(X, centroids)
+        contagem = np.bincount(rotulos, minlength=n_lists)
+        somas = np.zeros_like(centroids, dtype=np.float64)
+        np.add.at(somas, rotulos, X)
+        vazias = contagem == 0
+        centroids[~vazias] = (somas[~vazias] / contagem[~vazias, None]).astype(X.dtype)
+        if vazias.any():
+            centroids[vazias] = X[rng.choice(len(X), int(vazias.sum()), replace=False)]
+    return centroids
+
+
+def construir_indice_ivf(
+    item_factors: np.ndarray,
+    n_lists: Optional[int] = None,
+    n_iter: int = 15,
+    pontos_por_lista: int = 64,
+    random_state: int = 42,
+) -> Dict[str, np.ndarray]:
+    """
+    Constrói um índice IVF (listas invertidas por k-means) sobre os fatores de item do ALS.
+
+    Os centróides são treinados em uma amostra de até pontos_por_lista * n_lists itens e
+    todos os itens são atribuídos à lista do centróide mais próximo. Os fatores são
+    reordenados por lista, de forma que cada lista é um bloco contíguo de memória.
+
+    Args:
+        item_factors: Fatores de item do modelo ALS (n_itens x k).
+        n_lists: Número de listas. Se None, usa ~4 * sqrt(n_itens).
+        n_iter: Iterações do k-means.
+        pontos_por_lista: Tamanho da amostra de treino do k-means por lista.
+        random_state: Semente da amostragem.
+
+    Returns:
+        Dicionário com 'centroids', 'indptr' (offsets das listas), 'items' (índices
+        originais dos itens, por lista) e 'factors' (fatores reordenados; podem ser
+        substituídos pelos quantizados, ver load_model_logged).
+    """
+    rng = np.random.default_rng(random_state)
+    X = _aumentar(item_factors)
+    n_itens = len(X)
+    if n_lists is None:
+        n_lists = int(4 * np.sqrt(n_itens))
+    n_lists = max(1, min(n_lists, n_itens))
+
+    amostra = X
+    if n_itens > pontos_por_lista * n_lists:
+        amostra = X[rng.choice(n_itens, pontos_por_lista * n_lists, replace=False)]
+    logger.info(f"Treinando índice IVF com {n_lists} listas sobre {n_itens} itens...")
+    centroids = _kmeans(amostra, n_lists, n_iter, rng)
+
+    rotulos = _atribuir(X, centroids)
+    items = np.argsort(rotulos, kind="stable").astype(np.int32)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rotulos, minlength=n_lists))])
+    return {
+        "centroids": centroids,
+        "indptr": indptr.astype(np.int64),
+        "items": items,
+        "factors": np.ascontiguousarray(X[items, :-1]),
+    }
+
+
+def salvar_indice_ivf(indice: Dict[str, np.ndarray], path: str) -> None:
+    np.savez(path, **indice)
+    logger.info(f"Índice IVF salvo em: {path}")
+
+
+def carregar_indice_ivf(path: str) -> Optional[Dict[str, np.ndarray]]:
+    """Carrega o índice IVF (None se o arquivo não existir)."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def buscar_ivf(
+    indice: Dict[str, np.ndarray],
+    user_factor: np.ndarray,
+    top_k: int,
+    n_probe: int,
+    excluir: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca aproximada dos top_k itens de maior score (produto interno) para um usuário,
+    pontuando apenas os itens das n_probe listas mais próximas. Quanto maior n_probe,
+    maior o recall em relação à busca exata e maior a latência (n_probe igual ao número
+    de listas equivale à busca exata).
+
+    Args:
+        indice: Índice retornado por construir_indice_ivf.
+        user_factor: Vetor de fatores do usuário (k,).
+        top_k: Número de itens retornados.
+        n_probe: Número de listas visitadas.
+        excluir: Índices de itens a descartar (ex.: já consumidos pelo usuário).
+
+    Returns:
+        Tupla (ids, scores) em ordem decrescente de score.
+    """
+    centroids = indice["centroids"]
+    indptr = indice["indptr"]
+    q = np.asarray(user_factor, dtype=np.float32).ravel()
+
+    # Distância L2 de [q, 0] aos centróides, a menos da constante ||q||²
+    dist = np.einsum("ij,ij->i", centroids, centroids) - 2.0 * (centroids[:, :-1] @ q)
+    n_probe = min(n_probe, len(centroids))
+    listas = np.argpartition(dist, n_probe - 1)[:n_probe]
+
+    inicios, fins = indptr[listas], indptr[listas + 1]
+    tamanhos = fins - inicios
+    posicoes = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(tamanhos.sum())
+    ids = indice["items"][posicoes]
+    scores = linhas_fatores(indice["factors"], posicoes) @ q
+
+    if excluir is not None and len(excluir):
+        manter = ~np.isin(ids, excluir)
+        ids, scores = ids[manter], scores[manter]
+    if len(ids) > top_k:
+        topo = np.argpartition(-scores, top_k - 1)[:top_k]
+        ids, scores = ids[topo], scores[topo]
+    ordem = np.argsort(-scores, kind="stable")
+    return ids[ordem], scores[ordem]
@@ -0,0 +1,202 @@
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Sequence
+
+import numpy as np
+from script_shared import config
+
+FEATURE_COLUMNS_SEMIANON = config.FEATURE_COLUMNS_SEMIANON
+FEATURE_STORE_PARAMS = config.FEATURE_STORE_PARAMS
+
+_MASCARA_64 = 0xFFFFFFFFFFFFFFFF
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def hll_adicionar(registros: bytearray, valor: str, bits: int) -> None:
+    """Adiciona um valor a um HyperLogLog de 2**bits registros."""
+    h = hash(valor) & _MASCARA_64
+    resto = h & ((1 << (64 - bits)) - 1)
+    rank = 64 - bits - resto.bit_length() + 1
+    indice = h >> (64 - bits)
+    if rank > registros[indice]:
+        registros[indice] = rank
+
+
+def hll_estimar(registros: bytearray) -> float:
+    """
+    Estima o número de valores distintos de um HyperLogLog, com a correção por contagem
+    linear para cardinalidades pequenas (exata na prática para poucos valores).
+    """
+    m = len(registros)
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    estimativa = alpha * m * m / sum(2.0 ** -r for r in registros)
+    vazios = registros.count(0)
+    if estimativa <= 2.5 * m and vazios:
+        return m * math.log(m / vazios)
+    return estimativa
+
+
+class _EstadoUsuario:
+    __slots__ = (
+        "sum_time", "sum_clicks", "soma_scroll", "n_leituras", "base_paginas",
+        "registros", "visto", "cluster",
+    )
+
+    def __init__(self, bits: int):
+        self.sum_time = 0.0
+        self.sum_clicks = 0.0
+        self.soma_scroll = 0.0
+        self.n_leituras = 0
+        self.base_paginas = 0
+        self.registros = bytearray(1 << bits)
+        self.visto = 0.0
+        self.cluster: Optional[int] = None
+
+
+class FeatureStoreSemianon:
+    """
+    Features dos usuários semi-logados mantidas em memória e atualizadas a cada evento,
+    para que o cluster acompanhe o comportamento recente sem esperar o próximo treino.
+
+    Cada usuário guarda somas (tempo, cliques, scroll e leituras) e um HyperLogLog das
+    páginas lidas. Usuários presentes no treino partem dos agregados salvos em
+    df_features; como o histórico de páginas não é salvo, as páginas distintas do treino
+    são somadas às novas e a média de scroll usa unique_pages como número de leituras.
+
+    O cluster é recalculado apenas na leitura, se houve eventos desde o último cálculo,
+    com o scaler, o PCA e o k-means salvos, e as features limitadas aos máximos de
+    df_features (os limites de outliers aplicados no treino). Usuários inativos há mais
+    de ttl_s segundos são descartados, e o mais antigo sai quando há max_users em memória.
+
+    Args:
+        semianon_model: Modelo semi-logado (ver load_model_semianon).
+        ttl_s: Tempo sem eventos após o qual o usuário é descartado.
+        max_users: Número máximo de usuários em memória.
+        hll_bits: log2 do número de registros do HyperLogLog de cada usuário.
+    """
+
+    def __init__(
+        self,
+        semianon_model: Dict[str, Any],
+        ttl_s: float = 6 * 3600.0,
+        max_users: int = 200_000,
+        hll_bits: int = 6,
+    ):
+        self.ttl_s, self.max_users, self.hll_bits = ttl_s, max_users, hll_bits
+        self._kmeans = semianon_model["kmeans_model"]
+        self._scaler = semianon_model["scaler"]
+        self._pca = semianon_model["pca"]
+        df_features = semianon_model["df_features"]
+        self._limites = df_features[FEATURE_COLUMNS_SEMIANON].max().to_numpy(dtype=np.float64)
+        self._batch = df_features.drop_duplicates("userId").set_index("userId")[
+            ["sum_time", "sum_clicks", "mean_scroll", "unique_pages"]
+        ]
+        self._linha_batch = {u: i for i, u in enumerate(self._batch.index)}
+        self._usuarios: "OrderedDict[str, _EstadoUsuario]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._usuarios)
+
+    def _novo_estado(self, user_id: str) -> _EstadoUsuario:
+        estado = _EstadoUsuario(self.hll_bits)
+        linha = self._linha_batch.get(user_id)
+        if linha is not None:
+            sum_time, sum_clicks, mean_scroll, unique_pages = self._batch.iloc[linha].tolist()
+            estado.sum_time, estado.sum_clicks = float(sum_time), float(sum_clicks)
+            estado.base_paginas = int(unique_pages)
+            estado.n_leituras = int(unique_pages)
+            estado.soma_scroll = float(mean_scroll) * estado.n_leituras
+        return estado
+
+    def _expirar(self, agora: float) -> None:
+        while self._usuarios:
+            user_id, estado = next(iter(self._usuarios.items()))
+            if estado.visto >= agora - self.ttl_s and len(self._usuarios) <= self.max_users:
+                return
+            del self._usuarios[user_id]
+
+    def registrar_eventos(self, eventos: Sequence[Sequence[Any]]) -> None:
+        """
+        Atualiza os agregados com linhas de interação (ordem de COLUNAS_INTERACAO).
+        Apenas eventos de usuários não logados são considerados.
+        """
+        agora = time.time()
+        with self._lock:
+            for user_id, user_type, page, _, clicks, time_on_page, scroll, _ in eventos:
+                if user_type != "Non-Logged":
+                    continue
+                estado = self._usuarios.get(user_id)
+                if estado is None:
+                    estado = self._usuarios[user_id] = self._novo_estado(user_id)
+                else:
+                    self._usuarios.move_to_end(user_id)
+                estado.sum_time += time_on_page / 60000.0
+                estado.sum_clicks += clicks
+                estado.soma_scroll += scroll
+                estado.n_leituras += 1
+                hll_adicionar(estado.registros, page, self.hll_bits)
+                estado.visto = agora
+                estado.cluster = None
+            self._expirar(agora)
+
+    def _calcular_features(self, estado: _EstadoUsuario) -> np.ndarray:
+        unique_pages = estado.base_paginas + round(hll_estimar(estado.registros))
+        time_per_page = estado.sum_time / unique_pages if unique_pages else 0.0
+        clicks_per_page = estado.sum_clicks / unique_pages if unique_pages else 0.0
+        valores = {
+            "sum_time": estado.sum_time,
+            "sum_clicks": estado.sum_clicks,
+            "mean_scroll": estado.soma_scroll / estado.n_leituras,
+            "unique_pages": unique_pages,
+            "time_per_page": time_per_page,
+            "clicks_per_page": clicks_per_page,
+        }
+        for col in ["sum_time", "sum_clicks", "time_per_page", "clicks_per_page"]:
+            valores[f"log_{col}"] = np.log1p(valores[col])
+        x = np.array([valores[col] for col in FEATURE_COLUMNS_SEMIANON], dtype=np.float64)
+        return np.minimum(x, self._limites)
+
+    def roteavel(self, user_id: str) -> bool:
+        """
+        Indica se o usuário terá cluster (ver cluster), sem tomar o lock nem recalcular o
+        cluster: usado no roteamento, no loop de eventos da API. A consulta ao dicionário é
+        atômica; o cluster em si é calculado depois, no pool de recomendações.
+        """
+        estado = self._usuarios.get(user_id)
+        return estado is not None and estado.n_leituras >= 2
+
+    def cluster(self, user_id: str) -> Optional[int]:
+        """
+        Cluster atual do usuário, recalculado se houve eventos desde a última consulta.
+
+        Returns:
+            O cluster, ou None se o usuário não está em memória ou tem uma única leitura
+            (como no treino, que considera apenas usuários com mais de uma interação).
+        """
+        with self._lock:
+            estado = self._usuarios.get(user_id)
+            if estado is None or estado.n_leituras < 2:
+                return None
+            if estado.cluster is None:
+                x = self._calcular_features(estado)[None, :]
+                x = self._pca.transform(self._scaler.transform(x))
+                estado.cluster = int(self._kmeans.predict(x)[0])
+            return estado.cluster
+
+
+def criar_feature_store(
+    semianon_model: Dict[str, Any], params: Dict[str, Any] = FEATURE_STORE_PARAMS
+) -> FeatureStoreSemianon:
+    store = FeatureStoreSemianon(semianon_model, **params)
+    logger.info(
+        f"Feature store dos semi-logados criada (TTL de {store.ttl_s:.0f}s, até {store.max_users} usuários)."
+    )
+    return store
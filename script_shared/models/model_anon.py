@@ -2,10 +2,15 @@ import os
 import pickle
 import logging
 from typing import Dict, Any, List
+
+import numpy as np
 from script_shared import config
 
 MODEL_DIR_ANON_HEURISTICO = config.MODEL_DIR_ANON_HEURISTICO
 
+# Scores de recência alinhados ao ranking, relativos ao primeiro item (1.0)
+ANON_SCORES_FILE = "scores_anon_heuristico.npy"
+
 # Configuração do logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -23,14 +28,23 @@ def load_model_anon_heuristico(
       - model_dir: diretório onde o ranking está salvo.
 
     Retorna:
-      - Dicionário com o ranking e o método utilizado.
+      - Dicionário com o ranking, o catálogo (conjunto das páginas do ranking), os scores
+        de recência (None se o modelo foi salvo sem eles) e o método utilizado.
     """
     ranking_path = os.path.join(model_dir, "ranking_anon_heuristico.pkl")
     with open(ranking_path, "rb") as f:
         ranking_anon = pickle.load(f)
 
+    scores_path = os.path.join(model_dir, ANON_SCORES_FILE)
+    scores_anon = np.load(scores_path) if os.path.exists(scores_path) else None
+
     logger.info("Modelo anônimo heurístico carregado com sucesso.")
-    return {"ranking_anon": ranking_anon, "method": "heurístico"}
+    return {
+        "ranking_anon": ranking_anon,
+        "catalogo": frozenset(ranking_anon),
+        "scores_anon": scores_anon,
+        "method": "heurístico",
+    }
 
 
 def recomendar_anon_heuristico(
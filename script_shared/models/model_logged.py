@@ -9,10 +9,32 @@ import pandas as pd
 from scipy.sparse import load_npz, csr_matrix
 from implicit.als import AlternatingLeastSquares
 from script_shared import config
+from script_shared.models.ann_index import ANN_INDEX_FILE, carregar_indice_ivf, buscar_ivf
+from script_shared.models.quantization import (
+    QUANTIZACOES,
+    Fatores,
+    quantizar_fatores,
+    fatores_para_npz,
+    fatores_de_npz,
+    n_linhas,
+    linhas_fatores,
+    pontuar_itens,
+)
 
 
 MODEL_DIR_LOGGED = config.MODEL_DIR_LOGGED
 ALS_DEFAULT_PARAMS = config.ALS_DEFAULT_PARAMS
+ANN_LOGGED_ENABLED = config.ANN_LOGGED_ENABLED
+ANN_LOGGED_N_PROBE = config.ANN_LOGGED_N_PROBE
+ALS_QUANTIZATION = config.ALS_QUANTIZATION
+
+# Arquivos que compõem o modelo logado (registrados no manifesto do diretório do modelo)
+ARTEFATOS_LOGGED = [
+    "model_logged_als.npz",
+    "objetos_logged_auxiliares.pkl",
+    "tfidf_logged_matrix.npz",
+    ANN_INDEX_FILE,
+]
 
 # Configuração do logger
 logger = logging.getLogger(__name__)
@@ -21,9 +43,42 @@ logging.basicConfig(
 )
 
 
-def load_model_logged(model_dir: str = MODEL_DIR_LOGGED) -> Dict[str, Any]:
+def completar_artefatos_als(model_path: str) -> None:
+    """
+    Acrescenta ao model_logged_als.npz salvo pelo implicit o YtY pré-calculado e os
+    fatores de item quantizados em cada formato de QUANTIZACOES.
+    """
+    with np.load(model_path) as data:
+        artefatos = {key: data[key] for key in data.files}
+    item_factors = artefatos["item_factors"]
+    artefatos["YtY"] = item_factors.T.dot(item_factors)
+    for tipo in QUANTIZACOES:
+        artefatos.update(fatores_para_npz(quantizar_fatores(item_factors, tipo), tipo))
+    np.savez(model_path, **artefatos)
+
+
+def fatores_item(model_objs: Dict[str, Any]) -> Fatores:
+    """Fatores de item em uso: os quantizados, se carregados, ou os do modelo ALS."""
+    if model_objs.get("item_factors_q") is not None:
+        return model_objs["item_factors_q"]
+    return model_objs["model_als"].item_factors
+
+
+def load_model_logged(
+    model_dir: str = MODEL_DIR_LOGGED,
+    usar_ann: bool = ANN_LOGGED_ENABLED,
+    quantizacao: Optional[str] = ALS_QUANTIZATION,
+) -> Dict[str, Any]:
     """
     Carrega os artefatos salvos do modelo para usuários logados.
+
+    Se usar_ann, carrega também o índice ANN dos fatores de item ('ann_index'), usado por
+    recomendar_logged no lugar da busca exata.
+
+    Se quantizacao ("float16" ou "int8") for definida e os fatores quantizados existirem
+    no npz, eles são carregados em 'item_factors_q' no lugar dos fatores de item em ponto
+    flutuante (model_als.item_factors fica None). Com o índice ANN, a cópia dos fatores
+    guardada no índice também passa a ser a quantizada.
     """
     logger.info(f"Carregando artefatos do modelo logado a partir de: {model_dir}")
     with open(os.path.join(model_dir, "objetos_logged_auxiliares.pkl"), "rb") as f:
@@ -35,14 +90,68 @@ def load_model_logged(model_dir: str = MODEL_DIR_LOGGED) -> Dict[str, Any]:
         iterations=ALS_DEFAULT_PARAMS["iterations"],
         random_state=42,
     )
-    data = np.load(os.path.join(model_dir, "model_logged_als.npz"))
-    model_als.user_factors = data["user_factors"]
-    model_als.item_factors = data["item_factors"]
-    model_als._YtY = model_als.item_factors.T.dot(model_als.item_factors)
+    item_factors_q = None
+    with np.load(os.path.join(model_dir, "model_logged_als.npz")) as data:
+        model_als.user_factors = data["user_factors"]
+        if quantizacao:
+            item_factors_q = fatores_de_npz(data, quantizacao)
+            if item_factors_q is None:
+                logger.warning(f"Fatores {quantizacao} não encontrados; usando fatores em ponto flutuante.")
+        model_als.item_factors = data["item_factors"] if item_factors_q is None else None
+        # YtY pré-calculado no treino (modelos antigos: calculado na carga)
+        if "YtY" in data.files:
+            model_als._YtY = data["YtY"]
+        else:
+            model_als._YtY = data["item_factors"].T.dot(data["item_factors"])
+    fatores = model_als.item_factors if item_factors_q is None else item_factors_q
 
     tfidf_matrix = load_npz(os.path.join(model_dir, "tfidf_logged_matrix.npz"))
+
+    ann_index = None
+    if usar_ann:
+        ann_index = carregar_indice_ivf(os.path.join(model_dir, ANN_INDEX_FILE))
+        if ann_index is None:
+            logger.warning("Índice ANN não encontrado; usando busca exata.")
+        elif len(ann_index["items"]) != n_linhas(fatores):
+            logger.warning("Índice ANN não corresponde aos fatores de item; usando busca exata.")
+            ann_index = None
+        elif item_factors_q is not None:
+            # Mesmas linhas dos fatores quantizados, na ordem das listas do índice
+            ann_index["factors"] = {
+                "values": item_factors_q["values"][ann_index["items"]],
+                "scales": None if item_factors_q["scales"] is None
+                else item_factors_q["scales"][ann_index["items"]],
+            }
+
     logger.info("Modelo e artefatos carregados com sucesso.")
-    return {"model_als": model_als, "aux_dict": aux_dict, "tfidf_matrix": tfidf_matrix}
+    return {
+        "model_als": model_als,
+        "aux_dict": aux_dict,
+        "tfidf_matrix": tfidf_matrix,
+        "ann_index": ann_index,
+        "item_factors_q": item_factors_q,
+        "quantizacao": quantizacao if item_factors_q is not None else None,
+    }
+
+
+def consistencia_logged(
+    aux_dict: Dict[str, Any],
+    user_factors: np.ndarray,
+    item_factors: Fatores,
+    tfidf_matrix: csr_matrix,
+) -> Dict[str, int]:
+    """
+    Invariantes do modelo logado registrados no manifesto: os mapeamentos de usuários e
+    itens devem corresponder às linhas dos fatores e da matriz TF-IDF.
+    """
+    return {
+        "n_users": len(aux_dict["user_to_idx"]),
+        "n_user_factors": int(user_factors.shape[0]),
+        "n_items": len(aux_dict["item_to_idx"]),
+        "n_item_factors": n_linhas(item_factors),
+        "n_items_content": len(aux_dict["item_to_idx_content"]),
+        "n_tfidf_rows": int(tfidf_matrix.shape[0]),
+    }
 
 
 def get_user_vector(
@@ -68,14 +177,34 @@ def get_user_vector(
     return user_vector
 
 
+def calcular_fator_usuario(
+    user_vector: csr_matrix, item_factors: Fatores, YtY: np.ndarray, regularization: float
+) -> np.ndarray:
+    """
+    Recalcula o vetor do usuário a partir das confianças do histórico, com os fatores de
+    item fixos: (YtY + Y_u^T (C_u - I) Y_u + reg * I) x_u = Y_u^T C_u p_u. Apenas as linhas
+    dos itens do histórico são lidas (e desquantizadas, se for o caso).
+    """
+    Yu = linhas_fatores(item_factors, user_vector.indices).astype(np.float64)
+    conf = user_vector.data.astype(np.float64)
+    A = YtY + regularization * np.eye(YtY.shape[0]) + (Yu.T * (conf - 1.0)) @ Yu
+    b = Yu.T @ conf
+    return np.linalg.solve(A, b).astype(np.float32)
+
+
 def recomendar_logged(
     user_id: str,
     model_objs: Dict[str, Any],
     df_historico: pd.DataFrame,
     top_k: int = 10,
+    n_probe: int = ANN_LOGGED_N_PROBE,
 ) -> List[str]:
     """
     Gera recomendações para o usuário logado com base no modelo ALS.
+
+    Se o modelo tiver índice ANN carregado, os itens são buscados nas n_probe listas do
+    índice mais próximas do vetor do usuário em vez de pontuar todo o catálogo. Com
+    fatores quantizados, o catálogo é pontuado com a desquantização junto ao produto.
     """
     aux_dict = model_objs["aux_dict"]
     user_to_idx = aux_dict["user_to_idx"]
@@ -92,10 +221,31 @@ def recomendar_logged(
         )
         return []
 
-    recs_raw = model_objs["model_als"].recommend(
-        user_to_idx[user_id], user_vector, N=top_k, recalculate_user=True
-    )
+    model_als = model_objs["model_als"]
+    ann_index = model_objs.get("ann_index")
+    item_factors_q = model_objs.get("item_factors_q")
+    if ann_index is None and item_factors_q is None:
+        # implicit >= 0.7 retorna os arrays (ids, scores)
+        ids, _ = model_als.recommend(
+            user_to_idx[user_id], user_vector, N=top_k, recalculate_user=True
+        )
+    else:
+        user_factor = calcular_fator_usuario(
+            user_vector * getattr(model_als, "alpha", 1.0),
+            fatores_item(model_objs),
+            model_als.YtY,
+            model_als.regularization,
+        )
+        if ann_index is not None:
+            ids, _ = buscar_ivf(ann_index, user_factor, top_k, n_probe, excluir=user_vector.indices)
+        else:
+            scores = pontuar_itens(item_factors_q, user_factor)[0]
+            scores[user_vector.indices] = -np.inf
+            k = min(top_k, len(scores))
+            ids = np.argpartition(-scores, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+            ids = ids[np.argsort(-scores[ids], kind="stable")]
+            ids = ids[np.isfinite(scores[ids])]
     idx_to_item = {idx: item for item, idx in item_to_idx.items()}
-    rec_ids = [idx_to_item[r[0]] for r in recs_raw if r[0] in idx_to_item]
+    rec_ids = [idx_to_item[i] for i in ids if i in idx_to_item]
 
     return rec_ids
\ No newline at end of file
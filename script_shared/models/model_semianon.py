@@ -2,11 +2,21 @@ import os
 import pickle
 import logging
 from typing import Dict, Any, List
+import numpy as np
 import pandas as pd
 from script_shared import config
 
 MODEL_DIR_SEMIANON = config.MODEL_DIR_SEMIANON
 
+# Arquivos que compõem o modelo semi-logado (registrados no manifesto do diretório do modelo)
+ARTEFATOS_SEMIANON = [
+    "modelo_semianon_kmeans.pkl",
+    "scaler_semianon.pkl",
+    "pca_semianon.pkl",
+    "cluster_top_items.npz",
+    "df_features_semianon.csv",
+]
+
 # Configuração do logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -24,9 +34,11 @@ def load_model_semianon(model_dir: str = MODEL_DIR_SEMIANON) -> Dict[str, Any]:
         scaler = pickle.load(f)
     with open(os.path.join(model_dir, "pca_semianon.pkl"), "rb") as f:
         pca = pickle.load(f)
-    with open(os.path.join(model_dir, "cluster_top_items.pkl"), "rb") as f:
-        cluster_top_items = pickle.load(f)
+    cluster_top_items = load_cluster_top_items(model_dir)
     df_features = pd.read_csv(os.path.join(model_dir, "df_features_semianon.csv"))
+    # Cluster de cada usuário (primeiro registro), para consultas em O(1) na inferência
+    primeiros = df_features.drop_duplicates("userId")
+    user_clusters = dict(zip(primeiros["userId"], primeiros["cluster"].astype(int)))
 
     return {
         "kmeans_model": kmeans_model,
@@ -34,19 +46,58 @@ def load_model_semianon(model_dir: str = MODEL_DIR_SEMIANON) -> Dict[str, Any]:
         "pca": pca,
         "cluster_top_items": cluster_top_items,
         "df_features": df_features,
+        "user_clusters": user_clusters,
+    }
+
+
+def load_cluster_top_items(model_dir: str = MODEL_DIR_SEMIANON) -> Dict[int, List[Any]]:
+    """
+    Carrega os itens populares por cluster a partir do artefato em arrays (formato CSR).
+    Artefatos antigos em pickle ainda são aceitos.
+    """
+    npz_path = os.path.join(model_dir, "cluster_top_items.npz")
+    if not os.path.exists(npz_path):
+        with open(os.path.join(model_dir, "cluster_top_items.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    with np.load(npz_path) as data:
+        clusters, indptr, items = data["clusters"], data["indptr"], data["items"]
+    return {
+        int(c): items[indptr[i] : indptr[i + 1]].tolist() for i, c in enumerate(clusters)
     }
 
 
+def lista_cluster_treino(user_id: str, model_objs: Dict[str, Any], top_k: int = 10) -> List[Any]:
+    """
+    Top itens do cluster do usuário no treino (user_clusters), sem a feature store online
+    ([] se o usuário não estiver no modelo).
+    """
+    cluster = model_objs.get("user_clusters", {}).get(user_id)
+    if cluster is None:
+        return []
+    return model_objs["cluster_top_items"].get(cluster, [])[:top_k]
+
+
 def recomendar_semianon(
-    user_id: str, model_objs: Dict[str, Any], top_k: int = 10
+    user_id: str, model_objs: Dict[str, Any], top_k: int = 10, feature_store: Any = None
 ) -> List[Any]:
     """
     Para um usuário semi-logado, retorna os top itens para o cluster ao qual o usuário pertence.
-    Se o usuário não estiver presente no df_features, retorna um fallback.
+    Com a feature store online, o cluster é o recalculado a partir dos eventos recentes do
+    usuário, se houver; caso contrário, o do treino. Se o usuário não estiver presente no
+    df_features, retorna um fallback.
     """
     df_features = model_objs["df_features"]
     cluster_top_items = model_objs["cluster_top_items"]
 
+    cluster = feature_store.cluster(user_id) if feature_store is not None else None
+    if cluster is None and "user_clusters" in model_objs:
+        cluster = model_objs["user_clusters"].get(user_id)
+        if cluster is None:
+            return []
+    if cluster is not None:
+        return cluster_top_items.get(cluster, [])[:top_k]
+
     user_info = df_features[df_features["userId"] == user_id]
     if not user_info.empty:
         cluster = int(user_info["cluster"].values[0])
@@ -0,0 +1,82 @@
+import os
+import logging
+from typing import Dict, Any, List, Sequence
+
+import numpy as np
+from script_shared import config
+from script_shared.models.model_similar import carregar_tabela_vizinhos
+from script_shared.models.model_anon import recomendar_anon_heuristico
+
+MODEL_DIR_SESSION = config.MODEL_DIR_SESSION
+SESSION_RECENCY_DECAY = config.SESSION_RECENCY_DECAY
+
+# Tabela de co-visitação em CSR (mesmo formato da tabela de itens similares)
+COVISITATION_FILE = "covisitation.npz"
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def load_model_session(model_dir: str = MODEL_DIR_SESSION) -> Dict[str, Any]:
+    """
+    Carrega a tabela de co-visitação (top-N páginas co-visitadas de cada página).
+    """
+    tabela = carregar_tabela_vizinhos(os.path.join(model_dir, COVISITATION_FILE))
+    logger.info(f"Tabela de co-visitação carregada ({len(tabela['items'])} itens).")
+    return tabela
+
+
+def recomendar_sessao(
+    model_objs: Dict[str, Any],
+    session_pages: Sequence[str],
+    anon_model: Dict[str, Any],
+    top_k: int = 10,
+    decay: float = SESSION_RECENCY_DECAY,
+) -> List[str]:
+    """
+    Gera recomendações a partir das páginas vistas na sessão atual: os vizinhos de
+    co-visitação de cada página são somados, ponderados pela contagem de co-visitação e
+    pela recência da página na sessão (decay ** posição a partir da mais recente).
+
+    Páginas da própria sessão são descartadas e a lista é completada com o ranking
+    heurístico anônimo (usado integralmente se nenhuma página da sessão for conhecida).
+
+    Args:
+        model_objs: Tabela de co-visitação (ver load_model_session).
+        session_pages: Páginas da sessão, da mais antiga para a mais recente.
+        anon_model: Modelo anônimo heurístico (fallback).
+        top_k: Número de recomendações.
+        decay: Fator de decaimento por posição na sessão.
+
+    Returns:
+        Lista de recomendações.
+    """
+    item_to_row = model_objs["item_to_row"]
+    n = len(session_pages)
+    linhas = np.array([item_to_row.get(p, -1) for p in session_pages], dtype=np.int64)
+    pesos = decay ** np.arange(n - 1, -1, -1, dtype=np.float64)
+    conhecidas = linhas >= 0
+    linhas, pesos = linhas[conhecidas], pesos[conhecidas]
+
+    recs: List[str] = []
+    if len(linhas):
+        indptr = model_objs["indptr"]
+        inicios, tamanhos = indptr[linhas], indptr[linhas + 1] - indptr[linhas]
+        posicoes = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(tamanhos.sum())
+        vizinhos = model_objs["indices"][posicoes]
+        scores = model_objs["scores"][posicoes] * np.repeat(pesos, tamanhos)
+
+        candidatos, inverso = np.unique(vizinhos, return_inverse=True)
+        totais = np.bincount(inverso, weights=scores, minlength=len(candidatos))
+        totais[np.isin(candidatos, linhas)] = -np.inf
+        ordem = np.argsort(-totais, kind="stable")[:top_k]
+        ordem = ordem[np.isfinite(totais[ordem])]
+        recs = model_objs["items"][candidatos[ordem]].tolist()
+
+    if len(recs) < top_k:
+        vistos = set(recs) | set(session_pages)
+        ranking = recomendar_anon_heuristico(anon_model, top_k=top_k + len(vistos))
+        recs += [item for item in ranking if item not in vistos][: top_k - len(recs)]
+    return recs
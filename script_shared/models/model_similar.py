@@ -0,0 +1,64 @@
+import os
+import logging
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from script_shared import config
+
+MODEL_DIR_SIMILAR = config.MODEL_DIR_SIMILAR
+
+# Tabela de vizinhos em CSR: linha i = itens similares ao item items[i], em ordem de score
+SIMILAR_TABLE_FILE = "similar_items.npz"
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def salvar_tabela_similares(
+    path: str, items: np.ndarray, indptr: np.ndarray, indices: np.ndarray, scores: np.ndarray
+) -> None:
+    np.savez(
+        path,
+        items=np.asarray(items, dtype=str),
+        indptr=indptr.astype(np.int64),
+        indices=indices.astype(np.int32),
+        scores=scores.astype(np.float32),
+    )
+    logger.info(f"Tabela de vizinhos salva em: {path}")
+
+
+def carregar_tabela_vizinhos(path: str) -> Dict[str, Any]:
+    """
+    Carrega uma tabela de vizinhos em CSR e monta o mapa página -> linha, de forma que a
+    consulta de um item é uma busca em dicionário seguida de um recorte da tabela.
+    """
+    with np.load(path) as data:
+        tabela = {key: data[key] for key in data.files}
+    tabela["item_to_row"] = {item: i for i, item in enumerate(tabela["items"].tolist())}
+    return tabela
+
+
+def load_model_similar(model_dir: str = MODEL_DIR_SIMILAR) -> Dict[str, Any]:
+    tabela = carregar_tabela_vizinhos(os.path.join(model_dir, SIMILAR_TABLE_FILE))
+    logger.info(f"Tabela de itens similares carregada ({len(tabela['items'])} itens).")
+    return tabela
+
+
+def itens_similares(
+    model_objs: Dict[str, Any], page: str, top_k: int = 10
+) -> Optional[List[str]]:
+    """
+    Retorna os top_k itens mais similares à página informada.
+
+    Returns:
+        Lista de páginas em ordem decrescente de similaridade, ou None se a página não
+        estiver na tabela.
+    """
+    row = model_objs["item_to_row"].get(page)
+    if row is None:
+        return None
+    inicio = model_objs["indptr"][row]
+    fim = min(model_objs["indptr"][row + 1], inicio + top_k)
+    return model_objs["items"][model_objs["indices"][inicio:fim]].tolist()
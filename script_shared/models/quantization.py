@@ -0,0 +1,98 @@
+import logging
+from typing import Dict, Any, Optional, Union
+
+import numpy as np
+
+# Formatos de quantização dos fatores de item
+QUANTIZACOES = ("float16", "int8")
+
+# Fatores de item: array em ponto flutuante ou dicionário quantizado ('values' e 'scales')
+Fatores = Union[np.ndarray, Dict[str, Any]]
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def quantizar_fatores(factors: np.ndarray, tipo: str) -> Dict[str, Any]:
+    """
+    Quantiza os fatores de item.
+
+    Args:
+        factors: Fatores de item (n_itens x k).
+        tipo: "float16" (meia precisão) ou "int8" (escala simétrica por linha,
+              y_i ~= scales[i] * values[i]).
+
+    Returns:
+        Dicionário com 'values' e 'scales' (None para float16).
+    """
+    if tipo not in QUANTIZACOES:
+        raise ValueError(f"Quantização '{tipo}' desconhecida; use uma de {QUANTIZACOES}")
+    factors = np.asarray(factors, dtype=np.float32)
+    if tipo == "float16":
+        return {"values": factors.astype(np.float16), "scales": None}
+
+    scales = np.abs(factors).max(axis=1, initial=0.0) / 127.0
+    scales[scales == 0] = 1.0
+    values = np.rint(factors / scales[:, None]).astype(np.int8)
+    return {"values": values, "scales": scales.astype(np.float32)}
+
+
+def fatores_para_npz(quantizados: Dict[str, Any], tipo: str) -> Dict[str, np.ndarray]:
+    """Arrays dos fatores quantizados com os nomes usados em model_logged_als.npz."""
+    arrays = {f"item_factors_{tipo}": quantizados["values"]}
+    if quantizados["scales"] is not None:
+        arrays[f"item_scales_{tipo}"] = quantizados["scales"]
+    return arrays
+
+
+def fatores_de_npz(data: Any, tipo: str) -> Optional[Dict[str, Any]]:
+    """Lê os fatores quantizados de um npz carregado (None se ausentes)."""
+    if f"item_factors_{tipo}" not in data:
+        return None
+    return {
+        "values": data[f"item_factors_{tipo}"],
+        "scales": data[f"item_scales_{tipo}"] if f"item_scales_{tipo}" in data else None,
+    }
+
+
+def n_linhas(fatores: Fatores) -> int:
+    return len(fatores["values"]) if isinstance(fatores, dict) else len(fatores)
+
+
+def linhas_fatores(fatores: Fatores, indices: np.ndarray) -> np.ndarray:
+    """Fatores das linhas informadas, desquantizados em float32 quando necessário."""
+    if not isinstance(fatores, dict):
+        return fatores[indices]
+    linhas = fatores["values"][indices].astype(np.float32)
+    if fatores["scales"] is not None:
+        linhas *= fatores["scales"][indices, None]
+    return linhas
+
+
+def pontuar_itens(fatores: Fatores, user_factors: np.ndarray, bloco: int = 4096) -> np.ndarray:
+    """
+    Scores (produto interno) de todos os itens para um ou mais usuários.
+
+    Para fatores quantizados, a desquantização é feita junto ao produto, por blocos de
+    itens: cada bloco é convertido para float32 (em cache), multiplicado pelos fatores
+    de usuário e os scores resultantes são multiplicados pela escala de cada item, sem
+    materializar a matriz de fatores em ponto flutuante.
+
+    Returns:
+        Matriz (n_usuários x n_itens) de scores.
+    """
+    if not isinstance(fatores, dict):
+        return np.atleast_2d(user_factors) @ fatores.T
+
+    U = np.atleast_2d(np.asarray(user_factors, dtype=np.float32))
+    values, scales = fatores["values"], fatores["scales"]
+    n_itens = len(values)
+    scores = np.empty((len(U), n_itens), dtype=np.float32)
+    for s in range(0, n_itens, bloco):
+        e = min(s + bloco, n_itens)
+        np.matmul(U, values[s:e].astype(np.float32).T, out=scores[:, s:e])
+        if scales is not None:
+            scores[:, s:e] *= scales[s:e]
+    return scores
@@ -0,0 +1,139 @@
+import logging
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from script_shared.models.model_logged import recomendar_logged
+from script_shared.models.model_semianon import recomendar_semianon
+from script_shared.models.model_anon import recomendar_anon_heuristico
+from script_shared.models.model_session import recomendar_sessao
+from script_shared.models.trending import MotorTendencias, recomendar_anon_tendencias
+from script_shared.models.feature_store import FeatureStoreSemianon
+
+# Segmentos de usuário, na ordem de prioridade do roteamento
+SEGMENTOS = ("logged", "semianon", "anon")
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def rotear_usuario(
+    user_id: str,
+    logged_model: Dict[str, Any],
+    semianon_model: Dict[str, Any],
+    feature_store: Optional[FeatureStoreSemianon] = None,
+) -> str:
+    """
+    Define o segmento (modelo) que atende o usuário: logged se o usuário estiver no
+    modelo logged, semianon se estiver no modelo semianon ou tiver leituras suficientes na
+    feature store online (ver FeatureStoreSemianon.roteavel) e anon caso contrário.
+    Apenas consultas a dicionários: roda no loop de eventos da API.
+    """
+    if user_id in logged_model["aux_dict"].get("user_to_idx", {}):
+        return "logged"
+    if "user_clusters" in semianon_model:
+        if user_id in semianon_model["user_clusters"]:
+            return "semianon"
+    elif user_id in semianon_model["df_features"]["userId"].unique():
+        return "semianon"
+    if feature_store is not None and feature_store.roteavel(user_id):
+        return "semianon"
+    return "anon"
+
+
+def rotear_usuarios(
+    users: np.ndarray,
+    logged_model: Dict[str, Any],
+    semianon_model: Dict[str, Any],
+    feature_store: Optional[FeatureStoreSemianon] = None,
+) -> np.ndarray:
+    """
+    Versão vetorizada de rotear_usuario para um lote de usuários.
+
+    Returns:
+        Array com o segmento de cada usuário.
+    """
+    users = pd.Index(users)
+    segmentos = np.full(len(users), "anon", dtype=object)
+    semianon = users.isin(semianon_model["df_features"]["userId"].unique())
+    logged = users.isin(list(logged_model["aux_dict"].get("user_to_idx", {}).keys()))
+    segmentos[semianon] = "semianon"
+    if feature_store is not None:
+        for i in np.flatnonzero(~semianon & ~logged):
+            if feature_store.roteavel(users[i]):
+                segmentos[i] = "semianon"
+    segmentos[logged] = "logged"
+    return segmentos
+
+
+def recomendar_segmento(
+    segmento: str,
+    user_id: str,
+    num_recs: int,
+    logged_model: Dict[str, Any],
+    semianon_model: Dict[str, Any],
+    anon_model: Dict[str, Any],
+    df_users_logged: pd.DataFrame,
+    session_model: Optional[Dict[str, Any]] = None,
+    session_pages: Optional[Sequence[str]] = None,
+    trending: Optional[MotorTendencias] = None,
+    feature_store: Optional[FeatureStoreSemianon] = None,
+) -> List[str]:
+    """
+    Gera as recomendações do usuário com o modelo do segmento informado.
+    Usuários anônimos com páginas da sessão atual recebem recomendações por co-visitação
+    (ver recomendar_sessao), se o modelo de sessão estiver carregado; sem sessão, recebem
+    o ranking heurístico combinado às tendências (ver recomendar_anon_tendencias), se o
+    motor de tendências estiver ativo. Semi-logados usam o cluster da feature store online,
+    quando disponível.
+
+    Se o modelo do segmento não gerar recomendações (ex.: usuário logado incluído no modelo
+    sem histórico carregado), o usuário segue para o próximo segmento (ver SEGMENTOS).
+
+    Returns:
+        Lista de recomendações.
+    """
+    if segmento == "logged":
+        recs = recomendar_logged(user_id, logged_model, df_users_logged, top_k=num_recs)
+        if recs:
+            return recs
+        segmento = "semianon"
+    if segmento == "semianon":
+        recs = recomendar_semianon(user_id, semianon_model, top_k=num_recs, feature_store=feature_store)
+        if recs:
+            return recs
+    if session_model is not None and session_pages:
+        return recomendar_sessao(session_model, session_pages, anon_model, top_k=num_recs)
+    if trending is not None:
+        return recomendar_anon_tendencias(anon_model, trending, top_k=num_recs)
+    return recomendar_anon_heuristico(anon_model, top_k=num_recs)
+
+
+def recomendar_roteado(
+    user_id: str,
+    num_recs: int,
+    logged_model: Dict[str, Any],
+    semianon_model: Dict[str, Any],
+    anon_model: Dict[str, Any],
+    df_users_logged: pd.DataFrame,
+    session_model: Optional[Dict[str, Any]] = None,
+    session_pages: Optional[Sequence[str]] = None,
+    trending: Optional[MotorTendencias] = None,
+    feature_store: Optional[FeatureStoreSemianon] = None,
+) -> Tuple[str, List[str]]:
+    """
+    Gera as recomendações do usuário com o modelo do seu segmento (ver rotear_usuario e
+    recomendar_segmento).
+
+    Returns:
+        Tupla (segmento, lista de recomendações).
+    """
+    segmento = rotear_usuario(user_id, logged_model, semianon_model, feature_store)
+    recs = recomendar_segmento(
+        segmento, user_id, num_recs, logged_model, semianon_model, anon_model, df_users_logged,
+        session_model, session_pages, trending, feature_store,
+    )
+    return segmento, recs
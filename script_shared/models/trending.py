@@ -0,0 +1,206 @@
+import math
+import time
+import heapq
+import logging
+import threading
+from typing import Dict, Any, AbstractSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+from script_shared import config
+
+TRENDING_PARAMS = config.TRENDING_PARAMS
+TRENDING_WEIGHT = config.TRENDING_WEIGHT
+TRENDING_RECENCY_CANDIDATES = config.TRENDING_RECENCY_CANDIDATES
+
+# Expoente máximo dos pesos antes de renormalizar o sketch (evita overflow do float64)
+_MAX_EXPOENTE = 50.0
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class MotorTendencias:
+    """
+    Contagens de leituras por página com decaimento exponencial, em memória constante:
+    um count-min sketch (depth x width) estima a contagem de qualquer página e um heap
+    mantém as top_k páginas mais lidas.
+
+    O decaimento usa pesos crescentes no tempo (forward decay): um evento no instante t
+    soma exp((t - t0) / tau) e a contagem decaída até o instante atual é o valor somado
+    vezes exp(-(agora - t0) / tau). Assim cada evento custa depth incrementos, sem
+    varrer o sketch, e a ordem entre páginas não muda com o passar do tempo. O sketch é
+    renormalizado (t0 avançado) quando os pesos ficariam grandes demais.
+
+    Args:
+        width: Colunas do sketch (potência de 2).
+        depth: Linhas (funções de hash) do sketch.
+        top_k: Número de páginas mantidas no heap.
+        half_life_s: Meia-vida das contagens, em segundos.
+        random_state: Semente das funções de hash.
+        catalogo: Páginas conhecidas. Se informado, eventos de outras páginas (ex.: valores
+                  arbitrários enviados a POST /events) são ignorados em registrar_eventos.
+    """
+
+    def __init__(
+        self,
+        width: int = 2**15,
+        depth: int = 4,
+        top_k: int = 500,
+        half_life_s: float = 3600.0,
+        random_state: int = 42,
+        catalogo: Optional[AbstractSet[str]] = None,
+    ):
+        if width & (width - 1):
+            raise ValueError(f"width deve ser potência de 2, recebido: {width}")
+        self.width, self.depth, self.top_k = width, depth, top_k
+        self.catalogo = catalogo
+        self.tau = half_life_s / math.log(2)
+        rng = np.random.default_rng(random_state)
+        # Hash multiplicativo (multiply-shift) com multiplicadores ímpares de 64 bits
+        self._mult = rng.integers(1, 2**63, size=(depth, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._shift = np.uint64(64 - (width.bit_length() - 1))
+        self._linhas = np.arange(depth)[:, None]
+        self._sketch = np.zeros((depth, width), dtype=np.float64)
+        self._t0 = time.time()
+        self._top: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def _colunas(self, pages: Sequence[str]) -> np.ndarray:
+        h = np.fromiter((hash(p) & 0xFFFFFFFFFFFFFFFF for p in pages), dtype=np.uint64, count=len(pages))
+        with np.errstate(over="ignore"):
+            return ((self._mult * h[None, :]) >> self._shift).astype(np.int64)
+
+    def _renormalizar(self, t: float) -> None:
+        fator = math.exp(-(t - self._t0) / self.tau)
+        self._sketch *= fator
+        self._top = {p: v * fator for p, v in self._top.items()}
+        self._heap = [(v, p) for p, v in self._top.items()]
+        heapq.heapify(self._heap)
+        self._t0 = t
+
+    def _minimo_top(self) -> float:
+        # Entradas do heap desatualizadas (página removida ou contagem já aumentada) são descartadas
+        while self._heap and self._top.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0]
+
+    def _atualizar_top(self, page: str, valor: float) -> None:
+        if page not in self._top and len(self._top) >= self.top_k:
+            if valor <= self._minimo_top():
+                return
+            _, removida = heapq.heappop(self._heap)
+            del self._top[removida]
+        self._top[page] = valor
+        heapq.heappush(self._heap, (valor, page))
+        if len(self._heap) > 4 * self.top_k:
+            self._heap = [(v, p) for p, v in self._top.items()]
+            heapq.heapify(self._heap)
+
+    def registrar(self, pages: Sequence[str], timestamps_s: Sequence[float]) -> None:
+        """
+        Registra leituras das páginas nos instantes informados (segundos). Instantes no
+        futuro são tratados como o instante atual.
+        """
+        if not len(pages):
+            return
+        agora = time.time()
+        t = np.minimum(np.asarray(timestamps_s, dtype=np.float64), agora)
+        colunas = self._colunas(pages)
+        with self._lock:
+            if (t.max() - self._t0) / self.tau > _MAX_EXPOENTE:
+                self._renormalizar(float(t.max()))
+            pesos = np.exp((t - self._t0) / self.tau)
+            np.add.at(self._sketch, (np.broadcast_to(self._linhas, colunas.shape), colunas), pesos[None, :])
+            estimativas = self._sketch[self._linhas, colunas].min(axis=0)
+            for page, valor in dict(zip(pages, estimativas.tolist())).items():
+                self._atualizar_top(page, valor)
+
+    def registrar_eventos(self, eventos: Sequence[Sequence[Any]]) -> None:
+        """
+        Registra linhas de interação (ordem de COLUNAS_INTERACAO, timestamp em ms) de
+        páginas do catálogo.
+        """
+        if self.catalogo is not None:
+            eventos = [e for e in eventos if e[2] in self.catalogo]
+        self.registrar(
+            [e[2] for e in eventos], [int(e[3]) / 1000.0 for e in eventos]
+        )
+
+    def tendencias(self, n: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        As n páginas mais lidas (todas as top_k se n for None) com as contagens decaídas
+        até o instante atual, em ordem decrescente.
+        """
+        with self._lock:
+            escala = math.exp(-(time.time() - self._t0) / self.tau)
+            top = heapq.nlargest(n or self.top_k, self._top.items(), key=lambda kv: kv[1])
+        return [(page, valor * escala) for page, valor in top]
+
+
+def criar_motor_tendencias(
+    params: Dict[str, Any] = TRENDING_PARAMS, catalogo: Optional[AbstractSet[str]] = None
+) -> MotorTendencias:
+    motor = MotorTendencias(**params, catalogo=catalogo)
+    memoria = motor._sketch.nbytes / 2**20
+    logger.info(f"Motor de tendências criado (sketch de {memoria:.1f} MB, top {motor.top_k}).")
+    return motor
+
+
+def recomendar_anon_tendencias(
+    anon_model: Dict[str, Any],
+    motor: MotorTendencias,
+    top_k: int = 10,
+    peso: float = TRENDING_WEIGHT,
+    n_candidatos: int = TRENDING_RECENCY_CANDIDATES,
+) -> List[str]:
+    """
+    Ranking anônimo combinando tendências e recência: score = peso * tendência + (1 - peso)
+    * recência, com as duas parcelas normalizadas pelo máximo entre os candidatos (as
+    páginas em alta e as n_candidatos primeiras do ranking heurístico).
+
+    A recência vem dos scores salvos no treino ou, em modelos salvos sem eles, da posição
+    no ranking. Páginas em alta fora do catálogo do modelo anônimo não são candidatas.
+    Sem eventos registrados, o resultado é o ranking heurístico.
+
+    Args:
+        anon_model: Modelo anônimo heurístico (ver load_model_anon_heuristico).
+        motor: Motor de tendências alimentado pelos eventos.
+        top_k: Número de recomendações.
+        peso: Peso das tendências no score combinado.
+        n_candidatos: Número de itens do ranking heurístico considerados.
+
+    Returns:
+        Lista de recomendações.
+    """
+    ranking = list(anon_model.get("ranking_anon", [])[:n_candidatos])
+    scores_anon = anon_model.get("scores_anon")
+    if scores_anon is not None:
+        recencia = np.asarray(scores_anon[: len(ranking)], dtype=np.float64)
+    else:
+        recencia = 1.0 - np.arange(len(ranking)) / max(len(ranking), 1)
+
+    tendencias = motor.tendencias()
+    if not tendencias:
+        return ranking[:top_k]
+
+    catalogo = anon_model.get("catalogo")
+    if catalogo is not None:
+        tendencias = [(page, valor) for page, valor in tendencias if page in catalogo]
+    candidatos = {page: i for i, page in enumerate(ranking)}
+    for page, _ in tendencias:
+        candidatos.setdefault(page, len(candidatos))
+    score_recencia = np.zeros(len(candidatos))
+    score_recencia[: len(recencia)] = recencia
+    score_tendencia = np.zeros(len(candidatos))
+    for page, valor in tendencias:
+        score_tendencia[candidatos[page]] = valor
+
+    for s in (score_recencia, score_tendencia):
+        if s.max(initial=0) > 0:
+            s /= s.max()
+    score = peso * score_tendencia + (1.0 - peso) * score_recencia
+    paginas = list(candidatos)
+    return [paginas[i] for i in np.argsort(-score, kind="stable")[:top_k]]